@@ -0,0 +1,104 @@
+"""Move old, finished documents out of the live collections.
+
+Completed walks (with their routes and photos), old messages and closed
+bookings are copied into <collection>_archive as compressed records (see
+repositories/archive.py) and removed from the live collection, which keeps
+the working set and indexes of the hot collections small. Read endpoints
+fall back to the archives, so users still see their history.
+
+Documents move in _id-ordered batches: archive first (an idempotent upsert),
+then delete. A run interrupted at any point leaves every document in at
+least one of the two collections, and its checkpoint in archive_checkpoints
+lets the next run resume where it stopped (tools/archive.py --resume).
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Sequence
+
+from pymongo import ReplaceOne
+
+from repositories.archive import BookingsArchiveRepository, MessagesArchiveRepository, WalksArchiveRepository, pack
+
+logger = logging.getLogger(__name__)
+
+WALK_ARCHIVE_DAYS = int(os.environ.get('WALK_ARCHIVE_DAYS', '90'))
+MESSAGE_ARCHIVE_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_DAYS', '365'))
+BOOKING_ARCHIVE_DAYS = int(os.environ.get('BOOKING_ARCHIVE_DAYS', '365'))
+
+
+class ArchivePolicy(NamedTuple):
+    collection: str
+    archive: str
+    keys: Sequence[str]
+    days: int
+    # cutoff -> filter for documents that may be archived
+    selector: Callable[[datetime], Dict[str, Any]]
+
+
+POLICIES = {
+    "walks": ArchivePolicy(
+        "walks", WalksArchiveRepository.collection_name, WalksArchiveRepository.keys, WALK_ARCHIVE_DAYS,
+        lambda cutoff: {"status": "completed", "end_time": {"$lt": cutoff}},
+    ),
+    "messages": ArchivePolicy(
+        "messages", MessagesArchiveRepository.collection_name, MessagesArchiveRepository.keys, MESSAGE_ARCHIVE_DAYS,
+        lambda cutoff: {"created_at": {"$lt": cutoff}},
+    ),
+    "bookings": ArchivePolicy(
+        "bookings", BookingsArchiveRepository.collection_name, BookingsArchiveRepository.keys, BOOKING_ARCHIVE_DAYS,
+        lambda cutoff: {"status": {"$in": ["completed", "cancelled"]}, "start_at": {"$lt": cutoff}},
+    ),
+}
+
+
+async def _checkpoint(db, name: str) -> Optional[Dict[str, Any]]:
+    return await db.archive_checkpoints.find_one({"_id": name})
+
+
+async def archive_collection(db, policy: ArchivePolicy, batch_size: int = 500, max_batches: Optional[int] = None,
+                             resume: bool = False, dry_run: bool = False, now: Optional[datetime] = None) -> int:
+    """Archive one collection; returns the number of documents moved (or eligible, with dry_run)"""
+    now = now or datetime.now(timezone.utc)
+    checkpoint = await _checkpoint(db, policy.collection) if resume else None
+    if checkpoint:
+        cutoff, last_id = checkpoint["cutoff"], checkpoint["last_id"]
+    else:
+        cutoff, last_id = now - timedelta(days=policy.days), None
+    selector = policy.selector(cutoff)
+    if dry_run:
+        return await db[policy.collection].count_documents(selector)
+
+    source, target = db[policy.collection], db[policy.archive]
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        query = dict(selector)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await source.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+        if not docs:
+            break
+        ids = [doc["_id"] for doc in docs]
+        await target.bulk_write([ReplaceOne({"_id": doc["_id"]}, pack(doc, policy.keys), upsert=True) for doc in docs],
+                                ordered=False)
+        # Re-check the selector so a document that changed since it was read stays live
+        result = await source.delete_many({"_id": {"$in": ids}, **selector})
+        moved += result.deleted_count
+        last_id = ids[-1]
+        batches += 1
+        await db.archive_checkpoints.update_one(
+            {"_id": policy.collection},
+            {"$set": {"cutoff": cutoff, "last_id": last_id, "updated_at": datetime.now(timezone.utc)},
+             "$inc": {"moved": result.deleted_count}},
+            upsert=True,
+        )
+        if result.deleted_count != len(ids):
+            # The archived copies of documents that stayed live are stale; drop them
+            live = await source.find({"_id": {"$in": ids}}, {"_id": 1}).to_list(None)
+            await target.delete_many({"_id": {"$in": [doc["_id"] for doc in live]}})
+    logger.info("Archived %d %s documents older than %s", moved, policy.collection, cutoff)
+    return moved
+
+
+async def run_archive(db, names: Iterable[str] = POLICIES, **options) -> Dict[str, int]:
+    return {name: await archive_collection(db, POLICIES[name], **options) for name in names}
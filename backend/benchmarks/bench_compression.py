@@ -0,0 +1,68 @@
+"""Bandwidth and CPU of response compression.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_compression [--repeat 100] [--output result.json]
+
+For the large payloads of benchmarks/bench_serialization.py, reports the
+identity size and, per encoding:
+
+- dynamic: CompressionMiddleware's level, as paid on every response;
+- precompressed miss: PrecompressedCache's high level, paid once per
+  payload and worker;
+- precompressed hit: render + ETag + cache lookup, paid on every later
+  response, against render + dynamic compression without the cache.
+
+Times are the best of --repeat runs, in microseconds of CPU on the event
+loop (or the worker pool, for misses).
+"""
+import argparse
+import timeit
+
+from benchmarks.common import emit, import_server
+from benchmarks.bench_serialization import PAYLOADS
+
+server = import_server()
+
+import compression  # noqa: E402
+from serialization import dumps  # noqa: E402
+
+
+def best_us(fn, repeat):
+    return round(min(timeit.repeat(fn, number=1, repeat=repeat)) * 1e6, 1)
+
+
+def run(repeat):
+    results = {}
+    cache = compression.PrecompressedCache()
+    for name, (_, factory) in PAYLOADS.items():
+        docs = factory()
+        body = dumps(docs)
+        result = {"identity_bytes": len(body), "render_us": best_us(lambda: dumps(docs), repeat)}
+        for encoding in compression.ENCODINGS:
+            dynamic = compression.compress(body, encoding)
+            precompressed = compression.compress(body, encoding, precompress=True)
+            etag = cache.etag(body)
+            cache.put(etag, encoding, precompressed)
+            result[encoding] = {
+                "dynamic_bytes": len(dynamic),
+                "dynamic_ratio": round(len(body) / len(dynamic), 1),
+                "dynamic_us": best_us(lambda: compression.compress(body, encoding), repeat),
+                "precompressed_bytes": len(precompressed),
+                "precompressed_ratio": round(len(body) / len(precompressed), 1),
+                "precompressed_miss_us": best_us(
+                    lambda: compression.compress(body, encoding, precompress=True), max(1, repeat // 10)),
+                "precompressed_hit_us": best_us(lambda: cache.get(cache.etag(dumps(docs)), encoding), repeat),
+                "uncached_us": best_us(lambda: compression.compress(dumps(docs), encoding), repeat),
+            }
+        results[name] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark response compression")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit({"benchmark": "compression", "repeat": args.repeat, "brotli": compression.brotli is not None,
+          "results": run(args.repeat)}, args.output)
@@ -0,0 +1,165 @@
+"""Throughput and memory of the streaming exports.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_export [--rows 1000000] [--mongo-url mongodb://localhost:27017] [--output result.json]
+
+The encoding pipeline (CSV / NDJSON, plain and gzipped) is fed synthetic
+booking documents from an async generator, so it measures exports.py alone.
+With --mongo-url the bookings are also inserted into a scratch database and
+exported end to end through GET /api/admin/export/bookings, consuming the
+streamed body chunk by chunk as a client would. Each case reports rows/s, output size and
+how much the process's peak RSS grew, which should stay flat as --rows grows.
+"""
+import argparse
+import asyncio
+import resource
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import emit, import_server
+
+server = import_server()
+
+import exports  # noqa: E402
+from repositories import Repositories  # noqa: E402
+
+CASES = [("csv", False), ("csv", True), ("ndjson", False), ("ndjson", True)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def booking(i: int, epoch: datetime):
+    start = epoch + timedelta(minutes=30 * i)
+    return {
+        "id": str(uuid.UUID(int=i)), "owner_id": f"owner-{i % 50000}", "walker_id": f"walker-{i % 300}",
+        "walker_user_id": f"user-{i % 300}", "dog_id": f"dog-{i % 70000}", "service_type": "estandar",
+        "date": start.strftime("%Y-%m-%d"), "time": start.strftime("%H:%M"), "duration": 45, "amount": 22.0,
+        "location": "Rúa da Raíña, Lugo", "notes": None, "status": "completed", "start_at": start,
+        "created_at": start - timedelta(days=2),
+    }
+
+
+async def synthetic(rows: int):
+    # Documents are built once and cycled, so generating them is not what gets measured
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    pool = [booking(i, epoch) for i in range(min(rows, 1000))]
+    for i in range(rows):
+        yield pool[i % len(pool)]
+
+
+async def drain(chunks):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+async def bench_pipeline(rows: int):
+    results = {}
+    columns = exports.EXPORTS["bookings"].columns
+    for fmt, gzip in CASES:
+        rss_before = peak_rss_mb()
+        chunks = exports.csv_chunks(synthetic(rows), columns) if fmt == "csv" else exports.ndjson_chunks(synthetic(rows))
+        if gzip:
+            chunks = exports.gzip_chunks(chunks)
+        start = time.perf_counter()
+        size = await drain(chunks)
+        elapsed = time.perf_counter() - start
+        results[f"{fmt}{'+gzip' if gzip else ''}"] = {
+            "rows_per_s": round(rows / elapsed),
+            "seconds": round(elapsed, 2),
+            "output_mb": round(size / 2 ** 20, 1),
+            "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        }
+    return results
+
+
+async def stream_export(query_string: str) -> int:
+    """GET the bookings export straight through the ASGI app; returns the body size.
+
+    httpx's ASGITransport buffers whole responses, which would hide whether
+    the endpoint streams, so the ASGI messages are consumed here one by one.
+    """
+    size = 0
+    requested = False
+    path = "/api/admin/export/bookings"
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "root_path": "",
+        "path": path, "raw_path": path.encode(), "query_string": query_string.encode(),
+        "headers": [(b"authorization", b"Bearer bench-admin")],
+        "server": ("bench", 80), "client": ("127.0.0.1", 50000),
+    }
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            # The client stays connected until the response is complete
+            await asyncio.Event().wait()
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.start" and message["status"] != 200:
+            raise RuntimeError(f"export failed with {message['status']}")
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await server.app(scope, receive, send)
+    return size
+
+
+async def bench_endpoint(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    mongo = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+    await mongo.drop_database(args.db_name)
+    db = mongo[args.db_name]
+    server.db, server.repos = db, Repositories(db)
+    await server.ensure_indexes(db)
+
+    admin = server.User(email="admin@bench.example.com", name="Admin", role="admin")
+    await db.users.insert_one(server.to_document(admin))
+    await db.user_sessions.insert_one(server.to_document(server.UserSession(
+        session_token="bench-admin", user_id=admin.id,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=1))))
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, args.rows, 10000):
+        await db.bookings.insert_many([booking(i, epoch) for i in range(offset, min(offset + 10000, args.rows))],
+                                      ordered=False)
+
+    results = {}
+    for fmt, gzip in CASES:
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        size = await stream_export(f"format={fmt}&gzip={str(gzip).lower()}")
+        elapsed = time.perf_counter() - start
+        results[f"{fmt}{'+gzip' if gzip else ''}"] = {
+            "rows_per_s": round(args.rows / elapsed),
+            "seconds": round(elapsed, 2),
+            "output_mb": round(size / 2 ** 20, 1),
+            "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+        }
+    await mongo.drop_database(args.db_name)
+    return results
+
+
+async def main(args):
+    report = {"benchmark": "export", "rows": args.rows, "pipeline": await bench_pipeline(args.rows)}
+    if args.mongo_url:
+        report["endpoint"] = await bench_endpoint(args)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the streaming exports")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mongo-url", help="local MongoDB for the end-to-end run; pipeline only when omitted")
+    parser.add_argument("--db-name", default="paseoslugo_bench_export")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit(asyncio.run(main(args)), args.output)
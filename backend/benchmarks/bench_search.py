@@ -0,0 +1,165 @@
+"""Latency of walker and message search.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_search [--messages 1000000] [--mongo-url mongodb://localhost:27017] [--output result.json]
+
+Without --mongo-url only the analyzer is measured (messages analysed per
+second, which bounds the extra cost of indexing on send). With it, a scratch
+database is filled with --messages synthetic messages in Spanish and
+Galician between --users users (a few of them very chatty) plus --walkers
+walker profiles, and each query is timed --repeat times:
+
+- message search through the user_id-prefixed text index, for a typical and
+  for the chattiest user, with a common and a rare term;
+- the regex scan it replaces ($regex on messages.message within the user's
+  conversations), for comparison;
+- walker search.
+
+Each case reports p50/p95 in ms and, from explain(), the index keys and
+documents examined.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import emit, import_server
+
+server = import_server()
+
+import search  # noqa: E402
+from repositories import Repositories  # noqa: E402
+
+PHRASES = (
+    "¿Qué tal el paseo de hoy?", "Mañana no puedo, ¿lo pasamos al jueves?", "Os cans portáronse moi ben",
+    "Le he dado agua al volver", "A cadela está un pouco cansa", "¿Puedes llevar la correa larga?",
+    "Hemos ido por el parque del Miño", "Chegamos ás cinco", "Tiene las patas llenas de barro",
+    "Gracias por las fotos", "Podes pasar pola tarde?", "El veterinario dice que camine menos",
+    "Traio as bolsas", "Se ha portado genial con otros perros", "Mañá imos polo paseo do Miño",
+)
+RARE = "desparasitación"  # in about one message in a thousand
+
+
+def message(rng, sender, recipient, created_at):
+    words = " ".join(rng.sample(PHRASES, 2))
+    if rng.random() < 0.001:
+        words += f" Recuerda la {RARE}"
+    return server.to_document(server.Message(sender_id=sender, recipient_id=recipient, message=words,
+                                             created_at=created_at))
+
+
+def bench_analyzer(rng, count=20000):
+    texts = [" ".join(rng.sample(PHRASES, 2)) for _ in range(count)]
+    start = time.perf_counter()
+    for text in texts:
+        search.search_terms(text)
+    return {"messages_per_s": round(count / (time.perf_counter() - start))}
+
+
+async def timed(repeat, query):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await query()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(statistics.median(samples), 2), "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 2)}
+
+
+async def examined(collection, query, sort=None, limit=21):
+    cursor = collection.find(query, {"_id": 1}).limit(limit)
+    if sort:
+        cursor = cursor.sort(sort)
+    stats = (await cursor.explain())["executionStats"]
+    return {"keys_examined": stats["totalKeysExamined"], "docs_examined": stats["totalDocsExamined"]}
+
+
+async def seed(db, args, rng):
+    users = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.users)]
+    now = datetime.now(timezone.utc)
+    batch, search_batch = [], []
+    for i in range(args.messages):
+        # Pareto-distributed senders: a handful of users have most of the history
+        sender = users[int(rng.paretovariate(1.1)) % len(users)]
+        doc = message(rng, sender, rng.choice(users), now - timedelta(minutes=args.messages - i))
+        batch.append(doc)
+        search_batch += search.message_search_docs(doc)
+        if len(batch) >= 10000:
+            await asyncio.gather(db.messages.insert_many(batch, ordered=False),
+                                 db.message_search.insert_many(search_batch, ordered=False))
+            batch, search_batch = [], []
+    if batch:
+        await asyncio.gather(db.messages.insert_many(batch, ordered=False),
+                             db.message_search.insert_many(search_batch, ordered=False))
+    walkers = []
+    for i in range(args.walkers):
+        walker = server.Walker(user_id=f"walker-user-{i}", bio=" ".join(rng.sample(PHRASES, 3)),
+                               specialties=rng.sample(("Perros grandes", "Cachorros", "Gatos", "Adiestramento"), 2),
+                               location=rng.choice(("Centro de Lugo", "A Milagrosa", "Fingoi")))
+        walkers.append({**server.to_document(walker),
+                        "search": search.walker_search_fields(walker.bio, walker.specialties, walker.location)})
+    await db.walkers.insert_many(walkers)
+    counts = await db.message_search.aggregate([
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}, {"$sort": {"count": -1}},
+    ]).to_list(None)
+    return counts[0]["_id"], counts[len(counts) // 2]["_id"]
+
+
+async def bench_mongo(args, rng):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    mongo = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+    await mongo.drop_database(args.db_name)
+    db = mongo[args.db_name]
+    repos = Repositories(db)
+    await server.ensure_indexes(db)
+    heavy, typical = await seed(db, args, rng)
+
+    results = {}
+    for user_name, user_id in (("typical_user", typical), ("heavy_user", heavy)):
+        for term_name, term in (("common", "paseo"), ("rare", RARE)):
+            terms = search.search_terms(term)
+            case = await timed(args.repeat, lambda: repos.message_search.search(user_id, terms, 0, 21))
+            case.update(await examined(db.message_search, {"user_id": user_id, "$text": {"$search": terms}}))
+            results[f"messages_text_{user_name}_{term_name}"] = case
+
+            scan = {"$or": [{"sender_id": user_id}, {"recipient_id": user_id}],
+                    "message": {"$regex": term, "$options": "i"}}
+            case = await timed(args.repeat, lambda: db.messages.find(scan, {"_id": 0}).limit(21).to_list(None))
+            case.update(await examined(db.messages, scan))
+            results[f"messages_regex_{user_name}_{term_name}"] = case
+
+    terms = search.search_terms("cachorros Milagrosa")
+    case = await timed(args.repeat, lambda: repos.walkers.search(terms, 0, 21))
+    case.update(await examined(db.walkers, {"$text": {"$search": terms}}))
+    results["walkers_text"] = case
+
+    stats = await db.command("collStats", "message_search")
+    results["message_search_index_mb"] = round(stats["totalIndexSize"] / 2 ** 20, 1)
+    await mongo.drop_database(args.db_name)
+    return results
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    report = {"benchmark": "search", "messages": args.messages, "analyzer": bench_analyzer(rng)}
+    if args.mongo_url:
+        report["mongo"] = await bench_mongo(args, rng)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark walker and message search")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--walkers", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-url", help="local MongoDB for the query benchmarks; analyzer only when omitted")
+    parser.add_argument("--db-name", default="paseoslugo_bench_search")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit(asyncio.run(main(args)), args.output)
@@ -0,0 +1,99 @@
+"""Per-endpoint serialization cost, legacy path vs FastJSONResponse.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_serialization [--repeat 200] [--output result.json]
+
+The legacy path mirrors what handlers used to do: build Pydantic models,
+model_dump() them, run FastAPI's jsonable_encoder and render with the stdlib
+JSONResponse. The fast path renders the repository dicts with orjson.
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from benchmarks.common import emit, import_server
+
+server = import_server()
+
+
+def enriched_bookings(count=100):
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(count):
+        start = now + timedelta(hours=i)
+        docs.append(server.to_document(server.Booking(
+            owner_id=f"owner-{i}", walker_id=f"walker-{i % 7}", dog_id=f"dog-{i}",
+            service_type="estandar", date=start.strftime("%Y-%m-%d"), time=start.strftime("%H:%M"),
+            duration=45, amount=22.0, location="Centro de Lugo", notes="Sin correa en el parque",
+            start_at=start,
+        )) | {"walker_name": "Sonia Sánchez", "dog_name": f"Rex {i}"})
+    return docs
+
+
+def walk_with_route(points=2000):
+    rnd = random.Random(7)
+    lat, lng = 43.0097, -7.5560
+    route = []
+    for i in range(points):
+        lat += rnd.uniform(-0.0002, 0.0002)
+        lng += rnd.uniform(-0.0002, 0.0002)
+        route.append({"lat": lat, "lng": lng, "timestamp": 1_700_000_000.0 + i * 5})
+    return server.to_document(server.Walk(
+        booking_id="booking-1", status="in_progress", route_data=route,
+        start_time=datetime.now(timezone.utc),
+    ))
+
+
+def message_list(count=100):
+    return [
+        server.to_document(server.Message(sender_id="u1", recipient_id="u2", message="¿Qué tal el paseo? " * 3))
+        | {"sender_name": "Ana", "recipient_name": "Sonia", "sender_picture": None, "recipient_picture": None}
+        for _ in range(count)
+    ]
+
+
+def legacy(model_cls, docs):
+    if isinstance(docs, list):
+        content = [model_cls(**doc).model_dump() for doc in docs]
+    else:
+        content = model_cls(**docs).model_dump()
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast(docs):
+    return server.FastJSONResponse(docs).body
+
+
+PAYLOADS = {
+    "GET /bookings (100 enriched)": (server.BookingOut, enriched_bookings),
+    "GET /walks/{id} (2000 points)": (server.Walk, walk_with_route),
+    "GET /messages (100 enriched)": (server.MessageOut, message_list),
+}
+
+
+def run(repeat):
+    results = {}
+    for name, (model_cls, factory) in PAYLOADS.items():
+        docs = factory()
+        legacy_s = min(timeit.repeat(lambda: legacy(model_cls, docs), number=1, repeat=repeat))
+        fast_s = min(timeit.repeat(lambda: fast(docs), number=1, repeat=repeat))
+        results[name] = {
+            "legacy_us": round(legacy_s * 1e6, 1),
+            "fast_us": round(fast_s * 1e6, 1),
+            "speedup": round(legacy_s / fast_s, 2),
+            "bytes": len(fast(docs)),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit({"benchmark": "serialization", "repeat": args.repeat, "results": run(args.repeat)}, args.output)
@@ -0,0 +1,105 @@
+"""Cold-start profile and benchmark.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup [--runs 10] [--mongo-url mongodb://localhost:27017] [--output result.json]
+
+Every run is a fresh interpreter that imports server.py and goes through the
+app lifespan, so the numbers are what a newly spawned worker pays. The report
+has the median/max wall time of both phases, the per-step lifespan timings
+(server.startup_timings) and, from one extra `python -X importtime` run, the
+import cost per top-level package.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import BACKEND_DIR, emit
+
+CHILD = r"""
+import asyncio, json, os, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+
+async def main():
+    database = None
+    if not os.environ.get("BENCH_MONGO_URL"):
+        from mongomock_motor import AsyncMongoMockClient
+        database = AsyncMongoMockClient(tz_aware=True)["paseoslugo_bench"]
+    app = server.create_app(database)
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+    return start, ready
+
+start, ready = asyncio.run(main())
+print(json.dumps({
+    "import_s": t1 - t0,
+    "lifespan_s": ready - start,
+    "timings": server.startup_timings,
+}))
+"""
+
+
+def child_env(mongo_url):
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", mongo_url or "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "paseoslugo_bench")
+    env.setdefault("JWT_SECRET", "bench-secret")
+    if mongo_url:
+        env["BENCH_MONGO_URL"] = env["MONGO_URL"] = mongo_url
+    return env
+
+
+def measure_run(env):
+    output = subprocess.check_output([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                                     stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def import_profile(env, top):
+    """Self import time per top-level package, from -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=BACKEND_DIR,
+                            env=env, capture_output=True, text=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {name: round(us / 1000, 2) for name, us in ranked}
+
+
+def summarize(values):
+    return {"median_ms": round(statistics.median(values) * 1000, 2), "max_ms": round(max(values) * 1000, 2)}
+
+
+def run(args):
+    env = child_env(args.mongo_url)
+    runs = [measure_run(env) for _ in range(args.runs)]
+    steps = sorted({step for r in runs for step in r["timings"]})
+    return {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "backend": "mongodb" if args.mongo_url else "mongomock",
+        "import": summarize([r["import_s"] for r in runs]),
+        "lifespan": summarize([r["lifespan_s"] for r in runs]),
+        "lifespan_steps": {step: summarize([r["timings"].get(step, 0.0) for r in runs]) for step in steps},
+        "import_ms_by_package": import_profile(env, args.top),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure worker cold-start time")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--mongo-url", help="warm a real connection pool; defaults to mongomock")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the import profile")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit(run(args), args.output)
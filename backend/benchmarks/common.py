@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def import_server():
+    """Import server.py without a real environment (the Mongo client connects lazily)"""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "paseoslugo_bench")
+    os.environ.setdefault("JWT_SECRET", "bench-secret")
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def emit(report: dict, output: str = None):
+    report.setdefault("revision", git_revision())
+    text = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if output:
+        Path(output).write_text(text + "\n")
+    print(text)
@@ -0,0 +1,257 @@
+"""Reproducible load test for the backend API.
+
+Builds the app with server.create_app and runs it in-process, lifespan
+included, behind an httpx ASGI transport. It seeds a local
+MongoDB (or an in-memory mongomock stand-in when --mongo-url is omitted) with
+synthetic data, and drives a weighted mix of the client traffic we see in
+production with a pool of async virtual users:
+
+    python -m benchmarks.loadtest --users 200 --concurrency 32 --requests 5000 --output run.json
+
+Stripe is replaced by a local fake. The JSON report (RPS, latency
+percentiles and DB operations per request, overall and per operation) carries
+the git revision, seed and scale so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+
+from benchmarks.common import emit, import_server
+
+# mongomock answers queries on the event loop, which reads as loop lag; without this the
+# lifespan's loop monitor would have load shedding reject most of the run
+os.environ.setdefault("SHED_MAX_LAG_MS", "inf")
+server = import_server()
+
+from repositories import add_query_hook  # noqa: E402
+
+LUGO = (43.0097, -7.5560)
+PASSWORD = "benchmark-password"
+
+# operation -> weight; roughly what client timers and users generate
+WORKLOAD = {
+    "tracking_poll": 40,
+    "gps_update": 25,
+    "inbox": 15,
+    "unread_count": 10,
+    "login": 5,
+    "checkout": 5,
+}
+
+
+# The ASGI transport runs the app in the calling task, so repository hooks see
+# the operation of the virtual user that issued the request
+_current_op: ContextVar[str] = ContextVar("current_op", default="")
+
+
+class FakeStripe:
+    """Stands in for stripe.checkout.Session during load tests"""
+
+    @staticmethod
+    def create(**kwargs):
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        return SimpleNamespace(id=session_id, url=f"https://checkout.stripe.test/{session_id}")
+
+    @staticmethod
+    def retrieve(session_id):
+        return SimpleNamespace(status="complete", payment_status="paid", amount_total=1500, currency="eur")
+
+
+async def seed(db, scale: int, rng: random.Random):
+    """Seed `scale` owners plus proportional walkers, dogs, bookings, walks and messages"""
+    now = datetime.now(timezone.utc)
+    password_hash = server.hash_password(PASSWORD)
+    owners, walkers, dogs, bookings, walks, messages, sessions = [], [], [], [], [], [], []
+
+    walker_users = [server.User(email=f"walker{i}@bench.example.com", name=f"Walker {i}", role="walker",
+                                password_hash=password_hash) for i in range(max(1, scale // 20))]
+    for user in walker_users:
+        walkers.append(server.to_document(server.Walker(user_id=user.id, bio="Paseos por el Miño", specialties=["Perros grandes"])))
+        sessions.append(server.to_document(server.UserSession(
+            session_token=f"bench-{user.id}", user_id=user.id, expires_at=now + timedelta(days=7))))
+
+    for i in range(scale):
+        owner = server.User(email=f"owner{i}@bench.example.com", name=f"Owner {i}", password_hash=password_hash)
+        owners.append(owner)
+        sessions.append(server.to_document(server.UserSession(
+            session_token=f"bench-{owner.id}", user_id=owner.id, expires_at=now + timedelta(days=7))))
+        dog = server.Dog(owner_id=owner.id, name=f"Dog {i}")
+        dogs.append(server.to_document(dog))
+        for _ in range(3):
+            walker = rng.choice(walkers)
+            start = now + timedelta(hours=rng.randint(-72, 72))
+            local = start.astimezone(server.SERVICE_TIMEZONE)
+            booking = server.Booking(
+                owner_id=owner.id, walker_id=walker["id"], dog_id=dog.id, service_type="estandar",
+                date=local.strftime("%Y-%m-%d"), time=local.strftime("%H:%M"), duration=45, amount=22.0,
+                status="in_progress", start_at=start, walker_user_id=walker["user_id"],
+            )
+            bookings.append(server.to_document(booking))
+            route = [{"lat": LUGO[0] + rng.uniform(-0.01, 0.01), "lng": LUGO[1] + rng.uniform(-0.01, 0.01),
+                      "timestamp": float(j)} for j in range(rng.randint(10, 200))]
+            walks.append(server.to_document(server.Walk(
+                booking_id=booking.id, owner_user_id=owner.id, walker_user_id=walker["user_id"],
+                status="in_progress", start_time=start, route_data=route)))
+        for _ in range(5):
+            other = rng.choice(walker_users)
+            sender, recipient = (owner.id, other.id) if rng.random() < 0.5 else (other.id, owner.id)
+            messages.append(server.to_document(server.Message(sender_id=sender, recipient_id=recipient, message="¿Todo bien?")))
+
+    users = [server.to_document(u) for u in owners + walker_users]
+    for name, docs in (("users", users), ("user_sessions", sessions), ("walkers", walkers), ("dogs", dogs),
+                       ("bookings", bookings), ("walks", walks), ("messages", messages)):
+        for offset in range(0, len(docs), 1000):
+            await db[name].insert_many(docs[offset:offset + 1000])
+
+    bookings_by_owner, walker_tokens = {}, {}
+    for booking in bookings:
+        bookings_by_owner.setdefault(booking["owner_id"], []).append(booking["id"])
+        walker_tokens[booking["id"]] = f"bench-{booking['walker_user_id']}"
+    dog_by_owner = {dog["owner_id"]: dog["id"] for dog in dogs}
+    return [
+        {"id": u.id, "email": u.email, "token": f"bench-{u.id}",
+         "bookings": bookings_by_owner[u.id], "dog_id": dog_by_owner[u.id],
+         "walker_tokens": {b: walker_tokens[b] for b in bookings_by_owner[u.id]}}
+        for u in owners
+    ], walkers
+
+
+async def run_operation(client, op, user, walkers, rng):
+    headers = {"Authorization": f"Bearer {user['token']}"}
+    booking_id = rng.choice(user["bookings"])
+    if op == "tracking_poll":
+        await client.get(f"/api/bookings/{booking_id}", headers=headers)
+        return await client.get(f"/api/walks/{booking_id}", headers=headers)
+    if op == "gps_update":
+        point = {"lat": LUGO[0] + rng.uniform(-0.01, 0.01), "lng": LUGO[1] + rng.uniform(-0.01, 0.01),
+                 "timestamp": time.time()}
+        # Fixes come from the booking's walker
+        walker_headers = {"Authorization": f"Bearer {user['walker_tokens'][booking_id]}"}
+        return await client.post(f"/api/walks/{booking_id}/update", json={"route_point": point}, headers=walker_headers)
+    if op == "inbox":
+        return await client.get("/api/messages", headers=headers)
+    if op == "unread_count":
+        return await client.get("/api/messages/unread-count", headers=headers)
+    if op == "login":
+        return await client.post("/api/auth/login", json={"email": user["email"], "password": PASSWORD})
+    if op == "checkout":
+        slot = datetime.now(timezone.utc) + timedelta(days=rng.randint(1, 30))
+        booking = await client.post("/api/bookings", headers=headers, json={
+            "walker_id": rng.choice(walkers)["id"], "dog_id": user["dog_id"], "service_type": "basico",
+            "date": slot.strftime("%Y-%m-%d"), "time": "10:00", "duration": 30, "amount": 15.0,
+        })
+        return await client.post("/api/payments/checkout/session", headers=headers, json={
+            "booking_id": booking.json()["id"], "origin_url": "http://localhost:3000",
+        })
+    raise ValueError(op)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed, db_ops):
+    latencies = sorted(s[1] for s in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[2] >= 400),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "db_ops_per_request": round(db_ops / len(samples), 2) if samples else 0.0,
+    }
+
+
+async def load(args):
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+        await mongo.drop_database(args.db_name)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        mongo = AsyncMongoMockClient(tz_aware=True)
+    db = mongo[args.db_name]
+
+    rng = random.Random(args.seed)
+    users, walkers = await seed(db, args.users, rng)
+
+    stripe = server.get_stripe()
+    stripe.checkout.Session.create = FakeStripe.create
+    stripe.checkout.Session.retrieve = FakeStripe.retrieve
+
+    db_ops = {}
+
+    def count_query(collection, operation, docs, size):
+        op = _current_op.get()
+        if op:
+            db_ops[op] = db_ops.get(op, 0) + 1
+
+    add_query_hook(count_query)
+
+    operations = list(WORKLOAD)
+    weights = [WORKLOAD[op] for op in operations]
+    samples = []
+    remaining = args.requests
+
+    async def virtual_user(index):
+        nonlocal remaining
+        vu_rng = random.Random(args.seed * 1000 + index)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while remaining > 0:
+                remaining -= 1
+                op = vu_rng.choices(operations, weights)[0]
+                user = vu_rng.choice(users)
+                _current_op.set(op)
+                start = time.perf_counter()
+                response = await run_operation(client, op, user, walkers, vu_rng)
+                samples.append((op, time.perf_counter() - start, response.status_code))
+
+    # The lifespan opens what the workers have in production: indexes, walk store, dispatcher, scheduler
+    app = server.create_app(db)
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = {
+        "benchmark": "loadtest",
+        "seed": args.seed,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "backend": "mongodb" if args.mongo_url else "mongomock",
+        "duration_s": round(elapsed, 3),
+        "overall": summarize(samples, elapsed, sum(db_ops.values())),
+        "operations": {
+            op: summarize([s for s in samples if s[0] == op], elapsed, db_ops.get(op, 0))
+            for op in operations
+        },
+    }
+    if args.mongo_url:
+        await mongo.drop_database(args.db_name)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the backend API in-process")
+    parser.add_argument("--mongo-url", help="local MongoDB to use; defaults to in-memory mongomock")
+    parser.add_argument("--db-name", default="paseoslugo_loadtest")
+    parser.add_argument("--users", type=int, default=100, help="number of seeded owners")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    emit(asyncio.run(load(args)), args.output)
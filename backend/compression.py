@@ -0,0 +1,242 @@
+"""Response compression.
+
+CompressionMiddleware compresses complete responses (gzip or brotli, per
+Accept-Encoding) when they are at least COMPRESS_MIN_SIZE bytes of a
+compressible type; bodies from COMPRESS_BLOCKING_SIZE bytes up are compressed
+on the blocking pool instead of the event loop. Streaming responses pass
+through untouched, as do ones that already carry a Content-Encoding or are
+compressed formats, such as the exports' application/gzip. Every response of
+a compressible type gets Accept-Encoding added to its Vary header, whether
+or not it was compressed this time, so shared caches keep the variants apart.
+
+Large payloads that are final once written (completed and archived walks,
+whose routes run to thousands of points) go through PrecompressedCache
+instead: the handler renders the JSON, derives an ETag from it and gets
+back a response holding the variant the client asked for, compressed at a
+high level the first time that ETag is seen and served from memory
+afterwards. The ETag is a hash of the body, so a payload that does change
+after all (a late photo, a late offline sync) just gets a new entry. A
+client that sends the ETag back in If-None-Match gets a 304 without a body.
+
+Brotli is used when the brotli package is installed; gzip otherwise.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from metrics import Counter
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_BLOCKING_SIZE = int(os.environ.get('COMPRESS_BLOCKING_SIZE', str(64 * 1024)))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))
+# Precompressed bodies are compressed once, so they can afford the slow levels
+PRECOMPRESS_GZIP_LEVEL = int(os.environ.get('PRECOMPRESS_GZIP_LEVEL', '9'))
+PRECOMPRESS_BROTLI_QUALITY = int(os.environ.get('PRECOMPRESS_BROTLI_QUALITY', '11'))
+PRECOMPRESS_CACHE_BYTES = int(os.environ.get('PRECOMPRESS_CACHE_BYTES', str(64 * 2 ** 20)))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/x-ndjson")
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSED_RESPONSES = Counter("compressed_responses_total", "Responses sent compressed", ["encoding"])
+COMPRESSION_BYTES = Counter("compression_bytes_total", "Response bytes before and after compression",
+                            ["encoding", "stage"])
+PRECOMPRESSED = Counter("precompressed_responses_total", "Responses served through PrecompressedCache", ["outcome"])
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred encoding in ENCODINGS the client accepts, or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, precompress: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=PRECOMPRESS_BROTLI_QUALITY if precompress else BROTLI_QUALITY)
+    return gzip.compress(body, PRECOMPRESS_GZIP_LEVEL if precompress else GZIP_LEVEL, mtime=0)
+
+
+def _compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("application/gzip")
+
+
+def _vary_on_encoding(headers):
+    """`headers` with Accept-Encoding merged into whatever Vary the app set"""
+    values = [value.decode("latin-1") for name, value in headers if name.lower() == b"vary"]
+    fields = {field.strip().lower() for value in values for field in value.split(",")}
+    if "accept-encoding" in fields or "*" in fields:
+        return headers
+    vary = ", ".join([value for value in values if value.strip()] + ["Accept-Encoding"])
+    return [(name, value) for name, value in headers if name.lower() != b"vary"] + [(b"vary", vary.encode("latin-1"))]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match list names `etag` (weak comparison, as the header calls for)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = COMPRESS_MIN_SIZE, run_blocking=None,
+                 blocking_size: int = COMPRESS_BLOCKING_SIZE):
+        """`run_blocking` (server.run_blocking) compresses bodies of `blocking_size` bytes or more"""
+        self.app = app
+        self.min_size = min_size
+        self.run_blocking = run_blocking
+        self.blocking_size = blocking_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                encoding = negotiate(value.decode("latin-1"))
+                break
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                fields = {name.lower(): value for name, value in headers}
+                if (b"content-encoding" in fields
+                        or not _compressible(fields.get(b"content-type", b"").decode("latin-1"))):
+                    passthrough = True
+                    await send(message)
+                    return
+                message = {**message, "headers": _vary_on_encoding(headers)}
+                if encoding is None or message["status"] < 200 or message["status"] in (204, 304):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message  # held until the body shows whether it is worth compressing
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                # Streaming: send as is
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            if len(body) < self.min_size:
+                await send(start)
+                await send(message)
+                return
+            if self.run_blocking is not None and len(body) >= self.blocking_size:
+                compressed = await self.run_blocking(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            COMPRESSED_RESPONSES.inc(encoding)
+            COMPRESSION_BYTES.inc(encoding, "in", amount=len(body))
+            COMPRESSION_BYTES.inc(encoding, "out", amount=len(compressed))
+            headers = [(name, value) for name, value in start["headers"] if name.lower() != b"content-length"]
+            headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(compressed)).encode())]
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrecompressedCache:
+    """Compressed variants of final bodies, keyed by (ETag, encoding); LRU bounded in bytes.
+
+    Each worker keeps its own cache.
+    """
+
+    def __init__(self, max_bytes: int = PRECOMPRESS_CACHE_BYTES, min_size: int = COMPRESS_MIN_SIZE):
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.size = 0
+        self.entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+    def get(self, etag: str, encoding: str) -> Optional[bytes]:
+        variant = self.entries.get((etag, encoding))
+        if variant is not None:
+            self.entries.move_to_end((etag, encoding))
+        return variant
+
+    def put(self, etag: str, encoding: str, variant: bytes):
+        key = (etag, encoding)
+        if key in self.entries or len(variant) > self.max_bytes:
+            return
+        self.entries[key] = variant
+        self.size += len(variant)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    async def response(self, request: Request, body: bytes, run_blocking=None,
+                       media_type: str = "application/json") -> Response:
+        """Response for a final JSON `body`, compressed as the client accepts.
+
+        `run_blocking` runs the first compression of a variant off the event
+        loop (server.run_blocking); without it, it runs inline.
+        """
+        etag = self.etag(body)
+        # Auth-protected: browsers may keep it but must revalidate, which costs a 304
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            PRECOMPRESSED.inc("not_modified")
+            return Response(status_code=304, headers=headers)
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        if encoding is None or len(body) < self.min_size:
+            PRECOMPRESSED.inc("identity")
+            return Response(body, media_type=media_type, headers=headers)
+        variant = self.get(etag, encoding)
+        if variant is None:
+            PRECOMPRESSED.inc("miss")
+            if run_blocking is not None:
+                variant = await run_blocking(compress, body, encoding, True)
+            else:
+                variant = compress(body, encoding, True)
+            self.put(etag, encoding, variant)
+        else:
+            PRECOMPRESSED.inc("hit")
+        return Response(variant, media_type=media_type, headers={**headers, "Content-Encoding": encoding})
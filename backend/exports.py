@@ -0,0 +1,127 @@
+"""Streaming exports of whole collections for accounting.
+
+Rows come straight from a Mongo cursor (repositories' export(), sorted by
+the indexed created_at) and are encoded in chunks of about EXPORT_CHUNK_SIZE
+bytes, optionally gzipped on the fly, so an export holds one cursor batch
+and one chunk in memory however many rows it has.
+
+CSV cells holding user input (notes, locations, names) that start like a
+spreadsheet formula get a leading apostrophe, so opening an export in
+Excel or LibreOffice shows them as text instead of evaluating them.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, NamedTuple, Optional, Sequence
+
+import orjson
+
+from repositories import Repositories
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', str(64 * 1024)))
+
+# First characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+class ExportSpec(NamedTuple):
+    repository: Callable[[Repositories], Any]
+    # CSV columns; dotted names reach into sub-documents
+    columns: Sequence[str]
+
+
+EXPORTS = {
+    "bookings": ExportSpec(
+        lambda repos: repos.bookings,
+        ("id", "created_at", "status", "service_type", "date", "time", "start_at", "duration", "amount",
+         "owner_id", "walker_id", "dog_id", "location", "cancelled_at", "cancel_reason"),
+    ),
+    "payments": ExportSpec(
+        lambda repos: repos.payments,
+        ("id", "created_at", "session_id", "booking_id", "user_id", "amount", "currency", "payment_status",
+         "status"),
+    ),
+    "simple-bookings": ExportSpec(
+        lambda repos: repos.simple_bookings,
+        ("id", "created_at", "status", "service_type", "date", "time", "contact.name", "contact.phone",
+         "contact.email", "contact.address", "pet_details"),
+    ),
+}
+
+
+def date_filter(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    """created_at in [start, end)"""
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lt"] = end
+    return {"created_at": bounds} if bounds else {}
+
+
+def _row_reader(columns: Sequence[str]) -> Callable[[Dict[str, Any]], list]:
+    """doc -> CSV row; paths are split once per export, not once per cell"""
+    paths = [(column.split(".")[0], column.split(".")[1:]) for column in columns]
+
+    def read(doc: Dict[str, Any]) -> list:
+        row = []
+        for field, rest in paths:
+            value = doc.get(field)
+            for part in rest:
+                value = value.get(part) if isinstance(value, dict) else None
+            kind = type(value)
+            if kind is datetime:
+                value = value.isoformat()
+            elif kind is dict or kind is list:
+                value = orjson.dumps(value).decode()
+            elif kind is str and value.startswith(FORMULA_PREFIXES):
+                value = "'" + value
+            row.append(value)
+        return row
+
+    return read
+
+
+async def csv_chunks(docs: AsyncIterator[Dict[str, Any]], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    read = _row_reader(columns)
+    async for doc in docs:
+        writer.writerow(read(doc))
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+async def ndjson_chunks(docs: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    chunk = bytearray()
+    async for doc in docs:
+        chunk += orjson.dumps(doc, option=orjson.OPT_APPEND_NEWLINE)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    yield bytes(chunk)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(repos: Repositories, dataset: str, fmt: str, query: Dict[str, Any],
+                  gzip: bool = False) -> AsyncIterator[bytes]:
+    spec = EXPORTS[dataset]
+    docs = spec.repository(repos).export(query)
+    chunks = csv_chunks(docs, spec.columns) if fmt == "csv" else ndjson_chunks(docs)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,26 @@
+"""Multi-worker deployment.
+
+    gunicorn -c gunicorn.conf.py
+
+One uvicorn worker per core, each importing server after the fork and
+serving the app it builds (server.app, from create_app()). The plain-uvicorn
+equivalent is
+
+    uvicorn server:app --workers N --port 8001
+
+but then SHARED_STATE_BACKEND and MONGO_MAX_POOL_SIZE must be set by hand.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+wsgi_app = "server:app"
+keepalive = 5
+graceful_timeout = 30
+
+# Workers must not keep shared state in process memory
+os.environ.setdefault("SHARED_STATE_BACKEND", "mongo")
+# Split one connection budget across the workers instead of 100 per process
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(10, int(os.environ.get("MONGO_CONNECTION_BUDGET", "200")) // workers)))
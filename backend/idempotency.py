@@ -0,0 +1,161 @@
+"""Idempotency-Key support for endpoints that create things.
+
+A POST to one of IDEMPOTENT_PATHS that carries an `Idempotency-Key` header
+runs at most once per client and key. The first request claims the key with
+a single insert into idempotency_keys and its response is stored there;
+retries with the same key get the stored response back, marked with
+`Idempotent-Replayed: true`. A duplicate that arrives while the first
+request is still running waits up to IDEMPOTENCY_WAIT seconds for it to
+finish, then gets 409. Reusing a key for a different body is a 422.
+
+Responses that say nothing about the request (5xx, 401, 408, 429) are not
+stored; the claim is released so the client can retry. Keys are scoped to
+the client (bearer token, or IP) and kept IDEMPOTENCY_TTL_HOURS.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Iterable, Optional
+
+from starlette.requests import Request
+
+from metrics import Counter
+from ratelimit import client_ip
+from repositories import IdempotencyKeysRepository
+
+IDEMPOTENCY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '30'))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', '5'))
+
+IDEMPOTENT_PATHS = (
+    "/api/bookings",
+    "/api/dogs",
+    "/api/messages",
+    "/api/simple-bookings",
+    "/api/payments/checkout/session",
+)
+
+# Not a result of running the request; a retry should run it again
+UNSTORED_STATUSES = frozenset({401, 408, 429})
+MAX_KEY_LENGTH = 255
+# Response headers worth replaying; the rest are recomputed by outer middlewares
+REPLAYED_HEADERS = frozenset({b"content-type", b"location"})
+
+IDEMPOTENCY_REQUESTS = Counter("idempotency_requests_total", "Requests sent with an Idempotency-Key", ["outcome"])
+
+
+def _client_scope(request: Request) -> str:
+    """Keys of requests with a bearer token belong to that token, the rest to the client IP"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return "token:" + hashlib.sha1(authorization[7:].encode()).hexdigest()[:20]
+    return client_ip(request)
+
+
+async def _send_json(send, status: int, detail: str, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), *headers],
+    })
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store: Callable[[], Optional[IdempotencyKeysRepository]],
+                 paths: Iterable[str] = IDEMPOTENT_PATHS, ttl_hours: float = IDEMPOTENCY_TTL_HOURS,
+                 lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS, wait: float = IDEMPOTENCY_WAIT):
+        """`store` is called per request, as the repositories only exist once the lifespan has run"""
+        self.app = app
+        self.store = store
+        self.paths = frozenset(paths)
+        self.ttl = ttl_hours * 3600
+        self.lock_seconds = lock_seconds
+        self.wait = wait
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope, receive)
+        idempotency_key = request.headers.get("idempotency-key")
+        store = self.store()
+        if not idempotency_key or store is None:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, "Idempotency-Key too long")
+            return
+
+        # The body is read up front to fingerprint it, then handed to the app as is
+        body = await request.body()
+        fingerprint = hashlib.sha1(scope["query_string"] + b"\0" + body).hexdigest()
+        key = ":".join((_client_scope(request), scope["path"], idempotency_key))
+
+        record = await store.claim(key, fingerprint, self.lock_seconds, self.ttl)
+        # A concurrent duplicate waits for the first request's response
+        deadline = time.monotonic() + self.wait
+        while (record is not None and record["fingerprint"] == fingerprint and record.get("state") != "done"
+               and time.monotonic() < deadline):
+            await asyncio.sleep(0.05)
+            record = await store.get(key)
+            if record is None:
+                # The first request failed and released the key; run this one
+                record = await store.claim(key, fingerprint, self.lock_seconds, self.ttl)
+
+        if record is not None:
+            if record["fingerprint"] != fingerprint:
+                IDEMPOTENCY_REQUESTS.inc("mismatch")
+                await _send_json(send, 422, "Idempotency-Key reused with a different request")
+            elif record.get("state") != "done":
+                IDEMPOTENCY_REQUESTS.inc("conflict")
+                await _send_json(send, 409, "A request with this Idempotency-Key is in progress",
+                                 [(b"retry-after", b"1")])
+            else:
+                IDEMPOTENCY_REQUESTS.inc("replayed")
+                await self._replay(record["response"], send)
+            return
+
+        IDEMPOTENCY_REQUESTS.inc("new")
+        await self._run(scope, body, send, store, key)
+
+    async def _run(self, scope, body: bytes, send, store: IdempotencyKeysRepository, key: str):
+        sent_body = False
+
+        async def receive_body():
+            nonlocal sent_body
+            if sent_body:
+                # Nothing more to read; wait like a client that keeps the connection open
+                await asyncio.Event().wait()
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status, headers, chunks = 500, [], []
+
+        async def capture(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(name.decode("latin-1"), value.decode("latin-1"))
+                           for name, value in message.get("headers", []) if name.lower() in REPLAYED_HEADERS]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_body, capture)
+        except BaseException:
+            await store.release(key)
+            raise
+        if status >= 500 or status in UNSTORED_STATUSES:
+            await store.release(key)
+        else:
+            await store.complete(key, status, headers, b"".join(chunks))
+
+    async def _replay(self, response, send):
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in response["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": response["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": bytes(response["body"])})
@@ -0,0 +1,180 @@
+"""Per-request MongoDB query instrumentation.
+
+QueryListener is registered on the Motor client and sees every command pymongo
+sends. Motor runs pymongo on an executor thread but copies the caller's
+context, so the listener can attach each command to the request that issued
+it through a ContextVar. QueryMetricsMiddleware owns that per-request record,
+folds it into the metrics once the response is sent, and flags requests that
+go over the configured thresholds.
+"""
+import logging
+import os
+from collections import Counter as ShapeCounter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+QUERY_WARN_COUNT = int(os.environ.get('QUERY_WARN_COUNT', '20'))
+QUERY_WARN_MS = float(os.environ.get('QUERY_WARN_MS', '250'))
+# Dev mode logs repeated identical query shapes within a request (likely N+1 loops)
+QUERY_DEV_MODE = os.environ.get('QUERY_DEV_MODE', '').lower() in ('1', 'true', 'yes')
+N_PLUS_ONE_MIN_REPEATS = int(os.environ.get('N_PLUS_ONE_MIN_REPEATS', '3'))
+
+# Commands that never touch a user collection
+IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "killCursors", "getLastError",
+})
+
+REQUEST_QUERIES = Histogram(
+    "mongo_queries_per_request", "MongoDB commands issued per HTTP request", ["route"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+QUERIES_TOTAL = Counter("mongo_queries_total", "MongoDB commands issued by requests", ["collection", "command"])
+QUERY_SECONDS = Histogram("mongo_query_duration_seconds", "MongoDB command latency", ["collection"])
+BYTES_RETURNED = Counter("mongo_bytes_returned_total", "BSON bytes returned by MongoDB", ["collection"])
+FLAGGED_REQUESTS = Counter("mongo_flagged_requests_total", "Requests over the query thresholds", ["route", "reason"])
+
+
+class QueryEvent:
+    __slots__ = ("collection", "command", "shape", "duration", "size")
+
+    def __init__(self, collection, command, shape, duration, size):
+        self.collection = collection
+        self.command = command
+        self.shape = shape
+        self.duration = duration
+        self.size = size
+
+
+class RequestQueries:
+    """Commands issued while serving one request"""
+
+    __slots__ = ("events",)
+
+    def __init__(self):
+        # list.append is atomic, so executor threads can record concurrently
+        self.events: List[QueryEvent] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.events)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(event.duration for event in self.events) * 1000
+
+    def repeated_shapes(self, min_repeats: int = N_PLUS_ONE_MIN_REPEATS) -> List[Tuple[str, int]]:
+        shapes = ShapeCounter(event.shape for event in self.events)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= min_repeats]
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def current_queries() -> Optional[RequestQueries]:
+    return _current.get()
+
+
+def _shape(value: Any) -> Any:
+    """Query with every literal replaced by a placeholder"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_shape(item) for item in value[:1]]
+    return "?"
+
+
+def _command_filter(name: str, command: Dict[str, Any]) -> Any:
+    if name == "find":
+        return command.get("filter", {})
+    if name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or [{}]
+        return statements[0].get("q", {})
+    if name == "aggregate":
+        return [list(stage)[0] for stage in command.get("pipeline", [])]
+    if name in ("count", "findAndModify"):
+        return command.get("query", {})
+    return {}
+
+
+class QueryListener(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request_id) -> (collection, shape); dict set/pop are atomic
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+
+    def started(self, event):
+        if _current.get() is None or event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            return
+        shape = f"{event.command_name} {collection} {_shape(_command_filter(event.command_name, command))}"
+        self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+    def _finish(self, event, reply):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        queries = _current.get()
+        if pending is None or queries is None:
+            return
+        collection, shape = pending
+        size = len(bson.encode(reply)) if reply else 0
+        queries.events.append(QueryEvent(collection, event.command_name, shape, event.duration_micros / 1e6, size))
+
+
+query_listener = QueryListener()
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class QueryMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            self.record(route_template(scope), scope, queries)
+
+    def record(self, route: str, scope, queries: RequestQueries):
+        REQUEST_QUERIES.observe(queries.count, route)
+        for event in queries.events:
+            QUERIES_TOTAL.inc(event.collection, event.command)
+            QUERY_SECONDS.observe(event.duration, event.collection)
+            BYTES_RETURNED.inc(event.collection, amount=event.size)
+
+        if queries.count > QUERY_WARN_COUNT:
+            FLAGGED_REQUESTS.inc(route, "query_count")
+            logger.warning("%s %s issued %d MongoDB queries", scope["method"], scope["path"], queries.count)
+        if queries.total_ms > QUERY_WARN_MS:
+            FLAGGED_REQUESTS.inc(route, "query_time")
+            logger.warning("%s %s spent %.1f ms in MongoDB", scope["method"], scope["path"], queries.total_ms)
+        if QUERY_DEV_MODE:
+            for shape, repeats in queries.repeated_shapes():
+                logger.warning("%s %s repeated query %d times: %s", scope["method"], scope["path"], repeats, shape)
@@ -0,0 +1,65 @@
+"""Adaptive load shedding.
+
+When the worker is saturated, queueing more requests only makes every one of
+them slower. LoadSheddingMiddleware answers 503 with Retry-After as soon as
+the worker has more than SHED_MAX_IN_FLIGHT requests in progress or the
+event loop lags more than SHED_MAX_LAG_MS behind, so the requests it does
+accept keep normal latency. Lag is the smoothed value from loop_monitor.
+"""
+import os
+from typing import Iterable, Optional
+
+from loop_monitor import LoopMonitor, loop_monitor
+from metrics import Counter
+
+SHED_MAX_IN_FLIGHT = int(os.environ.get('SHED_MAX_IN_FLIGHT', '256'))
+SHED_MAX_LAG_MS = float(os.environ.get('SHED_MAX_LAG_MS', '250'))
+SHED_RETRY_AFTER = int(os.environ.get('SHED_RETRY_AFTER', '2'))
+
+# Never shed these: scrapes must see the overload, Stripe must get its answer
+SHED_EXEMPT_PATHS = ("/metrics", "/api/webhook/stripe")
+
+SHED_REQUESTS = Counter("load_shed_requests_total", "Requests rejected by load shedding", ["reason"])
+
+
+class LoadSheddingMiddleware:
+    def __init__(self, app, max_in_flight: int = SHED_MAX_IN_FLIGHT, max_lag_ms: float = SHED_MAX_LAG_MS,
+                 exempt: Iterable[str] = SHED_EXEMPT_PATHS, monitor: LoopMonitor = loop_monitor):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.max_lag = max_lag_ms / 1000
+        self.exempt = frozenset(exempt)
+        self.monitor = monitor
+        self.in_flight = 0
+
+    def _overload_reason(self) -> Optional[str]:
+        if self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.monitor.lag > self.max_lag:
+            return "loop_lag"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self._overload_reason()
+        if reason is not None:
+            SHED_REQUESTS.inc(reason)
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(SHED_RETRY_AFTER).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Service overloaded"}'})
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
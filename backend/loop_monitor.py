@@ -0,0 +1,134 @@
+"""Event loop lag monitor and blocking-call detector.
+
+A task on the loop wakes every LOOP_MONITOR_INTERVAL and records how late it
+woke up: that lag is what every other request waited on top of its own
+work. A watchdog thread checks the task's heartbeat; when the loop is overdue
+by more than LOOP_STALL_MS it grabs the loop thread's stack (via
+sys._current_frames) while the blocking call is still running, so the log
+points at the handler that did it rather than at whoever ran next.
+
+Test mode: with LOOP_BLOCK_ASSERT_MS set, every stall longer than that is
+kept and assert_no_blocking() (also called when the app shuts down) fails
+with their stacks.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import List, Optional, Tuple
+
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_INTERVAL = float(os.environ.get('LOOP_MONITOR_INTERVAL', '0.1'))
+LOOP_STALL_MS = float(os.environ.get('LOOP_STALL_MS', '100'))
+LOOP_BLOCK_ASSERT_MS = float(os.environ.get('LOOP_BLOCK_ASSERT_MS', '0'))
+
+LAG_QUANTILES = (0.5, 0.9, 0.99)
+LAG_WINDOW = 600  # samples, one minute at the default interval
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_LAG_QUANTILES = Gauge("event_loop_lag_quantile_seconds", "Event loop lag over the last minute", ["quantile"])
+LOOP_STALLS = Counter("event_loop_stalls_total", "Times the event loop was blocked longer than LOOP_STALL_MS")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, stall_ms: float = LOOP_STALL_MS,
+                 assert_ms: float = LOOP_BLOCK_ASSERT_MS, smoothing: float = 0.3):
+        self.interval = interval
+        self.stall = stall_ms / 1000
+        self.assert_limit = assert_ms / 1000 if assert_ms else None
+        self.smoothing = smoothing
+        # Smoothed so one slow tick does not look like overload (see loadshed)
+        self.lag = 0.0
+        self.samples = deque(maxlen=LAG_WINDOW)
+        self.violations: List[Tuple[float, str]] = []
+        self._beat = 0.0
+        self._stack: Optional[str] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def _threshold(self) -> float:
+        return min(self.stall, self.assert_limit) if self.assert_limit else self.stall
+
+    async def _tick(self):
+        ticks = 0
+        while True:
+            self._beat = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - self._beat - self.interval)
+            self._record(lag)
+            ticks += 1
+            if ticks % 10 == 0:
+                self._export_quantiles()
+
+    def _record(self, lag: float):
+        self.lag += self.smoothing * (lag - self.lag)
+        self.samples.append(lag)
+        LOOP_LAG.observe(lag)
+        stack, self._stack = self._stack, None
+        if lag > self.stall:
+            LOOP_STALLS.inc()
+            logger.warning("Event loop blocked for %.0f ms\n%s", lag * 1000, stack or "(stack not captured)")
+        if self.assert_limit and lag > self.assert_limit:
+            self.violations.append((lag, stack or "(stack not captured)"))
+
+    def _export_quantiles(self):
+        ordered = sorted(self.samples)
+        for q in LAG_QUANTILES:
+            LOOP_LAG_QUANTILES.set(ordered[min(len(ordered) - 1, int(q * len(ordered)))], str(q))
+
+    def _watch(self):
+        threshold = self._threshold()
+        captured_beat = None
+        while not self._stopped.wait(threshold / 4):
+            beat = self._beat
+            if beat == captured_beat or time.perf_counter() - beat - self.interval < threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stack = "".join(traceback.format_stack(frame))
+            captured_beat = beat
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.lag = 0.0
+
+    def assert_no_blocking(self):
+        """Fail if the loop was blocked longer than LOOP_BLOCK_ASSERT_MS (test mode)"""
+        if not self.violations:
+            return
+        violations, self.violations = self.violations, []
+        details = "\n".join(f"--- blocked {lag * 1000:.0f} ms\n{stack}" for lag, stack in violations)
+        raise AssertionError(
+            f"Event loop blocked longer than {self.assert_limit * 1000:.0f} ms {len(violations)} time(s)\n{details}"
+        )
+
+
+loop_monitor = LoopMonitor()
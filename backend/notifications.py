@@ -0,0 +1,280 @@
+"""Notifications through the transactional outbox.
+
+Handlers never deliver anything themselves: they add one outbox document per
+recipient and channel (outbox_events) inside the transaction that makes the
+change being announced, so a notification exists if and only if the change
+committed (without transactions the outbox write simply follows the change).
+NotificationDispatcher drains the outbox in the background: it leases due
+documents in batches, delivers them with at most NOTIFY_CONCURRENCY calls in
+flight, and retries failures with exponential backoff until
+NOTIFY_MAX_ATTEMPTS, after which a notification is marked dead.
+
+Channels are the adapters that are configured: email (EMAIL_API_URL), push
+(PUSH_API_URL) and webhook (NOTIFY_WEBHOOK_URL). With none configured, or
+with NOTIFY_LOCAL_SINK=1, notifications go to a LocalSink that keeps them in
+memory, for development and tests.
+"""
+import asyncio
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from metrics import Counter, Histogram
+from repositories import OutboxRecord, Repositories, UserRecord
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE', '50'))
+NOTIFY_CONCURRENCY = int(os.environ.get('NOTIFY_CONCURRENCY', '10'))
+NOTIFY_INTERVAL = float(os.environ.get('NOTIFY_INTERVAL', '2'))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', '8'))
+NOTIFY_RETRY_BASE = float(os.environ.get('NOTIFY_RETRY_BASE', '30'))
+NOTIFY_LEASE_SECONDS = float(os.environ.get('NOTIFY_LEASE_SECONDS', '120'))
+NOTIFY_LOCAL_SINK = os.environ.get('NOTIFY_LOCAL_SINK') == '1'
+
+EMAIL_API_URL = os.environ.get('EMAIL_API_URL')
+EMAIL_API_KEY = os.environ.get('EMAIL_API_KEY')
+EMAIL_FROM = os.environ.get('EMAIL_FROM', 'Paseos Lugo <noreply@paseoslugo.com>')
+PUSH_API_URL = os.environ.get('PUSH_API_URL')
+PUSH_API_KEY = os.environ.get('PUSH_API_KEY')
+NOTIFY_WEBHOOK_URL = os.environ.get('NOTIFY_WEBHOOK_URL')
+NOTIFY_WEBHOOK_SECRET = os.environ.get('NOTIFY_WEBHOOK_SECRET')
+
+# kind -> (title, body); formatted with the event payload
+TEMPLATES = {
+    "booking_confirmed": ("Reserva confirmada", "Tu paseo del {date} a las {time} está confirmado."),
+    "booking_cancelled": ("Reserva cancelada", "El paseo del {date} a las {time} se ha cancelado."),
+    "booking_reminder": ("Tu paseo es pronto", "Recuerda: paseo el {date} a las {time}."),
+    "walk_no_show": ("El paseo no ha empezado", "El paseo del {date} a las {time} aún no ha empezado."),
+    "walk_started": ("El paseo ha empezado", "Puedes seguir el paseo en directo desde la app."),
+    "walk_completed": ("Paseo completado", "El paseo ha terminado. ¡Cuéntanos qué tal ha ido!"),
+    "message_received": ("Nuevo mensaje", "{sender_name}: {preview}"),
+}
+
+NOTIFICATIONS = Counter("notifications_total", "Notification delivery attempts", ["channel", "outcome"])
+NOTIFICATION_DELAY = Histogram(
+    "notification_delay_seconds", "Time from outbox write to delivery", ["channel"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800, 3600),
+)
+
+
+class PermanentError(Exception):
+    """Delivery can never succeed (no address, request rejected); don't retry"""
+
+
+def outbox_events(kind: str, recipient_ids: Iterable[str], channels: Iterable[str],
+                  **payload: Any) -> List[OutboxRecord]:
+    now = datetime.now(timezone.utc)
+    return [
+        {"kind": kind, "channel": channel, "recipient_id": recipient_id, "payload": payload, "state": "pending",
+         "attempts": 0, "next_attempt_at": now, "created_at": now}
+        for recipient_id in dict.fromkeys(recipient_ids) if recipient_id
+        for channel in channels
+    ]
+
+
+def render(event: OutboxRecord) -> Dict[str, str]:
+    title, body = TEMPLATES[event["kind"]]
+    payload = collections.defaultdict(str, event.get("payload") or {})
+    return {"title": title, "body": body.format_map(payload)}
+
+
+class Adapter:
+    channel = ""
+
+    async def send(self, event: OutboxRecord, recipient: UserRecord):
+        """Deliver one notification; raise to retry, PermanentError to give up"""
+        raise NotImplementedError
+
+
+class HTTPAdapter(Adapter):
+    def __init__(self, http_client, url: str):
+        self.http_client = http_client
+        self.url = url
+
+    async def _post(self, content: bytes, headers: Dict[str, str]):
+        response = await self.http_client.post(self.url, content=content,
+                                               headers={"Content-Type": "application/json", **headers})
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise PermanentError(f"{self.channel} rejected with {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+
+
+class EmailAdapter(HTTPAdapter):
+    """Transactional email through an HTTP email API"""
+
+    channel = "email"
+
+    def __init__(self, http_client, url: str, api_key: Optional[str], sender: str):
+        super().__init__(http_client, url)
+        self.api_key = api_key
+        self.sender = sender
+
+    async def send(self, event, recipient):
+        if not recipient.get("email"):
+            raise PermanentError("recipient has no email")
+        message = render(event)
+        content = json.dumps({"from": self.sender, "to": recipient["email"], "subject": message["title"],
+                              "text": f"Hola {recipient.get('name', '')},\n\n{message['body']}"}).encode()
+        await self._post(content, {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {})
+
+
+class PushAdapter(HTTPAdapter):
+    """Mobile push through a gateway that maps user ids to devices"""
+
+    channel = "push"
+
+    def __init__(self, http_client, url: str, api_key: Optional[str]):
+        super().__init__(http_client, url)
+        self.api_key = api_key
+
+    async def send(self, event, recipient):
+        content = json.dumps({"user_id": recipient["id"], **render(event),
+                              "data": {"kind": event["kind"], **event.get("payload", {})}}).encode()
+        await self._post(content, {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {})
+
+
+class WebhookAdapter(HTTPAdapter):
+    """The raw event, signed with HMAC-SHA256 in X-Signature"""
+
+    channel = "webhook"
+
+    def __init__(self, http_client, url: str, secret: Optional[str]):
+        super().__init__(http_client, url)
+        self.secret = secret
+
+    async def send(self, event, recipient):
+        content = json.dumps({"id": str(event["_id"]), "kind": event["kind"], "recipient_id": recipient["id"],
+                              "payload": event.get("payload", {}),
+                              "created_at": event["created_at"].isoformat()}, default=str).encode()
+        headers = {}
+        if self.secret:
+            headers["X-Signature"] = hmac.new(self.secret.encode(), content, hashlib.sha256).hexdigest()
+        await self._post(content, headers)
+
+
+class LocalSink(Adapter):
+    """Keeps the last notifications in memory instead of delivering them"""
+
+    channel = "local"
+
+    def __init__(self, maxlen: int = 1000):
+        self.delivered = collections.deque(maxlen=maxlen)
+
+    async def send(self, event, recipient):
+        message = render(event)
+        self.delivered.append({"kind": event["kind"], "recipient_id": recipient["id"], **message})
+        logger.info("Notification to %s: %s", recipient["id"], message["title"])
+
+
+def build_adapters(http_client) -> Dict[str, Adapter]:
+    adapters: List[Adapter] = []
+    if EMAIL_API_URL:
+        adapters.append(EmailAdapter(http_client, EMAIL_API_URL, EMAIL_API_KEY, EMAIL_FROM))
+    if PUSH_API_URL:
+        adapters.append(PushAdapter(http_client, PUSH_API_URL, PUSH_API_KEY))
+    if NOTIFY_WEBHOOK_URL:
+        adapters.append(WebhookAdapter(http_client, NOTIFY_WEBHOOK_URL, NOTIFY_WEBHOOK_SECRET))
+    if NOTIFY_LOCAL_SINK or not adapters:
+        adapters.append(LocalSink())
+    return {adapter.channel: adapter for adapter in adapters}
+
+
+class NotificationDispatcher:
+    def __init__(self, repos: Repositories, adapters: Dict[str, Adapter], batch_size: int = NOTIFY_BATCH_SIZE,
+                 concurrency: int = NOTIFY_CONCURRENCY, interval: float = NOTIFY_INTERVAL,
+                 max_attempts: int = NOTIFY_MAX_ATTEMPTS, retry_base: float = NOTIFY_RETRY_BASE,
+                 lease_seconds: float = NOTIFY_LEASE_SECONDS):
+        self.repos = repos
+        self.adapters = adapters
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.lease_seconds = lease_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self.adapters)
+
+    def wake(self):
+        """Dispatch now rather than at the next interval (call after the outbox write committed)"""
+        self._wakeup.set()
+
+    def _retry_at(self, attempts: int) -> Optional[datetime]:
+        if attempts >= self.max_attempts:
+            return None
+        delay = min(self.retry_base * 2 ** (attempts - 1), 3600) * random.uniform(0.8, 1.2)
+        return datetime.now(timezone.utc) + timedelta(seconds=delay)
+
+    async def _deliver(self, event: OutboxRecord, recipient: Optional[UserRecord]) -> bool:
+        channel = event["channel"]
+        attempts = event.get("attempts", 0) + 1
+        adapter = self.adapters.get(channel)
+        try:
+            if adapter is None:
+                raise PermanentError(f"channel {channel} is not configured")
+            if recipient is None:
+                raise PermanentError("recipient not found")
+            async with self._semaphore:
+                await adapter.send(event, recipient)
+        except PermanentError as exc:
+            NOTIFICATIONS.inc(channel, "dead")
+            await self.repos.outbox.mark_failed(event["_id"], attempts, str(exc), None)
+            return False
+        except Exception as exc:
+            retry_at = self._retry_at(attempts)
+            NOTIFICATIONS.inc(channel, "retry" if retry_at else "dead")
+            logger.warning("Notification %s over %s failed (attempt %d): %r", event["_id"], channel, attempts, exc)
+            await self.repos.outbox.mark_failed(event["_id"], attempts, repr(exc), retry_at)
+            return False
+        NOTIFICATIONS.inc(channel, "sent")
+        NOTIFICATION_DELAY.observe((datetime.now(timezone.utc) - event["created_at"]).total_seconds(), channel)
+        return True
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch of due notifications; returns how many were claimed"""
+        events = await self.repos.outbox.claim(self.batch_size, self.lease_seconds)
+        if not events:
+            return 0
+        recipients = await self.repos.users.get_contacts(event["recipient_id"] for event in events)
+        results = await asyncio.gather(*(self._deliver(event, recipients.get(event["recipient_id"]))
+                                         for event in events))
+        await self.repos.outbox.mark_sent([event["_id"] for event, ok in zip(events, results) if ok])
+        return len(events)
+
+    async def _run(self):
+        while True:
+            try:
+                # Full batches mean more is waiting
+                while await self.dispatch_once() >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Notification dispatch failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import PyMongoError
+
+from metrics import Counter
+from repositories import SERVICE_TIMEZONE
+from repositories.base import current_session
+
+# Bookings carry the service slot as "YYYY-MM-DD" + "HH:MM" strings in Lugo
+# local time (that is what the frontend sends); start_at is the typed UTC
+# timestamp derived from them.
+BOOKING_DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+# Fields that used to be written as ISO strings, per collection.
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "user_sessions": ["created_at", "expires_at"],
+    "walkers": ["created_at"],
+    "dogs": ["created_at"],
+    "bookings": ["created_at", "cancelled_at"],
+    "walks": ["created_at", "start_time", "end_time"],
+    "messages": ["created_at"],
+    "payment_transactions": ["created_at"],
+    "simple_bookings": ["created_at"],
+}
+
+# Attempts at a transaction that keeps hitting write conflicts, and the base of the backoff between them
+TRANSACTION_ATTEMPTS = int(os.environ.get('TRANSACTION_ATTEMPTS', '5'))
+TRANSACTION_BACKOFF = float(os.environ.get('TRANSACTION_BACKOFF', '0.01'))
+
+TRANSACTION_RETRIES = Counter("transaction_retries_total", "Transactions or commits retried after a transient error",
+                              ["stage"])
+
+T = TypeVar("T")
+
+
+def to_document(model: BaseModel) -> Dict[str, Any]:
+    """Dump a model for insertion, keeping datetimes as native BSON dates"""
+    return model.model_dump()
+
+
+def as_utc(value: Any) -> Optional[datetime]:
+    """Normalize a stored date (native or legacy ISO string) to an aware UTC datetime"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def booking_start_at(date: str, time: str) -> Optional[datetime]:
+    """Typed UTC start timestamp for a local booking slot, or None if the strings don't parse"""
+    try:
+        start = datetime.strptime(f"{date} {time}", BOOKING_DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    return start.replace(tzinfo=SERVICE_TIMEZONE).astimezone(timezone.utc)
+
+
+def supports_transactions(client) -> bool:
+    """Transactions need a replica set or a sharded cluster"""
+    if client is None:
+        return False
+    return client.topology_description.topology_type_name in ("ReplicaSetWithPrimary", "Sharded")
+
+
+async def transaction(client, fn: Callable[[], Awaitable[T]]) -> T:
+    """Run `fn`'s repository calls in one MongoDB transaction and return its result.
+
+    Write conflicts and other transient errors abort the attempt and `fn` runs
+    again from the start, up to TRANSACTION_ATTEMPTS times, so it must only
+    touch the database (or be safe to repeat). A commit whose outcome is
+    unknown is retried on its own. On a standalone server (or without a
+    client, e.g. mongomock) there are no transactions and `fn` runs once with
+    its writes applied one after the other.
+    """
+    if not supports_transactions(client):
+        return await fn()
+    async with await client.start_session() as session:
+        for attempt in range(1, TRANSACTION_ATTEMPTS + 1):
+            session.start_transaction()
+            token = current_session.set(session)
+            try:
+                result = await fn()
+            except BaseException as exc:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if _retryable(exc, "TransientTransactionError", attempt):
+                    await _backoff(attempt)
+                    continue
+                raise
+            finally:
+                current_session.reset(token)
+            for commit_attempt in range(1, TRANSACTION_ATTEMPTS + 1):
+                try:
+                    await session.commit_transaction()
+                    return result
+                except PyMongoError as exc:
+                    if _retryable(exc, "UnknownTransactionCommitResult", commit_attempt):
+                        TRANSACTION_RETRIES.inc("commit")
+                        continue
+                    if not _retryable(exc, "TransientTransactionError", attempt):
+                        raise
+                    break
+            await _backoff(attempt)
+
+
+def _retryable(exc: BaseException, label: str, attempt: int) -> bool:
+    return isinstance(exc, PyMongoError) and exc.has_error_label(label) and attempt < TRANSACTION_ATTEMPTS
+
+
+async def _backoff(attempt: int):
+    TRANSACTION_RETRIES.inc("transaction")
+    # Jittered, so two requests that conflicted on the same document don't collide again
+    await asyncio.sleep(random.uniform(0, TRANSACTION_BACKOFF * 2 ** attempt))
+
+
+async def ensure_indexes(db):
+    # Expired sessions are removed by Mongo itself
+    await asyncio.gather(
+        db.user_sessions.create_index("expires_at", expireAfterSeconds=0),
+        db.user_sessions.create_index("session_token", unique=True),
+        db.users.create_index("id", unique=True),
+        db.users.create_index("email", unique=True),
+        db.walkers.create_index("id", unique=True),
+        db.walkers.create_index("user_id"),
+        db.walkers.create_index([("rating", DESCENDING), ("reviews_count", DESCENDING)]),
+        # Terms are analysed by search.py, so Mongo must not stem them again
+        db.walkers.create_index([("search.tags", TEXT), ("search.text", TEXT)], name="walker_search",
+                                weights={"search.tags": 3, "search.text": 1}, default_language="none"),
+        db.walker_stats.create_index("walker_id", unique=True),
+        db.dogs.create_index("owner_id"),
+        db.bookings.create_index("id", unique=True),
+        db.bookings.create_index([("owner_id", ASCENDING), ("start_at", ASCENDING)]),
+        db.bookings.create_index([("walker_id", ASCENDING), ("start_at", ASCENDING)]),
+        db.bookings.create_index([("status", ASCENDING), ("start_at", ASCENDING)]),
+        db.bookings.create_index([("status", ASCENDING), ("created_at", ASCENDING)]),
+        db.bookings.create_index("created_at"),
+        db.walks.create_index("booking_id", unique=True),
+        db.walk_sync_ops.create_index([("booking_id", ASCENDING), ("op_id", ASCENDING)], unique=True),
+        db.walk_sync_ops.create_index("applied_at", expireAfterSeconds=30 * 24 * 3600),
+        db.messages.create_index([("sender_id", ASCENDING), ("created_at", DESCENDING)]),
+        db.messages.create_index([("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+        db.message_search.create_index([("user_id", ASCENDING), ("terms", TEXT)], name="message_search",
+                                       default_language="none"),
+        db.message_search.create_index([("id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        db.payment_transactions.create_index("session_id", unique=True),
+        db.payment_transactions.create_index("created_at"),
+        db.outbox.create_index([("state", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        db.outbox.create_index("lease"),
+        db.outbox.create_index("sent_at", expireAfterSeconds=7 * 24 * 3600),
+        db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0),
+        db.reviews.create_index("booking_id", unique=True),
+        db.reviews.create_index([("walker_id", ASCENDING), ("created_at", DESCENDING)]),
+        db.simple_bookings.create_index([("created_at", DESCENDING)]),
+        db.simple_bookings.create_index([("status", ASCENDING), ("date", ASCENDING), ("time", ASCENDING),
+                                         ("id", ASCENDING)]),
+        db.simple_bookings.create_index([("status", ASCENDING), ("service_type", ASCENDING), ("date", ASCENDING),
+                                         ("time", ASCENDING), ("id", ASCENDING)]),
+        db.simple_bookings.create_index("id", unique=True),
+        db.walks_archive.create_index("booking_id", unique=True),
+        db.bookings_archive.create_index("id", unique=True),
+        db.bookings_archive.create_index([("owner_id", ASCENDING), ("start_at", DESCENDING)]),
+        db.bookings_archive.create_index([("walker_id", ASCENDING), ("start_at", DESCENDING)]),
+        db.messages_archive.create_index([("sender_id", ASCENDING), ("created_at", DESCENDING)]),
+        db.messages_archive.create_index([("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+    )
@@ -0,0 +1,57 @@
+"""Token-bucket rate limits for hot endpoints.
+
+Buckets are keyed by rule and an identity the caller vouches for, and live
+in a SharedState, so with the Mongo backend every worker draws from the
+same bucket. Requests over the limit get a 429 with Retry-After.
+
+Nothing a client can vary freely may pick the bucket, or each variation
+gets a fresh one: a RateLimit used as a FastAPI dependency
+(`dependencies=[Depends(limit)]`) keys on the client IP; handlers key on
+what they have verified by calling take(), e.g. the user id once the
+session token has been checked, or the submitted email on login.
+"""
+import hashlib
+import math
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
+
+from metrics import Counter
+from shared_state import SharedState
+
+RATE_LIMIT_DECISIONS = Counter("rate_limit_decisions_total", "Rate limiter decisions", ["rule", "decision"])
+
+
+def client_ip(request: Request) -> str:
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def email_key(email: str) -> str:
+    return "email:" + hashlib.sha1(email.strip().lower().encode()).hexdigest()[:20]
+
+
+class RateLimit:
+    def __init__(self, name: str, rate: float, burst: int, store: Callable[[], Optional[SharedState]]):
+        """`rate` tokens per second, at most `burst` saved up.
+
+        `store` returns the SharedState to use; it is called per request
+        because the store is only opened in the app lifespan. While it returns
+        None every request is allowed.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+
+    async def take(self, identity: str):
+        """Draw a token from `identity`'s bucket; 429 when it is empty"""
+        store = self.store()
+        if store is None:
+            return
+        allowed, retry_after = await store.take_token(f"ratelimit:{self.name}:{identity}", self.rate, self.burst)
+        RATE_LIMIT_DECISIONS.inc(self.name, "allowed" if allowed else "limited")
+        if not allowed:
+            raise HTTPException(429, "Too many requests", headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    async def __call__(self, request: Request):
+        await self.take(client_ip(request))
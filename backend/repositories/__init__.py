@@ -0,0 +1,49 @@
+"""Collection repositories.
+
+Each module wraps one collection and exposes methods with minimal
+projections; handlers should go through these instead of touching db.<collection>
+directly.
+"""
+from .archive import (
+    ArchiveRepository, BookingsArchiveRepository, MessagesArchiveRepository, WalksArchiveRepository, pack, unpack,
+)
+from .base import Repository, QueryHook, add_query_hook, remove_query_hook
+from .bookings import SERVICE_TIMEZONE, BookingRecord, BookingsRepository
+from .dogs import DogRecord, DogsRepository
+from .idempotency_keys import IdempotencyKeysRepository, IdempotencyRecord, StoredResponse
+from .messages import MessageRecord, MessageSearchRecord, MessageSearchRepository, MessagesRepository
+from .outbox import OutboxRecord, OutboxRepository
+from .payments import PaymentRecord, PaymentsRepository
+from .reviews import ReviewRecord, ReviewsRepository
+from .simple_bookings import (
+    SIMPLE_BOOKING_STATUSES, SIMPLE_BOOKING_TRANSITIONS, SimpleBookingRecord, SimpleBookingsRepository,
+)
+from .users import SessionRecord, SessionsRepository, UserCredentials, UserRecord, UserSummary, UsersRepository
+from .walk_sync_ops import WalkSyncOpRecord, WalkSyncOpsRepository
+from .walker_stats import (
+    COUNTED_CANCELLATIONS, STAT_FIELDS, PeriodStats, WalkerStatsRecord, WalkerStatsRepository, booking_stats, period_keys,
+)
+from .walkers import WalkerRecord, WalkersRepository
+from .walks import WalkRecord, WalksRepository
+
+
+class Repositories:
+    def __init__(self, db):
+        self.users = UsersRepository(db)
+        self.sessions = SessionsRepository(db)
+        self.walkers = WalkersRepository(db)
+        self.walker_stats = WalkerStatsRepository(db)
+        self.dogs = DogsRepository(db)
+        self.bookings = BookingsRepository(db)
+        self.walks = WalksRepository(db)
+        self.walk_sync_ops = WalkSyncOpsRepository(db)
+        self.messages = MessagesRepository(db)
+        self.message_search = MessageSearchRepository(db)
+        self.payments = PaymentsRepository(db)
+        self.simple_bookings = SimpleBookingsRepository(db)
+        self.reviews = ReviewsRepository(db)
+        self.walks_archive = WalksArchiveRepository(db)
+        self.bookings_archive = BookingsArchiveRepository(db)
+        self.messages_archive = MessagesArchiveRepository(db)
+        self.idempotency_keys = IdempotencyKeysRepository(db)
+        self.outbox = OutboxRepository(db)
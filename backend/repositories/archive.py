@@ -0,0 +1,75 @@
+import zlib
+from datetime import timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import bson
+from bson import Binary, CodecOptions
+
+from .base import Repository
+from .bookings import BookingRecord
+from .messages import MessageRecord
+from .walks import WalkRecord
+
+_CODEC = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+
+def pack(doc: Dict[str, Any], keys: Sequence[str]) -> Dict[str, Any]:
+    """Archive record for `doc`: lookup keys in the clear, the rest as compressed BSON"""
+    body = {field: value for field, value in doc.items() if field != "_id"}
+    record = {"_id": doc["_id"], "data": Binary(zlib.compress(bson.encode(body), 6))}
+    record.update({key: doc.get(key) for key in keys})
+    return record
+
+
+def unpack(record: Dict[str, Any]) -> Dict[str, Any]:
+    return bson.decode(zlib.decompress(record["data"]), codec_options=_CODEC)
+
+
+class ArchiveRepository(Repository):
+    """Read side of an archive collection written by archive.py.
+
+    Archived documents come back exactly as they were in the live
+    collection, so handlers can use them as a fallback without changes.
+    """
+
+    # Fields copied out of the compressed body so they can be indexed and queried
+    keys: Sequence[str] = ()
+
+    async def _get(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        record = await self._find_one(query, {"_id": 0, "data": 1})
+        return unpack(record) if record else None
+
+    async def _list(self, query: Dict[str, Any], sort, limit: int) -> List[Dict[str, Any]]:
+        records = await self._find(query, {"_id": 0, "data": 1}, sort=sort, limit=limit)
+        return [unpack(record) for record in records]
+
+
+class WalksArchiveRepository(ArchiveRepository):
+    collection_name = "walks_archive"
+    keys = ("booking_id", "end_time")
+
+    async def get(self, booking_id: str) -> Optional[WalkRecord]:
+        return await self._get({"booking_id": booking_id})
+
+
+class BookingsArchiveRepository(ArchiveRepository):
+    collection_name = "bookings_archive"
+    keys = ("id", "owner_id", "walker_id", "start_at")
+
+    async def get(self, booking_id: str) -> Optional[BookingRecord]:
+        return await self._get({"id": booking_id})
+
+    async def list_for_owner(self, owner_id: str, limit: int = 100) -> List[BookingRecord]:
+        return await self._list({"owner_id": owner_id}, [("start_at", -1)], limit)
+
+    async def list_for_walker(self, walker_id: str, limit: int = 100) -> List[BookingRecord]:
+        return await self._list({"walker_id": walker_id}, [("start_at", -1)], limit)
+
+
+class MessagesArchiveRepository(ArchiveRepository):
+    collection_name = "messages_archive"
+    keys = ("id", "sender_id", "recipient_id", "created_at")
+
+    async def list_for_user(self, user_id: str, limit: int = 100) -> List[MessageRecord]:
+        query = {"$or": [{"sender_id": user_id}, {"recipient_id": user_id}]}
+        return await self._list(query, [("created_at", -1)], limit)
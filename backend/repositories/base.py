@@ -0,0 +1,119 @@
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import bson
+from pymongo import ReturnDocument
+
+# hook(collection, operation, documents_returned, bytes_read)
+QueryHook = Callable[[str, str, int, int], None]
+
+_query_hooks: List[QueryHook] = []
+
+# Session of the transaction the current task runs in (see persistence.transaction)
+current_session: ContextVar = ContextVar("mongo_session", default=None)
+
+
+def _session() -> Dict[str, Any]:
+    session = current_session.get()
+    return {"session": session} if session is not None else {}
+
+
+def add_query_hook(hook: QueryHook):
+    _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: QueryHook):
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+class Repository:
+    """Base class for collection repositories.
+
+    Every read goes through _find_one/_find with an explicit projection so
+    handlers only pull the fields they use; results are plain dicts typed
+    with the record TypedDicts of each module.
+    """
+
+    collection_name: str = ""
+
+    def __init__(self, db):
+        self.collection = db[self.collection_name]
+
+    def _observe(self, operation: str, docs: Iterable[Dict[str, Any]] = ()):
+        if not _query_hooks:
+            return
+        docs = list(docs)
+        size = sum(len(bson.encode(doc)) for doc in docs)
+        for hook in _query_hooks:
+            hook(self.collection_name, operation, len(docs), size)
+
+    async def _find_one(self, query: Dict[str, Any], projection: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one(query, projection, **_session())
+        self._observe("find_one", [doc] if doc else [])
+        return doc
+
+    async def _find(self, query: Dict[str, Any], projection: Dict[str, Any], sort=None, limit: int = 100,
+                    skip: int = 0) -> List[Dict[str, Any]]:
+        cursor = self.collection.find(query, projection, **_session())
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        docs = await cursor.to_list(limit)
+        self._observe("find", docs)
+        return docs
+
+    async def _iterate(self, query: Dict[str, Any], projection: Dict[str, Any], sort=None,
+                       batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Stream matching documents; only one driver batch is held in memory"""
+        cursor = self.collection.find(query, projection, batch_size=batch_size, **_session())
+        if sort:
+            cursor = cursor.sort(sort)
+        async for doc in cursor:
+            yield doc
+        self._observe("find")
+
+    async def _exists(self, query: Dict[str, Any]) -> bool:
+        doc = await self.collection.find_one(query, {"_id": 1}, **_session())
+        self._observe("find_one", [doc] if doc else [])
+        return doc is not None
+
+    async def _count(self, query: Dict[str, Any]) -> int:
+        count = await self.collection.count_documents(query, **_session())
+        self._observe("count")
+        return count
+
+    async def _insert(self, doc: Dict[str, Any]):
+        # insert_one adds _id to the dict it is given; keep the caller's copy clean
+        await self.collection.insert_one(dict(doc), **_session())
+        self._observe("insert")
+
+    async def _update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        result = await self.collection.update_one(query, update, upsert=upsert, **_session())
+        self._observe("update")
+        return result
+
+    async def _find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], projection: Dict[str, Any],
+                                   return_document: ReturnDocument = ReturnDocument.AFTER,
+                                   upsert: bool = False) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one_and_update(query, update, projection, return_document=return_document,
+                                                        upsert=upsert, **_session())
+        self._observe("find_one_and_update", [doc] if doc else [])
+        return doc
+
+    async def _aggregate(self, pipeline: List[Dict[str, Any]], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        docs = await self.collection.aggregate(pipeline, **_session()).to_list(limit)
+        self._observe("aggregate", docs)
+        return docs
+
+    async def _delete_one(self, query: Dict[str, Any]):
+        result = await self.collection.delete_one(query, **_session())
+        self._observe("delete")
+        return result
+
+
+def projection(*fields: str) -> Dict[str, int]:
+    proj = {"_id": 0}
+    proj.update({field: 1 for field in fields})
+    return proj
@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, TypedDict
+from zoneinfo import ZoneInfo
+
+from pymongo import ReturnDocument
+
+from .base import Repository, projection
+
+# Walks happen in Lugo: booking date/time strings and per-day rollups use its local time
+SERVICE_TIMEZONE = ZoneInfo("Europe/Madrid")
+
+# Bookings that still have a walk ahead of them
+OPEN_STATUSES = ["pending_payment", "confirmed", "in_progress"]
+
+
+class BookingRecord(TypedDict, total=False):
+    id: str
+    owner_id: str
+    walker_id: str
+    dog_id: str
+    service_type: str
+    date: str
+    time: str
+    duration: int
+    status: str
+    amount: float
+    location: Optional[str]
+    notes: Optional[str]
+    start_at: Optional[datetime]
+    walker_user_id: str
+    reminded_at: datetime  # set by the scheduler
+    no_show_at: datetime
+    cancelled_from: str  # status the booking was cancelled from
+    cancel_reason: str
+    created_at: datetime
+
+
+class BookingsRepository(Repository):
+    collection_name = "bookings"
+
+    async def get(self, booking_id: str) -> Optional[BookingRecord]:
+        return await self._find_one({"id": booking_id}, projection())
+
+    async def get_fields(self, booking_id: str, *fields: str) -> Optional[BookingRecord]:
+        return await self._find_one({"id": booking_id}, projection(*fields))
+
+    async def list_for_owner(self, owner_id: str, limit: int = 100) -> List[BookingRecord]:
+        return await self._find({"owner_id": owner_id}, projection(), limit=limit)
+
+    async def list_upcoming_for_owner(self, owner_id: str, since: datetime, limit: int = 20) -> List[BookingRecord]:
+        query = {"owner_id": owner_id, "start_at": {"$gte": since}, "status": {"$in": OPEN_STATUSES}}
+        return await self._find(query, projection(), sort=[("start_at", 1)], limit=limit)
+
+    async def get_in_progress_id(self, owner_id: str) -> Optional[str]:
+        doc = await self._find_one({"owner_id": owner_id, "status": "in_progress"}, projection("id"))
+        return doc["id"] if doc else None
+
+    async def list_for_walker(self, walker_id: str, limit: int = 100) -> List[BookingRecord]:
+        return await self._find({"walker_id": walker_id}, projection(), limit=limit)
+
+    def export(self, query: Dict) -> AsyncIterator[BookingRecord]:
+        return self._iterate(query, projection(), sort=[("created_at", 1)])
+
+    async def insert(self, doc: BookingRecord):
+        await self._insert(doc)
+
+    async def update(self, booking_id: str, fields: Dict):
+        await self._update_one({"id": booking_id}, {"$set": fields})
+
+    async def transition(self, booking_id: str, status: str, fields: Optional[Dict] = None,
+                         expected: Optional[str] = None) -> Optional[BookingRecord]:
+        """Set `status` (and `fields`) atomically; returns the booking as it was.
+
+        None if it already had that status, or did not have the `expected` one.
+        """
+        query = {"id": booking_id, "status": {"$ne": status} if expected is None else expected}
+        return await self._find_one_and_update(
+            query,
+            {"$set": {"status": status, **(fields or {})}},
+            projection("owner_id", "walker_id", "walker_user_id", "status", "amount", "date", "time", "start_at",
+                       "cancelled_from", "cancel_reason"),
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def list_starting_between(self, status: str, start: datetime, end: datetime,
+                                    limit: int = 5000) -> List[BookingRecord]:
+        query = {"status": status, "start_at": {"$gte": start, "$lt": end}}
+        return await self._find(query, projection("id", "start_at", "reminded_at", "no_show_at"),
+                                sort=[("start_at", 1)], limit=limit)
+
+    async def list_created_between(self, status: str, start: datetime, end: datetime,
+                                   limit: int = 5000) -> List[BookingRecord]:
+        query = {"status": status, "created_at": {"$gte": start, "$lt": end}}
+        return await self._find(query, projection("id", "created_at"), sort=[("created_at", 1)], limit=limit)
+
+    async def mark_once(self, booking_id: str, field: str, status: str,
+                        conditions: Optional[Dict] = None) -> Optional[BookingRecord]:
+        """Stamp `field` with the current time unless it is set already; None if it was, or the status differs"""
+        query = {"id": booking_id, "status": status, field: {"$exists": False}, **(conditions or {})}
+        return await self._find_one_and_update(
+            query, {"$set": {field: datetime.now(timezone.utc)}},
+            projection("owner_id", "walker_user_id", "date", "time", "start_at"),
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def walker_schedule(self, walker_id: str, week_start: datetime, week_end: datetime,
+                              now: datetime, upcoming: int = 10) -> Dict[str, List[Dict]]:
+        """The walker's bookings for the week and their next open ones, with dog and owner names"""
+        details = [
+            {"$lookup": {"from": "dogs", "localField": "dog_id", "foreignField": "id", "as": "dog"}},
+            {"$lookup": {"from": "users", "localField": "owner_id", "foreignField": "id", "as": "owner"}},
+            {"$project": {
+                "_id": 0, "id": 1, "date": 1, "time": 1, "start_at": 1, "duration": 1, "service_type": 1,
+                "status": 1, "amount": 1, "location": 1, "notes": 1,
+                "dog_name": {"$arrayElemAt": ["$dog.name", 0]},
+                "owner_name": {"$arrayElemAt": ["$owner.name", 0]},
+            }},
+        ]
+        pipeline = [
+            {"$match": {"walker_id": walker_id, "start_at": {"$gte": min(week_start, now)},
+                        "status": {"$in": OPEN_STATUSES + ["completed"]}}},
+            {"$sort": {"start_at": 1}},
+            {"$facet": {
+                "week": [{"$match": {"start_at": {"$gte": week_start, "$lt": week_end}}}, {"$limit": 200}] + details,
+                "upcoming": [{"$match": {"start_at": {"$gte": now}, "status": {"$in": OPEN_STATUSES}}},
+                             {"$limit": upcoming}] + details,
+            }},
+        ]
+        result = await self._aggregate(pipeline)
+        return result[0] if result else {"week": [], "upcoming": []}
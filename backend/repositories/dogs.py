@@ -0,0 +1,33 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class DogRecord(TypedDict, total=False):
+    id: str
+    owner_id: str
+    name: str
+    breed: Optional[str]
+    size: str
+    age: Optional[int]
+    special_needs: List[str]
+    photo_url: Optional[str]
+    created_at: datetime
+
+
+class DogsRepository(Repository):
+    collection_name = "dogs"
+
+    async def list_for_owner(self, owner_id: str, limit: int = 100) -> List[DogRecord]:
+        return await self._find({"owner_id": owner_id}, projection(), limit=limit)
+
+    async def get_names(self, dog_ids: Iterable[str]) -> Dict[str, str]:
+        ids = list(set(dog_ids))
+        if not ids:
+            return {}
+        docs = await self._find({"id": {"$in": ids}}, projection("id", "name"), limit=len(ids))
+        return {doc["id"]: doc["name"] for doc in docs}
+
+    async def insert(self, doc: DogRecord):
+        await self._insert(doc)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from .base import Repository
+
+
+class StoredResponse(TypedDict):
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+class IdempotencyRecord(TypedDict, total=False):
+    _id: str  # client + method + path + Idempotency-Key
+    fingerprint: str  # hash of the request body and query string
+    state: str  # "in_progress" | "done"
+    locked_until: datetime
+    response: StoredResponse
+    expires_at: datetime
+
+
+class IdempotencyKeysRepository(Repository):
+    """Responses of requests sent with an Idempotency-Key (expire via TTL).
+
+    The insert that claims a key is also the lock: a concurrent duplicate
+    hits the unique _id and sees the first request still in progress.
+    """
+
+    collection_name = "idempotency_keys"
+
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float,
+                    ttl_seconds: float) -> Optional[IdempotencyRecord]:
+        """Claim `key` for this request; returns the existing record if it was already claimed"""
+        now = datetime.now(timezone.utc)
+        try:
+            await self._insert({
+                "_id": key, "fingerprint": fingerprint, "state": "in_progress",
+                "locked_until": now + timedelta(seconds=lock_seconds),
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a lock left behind by a worker that died mid-request
+        taken = await self._find_one_and_update(
+            {"_id": key, "state": "in_progress", "fingerprint": fingerprint, "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + timedelta(seconds=lock_seconds)}},
+            {"_id": 1},
+        )
+        if taken:
+            return None
+        return await self.get(key)
+
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        return await self._find_one({"_id": key}, {"_id": 0})
+
+    async def complete(self, key: str, status: int, headers: List[Tuple[str, str]], body: bytes):
+        response = {"status": status, "headers": [list(header) for header in headers], "body": Binary(body)}
+        await self._update_one({"_id": key}, {"$set": {"state": "done", "response": response},
+                                              "$unset": {"locked_until": ""}})
+
+    async def release(self, key: str):
+        """Forget a claim whose request failed, so a retry runs it again"""
+        await self._delete_one({"_id": key, "state": "in_progress"})
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, TypedDict
+
+from pymongo import UpdateOne
+
+from .base import Repository, _session, projection
+
+
+class MessageRecord(TypedDict, total=False):
+    id: str
+    sender_id: str
+    recipient_id: str
+    message: str
+    booking_id: Optional[str]
+    read: bool
+    created_at: datetime
+
+
+class MessageSearchRecord(MessageRecord, total=False):
+    user_id: str  # the participant this entry is searchable by
+    terms: str  # analysed terms for the text index, see search.py
+
+
+class MessagesRepository(Repository):
+    collection_name = "messages"
+
+    async def list_for_user(self, user_id: str, limit: int = 100) -> List[MessageRecord]:
+        query = {"$or": [{"sender_id": user_id}, {"recipient_id": user_id}]}
+        return await self._find(query, projection(), sort=[("created_at", -1)], limit=limit)
+
+    async def count_unread(self, user_id: str) -> int:
+        return await self._count({"recipient_id": user_id, "read": False})
+
+    async def mark_read(self, message_id: str, recipient_id: str):
+        await self._update_one({"id": message_id, "recipient_id": recipient_id}, {"$set": {"read": True}})
+
+    async def insert(self, doc: MessageRecord):
+        await self._insert(doc)
+
+
+class MessageSearchRepository(Repository):
+    """Text index over messages, one entry per participant.
+
+    Entries copy the message fields a result shows, so results come from
+    this collection alone, archived messages included. The text index is
+    prefixed with user_id, which confines each search to the index keys of
+    the user's own messages.
+    """
+
+    collection_name = "message_search"
+
+    async def add(self, docs: List[MessageSearchRecord]):
+        if docs:
+            await self.collection.insert_many([dict(doc) for doc in docs], **_session())
+            self._observe("insert")
+
+    async def upsert(self, docs: List[MessageSearchRecord]):
+        """Idempotent add, for backfills"""
+        if docs:
+            await self.collection.bulk_write(
+                [UpdateOne({"id": doc["id"], "user_id": doc["user_id"]}, {"$set": doc}, upsert=True) for doc in docs],
+                ordered=False,
+            )
+            self._observe("update")
+
+    async def search(self, user_id: str, terms: str, skip: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """The user's messages matching any of the analysed `terms`, best match first"""
+        score = {"$meta": "textScore"}
+        fields = {**projection("id", "sender_id", "recipient_id", "booking_id", "message", "created_at"),
+                  "score": score}
+        return await self._find({"user_id": user_id, "$text": {"$search": terms}}, fields,
+                                sort=[("score", score), ("created_at", -1)], skip=skip, limit=limit)
@@ -0,0 +1,86 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, TypedDict
+
+from .base import Repository, _session
+
+
+class OutboxRecord(TypedDict, total=False):
+    kind: str  # e.g. "booking_confirmed"
+    channel: str  # "email" | "push" | "webhook" | "local"
+    recipient_id: str
+    payload: Dict[str, Any]
+    state: str  # "pending" | "sending" | "sent" | "dead"
+    attempts: int
+    next_attempt_at: datetime
+    lease: Optional[str]
+    lease_until: Optional[datetime]
+    last_error: Optional[str]
+    created_at: datetime
+    sent_at: Optional[datetime]
+
+
+def _due(now: datetime) -> Dict[str, Any]:
+    # Pending and due, or claimed by a dispatcher that let its lease run out
+    return {"$or": [
+        {"state": "pending", "next_attempt_at": {"$lte": now}},
+        {"state": "sending", "lease_until": {"$lt": now}},
+    ]}
+
+
+class OutboxRepository(Repository):
+    """Notifications waiting for delivery, one document per recipient and channel.
+
+    Handlers add them in the transaction that makes the change they announce
+    (persistence.transaction); notifications.NotificationDispatcher claims
+    due ones in batches under a lease and records the outcome. Sent ones
+    expire via TTL, dead ones are kept for inspection.
+    """
+
+    collection_name = "outbox"
+
+    async def add(self, docs: List[OutboxRecord]):
+        if not docs:
+            return
+        # insert_many adds _id to the dicts it is given; keep the caller's copies clean
+        await self.collection.insert_many([dict(doc) for doc in docs], **_session())
+        self._observe("insert")
+
+    async def claim(self, limit: int, lease_seconds: float, now: Optional[datetime] = None) -> List[OutboxRecord]:
+        """Lease up to `limit` due notifications to the caller"""
+        now = now or datetime.now(timezone.utc)
+        due = await self.collection.find(_due(now), {"_id": 1}).sort("next_attempt_at", 1).limit(limit).to_list(None)
+        if not due:
+            return []
+        lease = uuid.uuid4().hex
+        # Re-check the due filter so two dispatchers racing for a document can't both get it
+        await self.collection.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in due]}, **_due(now)},
+            {"$set": {"state": "sending", "lease": lease, "lease_until": now + timedelta(seconds=lease_seconds)}},
+        )
+        docs = await self.collection.find({"lease": lease}).to_list(None)
+        self._observe("claim", docs)
+        return docs
+
+    async def mark_sent(self, ids: List[Any]):
+        if not ids:
+            return
+        await self.collection.update_many(
+            {"_id": {"$in": ids}},
+            {"$set": {"state": "sent", "sent_at": datetime.now(timezone.utc)},
+             "$unset": {"lease": "", "lease_until": ""}},
+        )
+        self._observe("update")
+
+    async def mark_failed(self, doc_id: Any, attempts: int, error: str, retry_at: Optional[datetime]):
+        """Schedule another attempt at `retry_at`, or give up when it is None"""
+        fields = {"attempts": attempts, "last_error": error[:500]}
+        if retry_at is None:
+            fields["state"] = "dead"
+        else:
+            fields.update(state="pending", next_attempt_at=retry_at)
+        await self._update_one({"_id": doc_id}, {"$set": fields, "$unset": {"lease": "", "lease_until": ""}})
+
+    async def count_by_state(self) -> Dict[str, int]:
+        rows = await self._aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}])
+        return {row["_id"]: row["count"] for row in rows}
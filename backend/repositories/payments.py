@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class PaymentRecord(TypedDict, total=False):
+    id: str
+    session_id: str
+    booking_id: str
+    user_id: str
+    amount: float
+    currency: str
+    payment_status: str
+    status: str
+    metadata: Dict[str, Any]
+    created_at: datetime
+
+
+class PaymentsRepository(Repository):
+    collection_name = "payment_transactions"
+
+    async def get_status(self, session_id: str) -> Optional[PaymentRecord]:
+        return await self._find_one({"session_id": session_id}, projection("booking_id", "payment_status"))
+
+    def export(self, query: Dict) -> AsyncIterator[PaymentRecord]:
+        return self._iterate(query, projection(), sort=[("created_at", 1)])
+
+    async def insert(self, doc: PaymentRecord):
+        await self._insert(doc)
+
+    async def mark_paid(self, session_id: str):
+        await self._update_one(
+            {"session_id": session_id},
+            {"$set": {"payment_status": "paid", "status": "completed"}}
+        )
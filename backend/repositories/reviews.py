@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import List, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class ReviewRecord(TypedDict, total=False):
+    id: str
+    booking_id: str
+    walker_id: str
+    owner_id: str
+    rating: int
+    comment: Optional[str]
+    created_at: datetime
+
+
+class ReviewsRepository(Repository):
+    collection_name = "reviews"
+
+    async def list_for_walker(self, walker_id: str, limit: int = 50) -> List[ReviewRecord]:
+        return await self._find({"walker_id": walker_id}, projection(), sort=[("created_at", -1)], limit=limit)
+
+    async def insert(self, doc: ReviewRecord):
+        """Raises DuplicateKeyError if the booking already has a review"""
+        await self._insert(doc)
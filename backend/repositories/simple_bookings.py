@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from .base import Repository, _session, projection
+
+SIMPLE_BOOKING_STATUSES = ["pending", "confirmed", "completed", "cancelled"]
+
+# status -> the statuses a simple booking may move to it from
+SIMPLE_BOOKING_TRANSITIONS = {
+    "confirmed": ["pending"],
+    "completed": ["confirmed"],
+    "cancelled": ["pending", "confirmed"],
+}
+
+
+class SimpleBookingRecord(TypedDict, total=False):
+    id: str
+    service_type: str
+    date: str
+    time: str
+    contact: Dict[str, Any]
+    pet_details: Optional[str]
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    updated_by: str
+
+
+class SimpleBookingsRepository(Repository):
+    """Booking requests from the public form, triaged by staff.
+
+    The admin queue is ordered by service slot (date, time, id) and paged
+    by keyset: each page continues after the last (date, time, id) seen, so
+    a page costs the same however deep it is. Queries always constrain
+    status (all SIMPLE_BOOKING_STATUSES when no filter is given) so they
+    run on the (status, date, time, id) and
+    (status, service_type, date, time, id) indexes.
+    """
+
+    collection_name = "simple_bookings"
+
+    @staticmethod
+    def _filter(statuses: Sequence[str], service_type: Optional[str], date_from: Optional[str],
+                date_to: Optional[str]) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"status": {"$in": list(statuses)}}
+        if service_type:
+            query["service_type"] = service_type
+        dates = {}
+        if date_from:
+            dates["$gte"] = date_from
+        if date_to:
+            dates["$lte"] = date_to
+        if dates:
+            # "YYYY-MM-DD" strings sort like the dates they hold
+            query["date"] = dates
+        return query
+
+    async def list_recent(self, limit: int = 100) -> List[SimpleBookingRecord]:
+        return await self._find({}, projection(), sort=[("created_at", -1)], limit=limit)
+
+    async def list_queue(self, statuses: Sequence[str], service_type: Optional[str] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None,
+                         after: Optional[Tuple[str, str, str]] = None, limit: int = 50) -> List[SimpleBookingRecord]:
+        """One page of the queue in service slot order, after the (date, time, id) key `after`"""
+        query = self._filter(statuses, service_type, date_from, date_to)
+        if after is not None:
+            date, time, booking_id = after
+            query["$or"] = [
+                {"date": {"$gt": date}},
+                {"date": date, "time": {"$gt": time}},
+                {"date": date, "time": time, "id": {"$gt": booking_id}},
+            ]
+        return await self._find(query, projection(), sort=[("date", 1), ("time", 1), ("id", 1)], limit=limit)
+
+    async def count_by_status(self, service_type: Optional[str] = None, date_from: Optional[str] = None,
+                              date_to: Optional[str] = None) -> Dict[str, int]:
+        """Requests per status, from one aggregation covered by the status-prefixed indexes"""
+        pipeline = [
+            {"$match": self._filter(SIMPLE_BOOKING_STATUSES, service_type, date_from, date_to)},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]
+        counts = dict.fromkeys(SIMPLE_BOOKING_STATUSES, 0)
+        counts.update({row["_id"]: row["count"] for row in await self._aggregate(pipeline)})
+        return counts
+
+    async def set_status(self, ids: Sequence[str], status: str, updated_by: str) -> int:
+        """Move the given requests to `status` in one update_many; returns how many moved.
+
+        Only requests in a status that may lead to `status`
+        (SIMPLE_BOOKING_TRANSITIONS) are changed; the rest are left alone.
+        """
+        result = await self.collection.update_many(
+            {"id": {"$in": list(ids)}, "status": {"$in": SIMPLE_BOOKING_TRANSITIONS[status]}},
+            {"$set": {"status": status, "updated_at": datetime.now(timezone.utc), "updated_by": updated_by}},
+            **_session(),
+        )
+        self._observe("update")
+        return result.modified_count
+
+    def export(self, query: Dict) -> AsyncIterator[SimpleBookingRecord]:
+        return self._iterate(query, projection(), sort=[("created_at", 1)])
+
+    async def insert(self, doc: SimpleBookingRecord):
+        await self._insert(doc)
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class UserRecord(TypedDict, total=False):
+    id: str
+    email: str
+    name: str
+    picture: Optional[str]
+    role: str
+    phone: Optional[str]
+    address: Optional[str]
+    created_at: datetime
+
+
+class UserCredentials(UserRecord, total=False):
+    password_hash: Optional[str]
+
+
+class UserSummary(TypedDict, total=False):
+    id: str
+    name: str
+    picture: Optional[str]
+
+
+class SessionRecord(TypedDict):
+    user_id: str
+    expires_at: datetime
+
+
+# Everything except password_hash
+PUBLIC_FIELDS = ("id", "email", "name", "picture", "role", "phone", "address", "created_at")
+
+
+class UsersRepository(Repository):
+    collection_name = "users"
+
+    async def get(self, user_id: str) -> Optional[UserRecord]:
+        return await self._find_one({"id": user_id}, projection(*PUBLIC_FIELDS))
+
+    async def get_credentials(self, email: str) -> Optional[UserCredentials]:
+        return await self._find_one({"email": email}, projection(*PUBLIC_FIELDS, "password_hash"))
+
+    async def get_contact(self, user_id: str) -> Optional[UserRecord]:
+        return await self._find_one({"id": user_id}, projection("name", "email", "picture"))
+
+    async def email_exists(self, email: str) -> bool:
+        return await self._exists({"email": email})
+
+    async def get_summaries(self, user_ids: Iterable[str]) -> Dict[str, UserSummary]:
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        docs = await self._find({"id": {"$in": ids}}, projection("id", "name", "picture"), limit=len(ids))
+        return {doc["id"]: doc for doc in docs}
+
+    async def get_contacts(self, user_ids: Iterable[str]) -> Dict[str, UserRecord]:
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        docs = await self._find({"id": {"$in": ids}}, projection("id", "name", "email", "phone"), limit=len(ids))
+        return {doc["id"]: doc for doc in docs}
+
+    async def insert(self, doc: UserCredentials):
+        await self._insert(doc)
+
+    async def update(self, user_id: str, fields: Dict):
+        await self._update_one({"id": user_id}, {"$set": fields})
+
+
+class SessionsRepository(Repository):
+    collection_name = "user_sessions"
+
+    async def get(self, token: str) -> Optional[SessionRecord]:
+        return await self._find_one({"session_token": token}, projection("user_id", "expires_at"))
+
+    async def insert(self, doc: Dict):
+        await self._insert(doc)
+
+    async def delete(self, token: str):
+        await self._delete_one({"session_token": token})
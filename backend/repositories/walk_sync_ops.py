@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from typing import List, TypedDict
+
+from pymongo.errors import BulkWriteError
+
+from .base import Repository, _session, projection
+
+DUPLICATE_KEY = 11000
+
+
+class WalkSyncOpRecord(TypedDict, total=False):
+    booking_id: str
+    op_id: str
+    applied_at: datetime
+
+
+class WalkSyncOpsRepository(Repository):
+    """Operation ids already applied by the offline sync endpoint (expire via TTL)"""
+
+    collection_name = "walk_sync_ops"
+
+    async def claim(self, booking_id: str, op_ids: List[str]) -> List[str]:
+        """Record `op_ids` as applied; returns the ones that were not recorded before.
+
+        Call it in the transaction that applies the operations, so the ids
+        are only recorded if the operations are.
+        """
+        if not op_ids:
+            return []
+        # Inside a transaction a duplicate key aborts everything, so known ids are left out up front
+        seen = {doc["op_id"] for doc in await self._find(
+            {"booking_id": booking_id, "op_id": {"$in": op_ids}}, projection("op_id"), limit=len(op_ids))}
+        new = [op_id for op_id in op_ids if op_id not in seen]
+        if not new:
+            return []
+        now = datetime.now(timezone.utc)
+        docs = [{"booking_id": booking_id, "op_id": op_id, "applied_at": now} for op_id in new]
+        try:
+            await self.collection.insert_many(docs, ordered=False, **_session())
+            duplicates = set()
+        except BulkWriteError as exc:
+            # Without transactions: a concurrent sync recorded some of them in between
+            errors = exc.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+        self._observe("insert")
+        return [op_id for i, op_id in enumerate(new) if i not in duplicates]
+
+    async def release(self, booking_id: str, op_ids: List[str]):
+        """Forget claimed ids whose operations could not be applied"""
+        await self.collection.delete_many({"booking_id": booking_id, "op_id": {"$in": op_ids}}, **_session())
+        self._observe("delete")
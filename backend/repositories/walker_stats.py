@@ -0,0 +1,97 @@
+from datetime import datetime
+from typing import Dict, Optional, TypedDict
+
+from .base import Repository
+from .bookings import SERVICE_TIMEZONE
+
+# Counters kept per period; earnings are the amounts of completed bookings
+STAT_FIELDS = ("booked", "completed", "cancelled", "earnings")
+
+# Only cancelling a booking the walker had committed to counts; unpaid bookings dropping out don't
+COUNTED_CANCELLATIONS = ("confirmed", "in_progress")
+
+
+class PeriodStats(TypedDict, total=False):
+    booked: int
+    completed: int
+    cancelled: int
+    earnings: float
+
+
+class WalkerStatsRecord(TypedDict, total=False):
+    walker_id: str
+    total: PeriodStats
+    # period key -> stats, e.g. days["2025-06-01"], weeks["2025-W22"], months["2025-06"]
+    days: Dict[str, PeriodStats]
+    weeks: Dict[str, PeriodStats]
+    months: Dict[str, PeriodStats]
+
+
+def period_keys(when: datetime) -> Dict[str, str]:
+    """Bucket keys of a booking's service time, by the local day in Lugo"""
+    if when.tzinfo is not None:
+        when = when.astimezone(SERVICE_TIMEZONE)
+    year, week, _ = when.isocalendar()
+    return {"days": when.strftime("%Y-%m-%d"), "weeks": f"{year}-W{week:02d}", "months": when.strftime("%Y-%m")}
+
+
+def booking_stats(booking: Dict) -> PeriodStats:
+    """What one booking adds to its walker's counters in its current state.
+
+    A cancellation counts when the booking left confirmed or in_progress
+    (cancelled_from); older cancellations without it count unless the
+    payment expired.
+    """
+    stats = {"booked": 1, "completed": 0, "cancelled": 0, "earnings": 0.0}
+    status = booking.get("status")
+    if status == "completed":
+        stats["completed"] = 1
+        stats["earnings"] = float(booking.get("amount") or 0)
+    elif status == "cancelled":
+        if "cancelled_from" in booking:
+            stats["cancelled"] = int(booking["cancelled_from"] in COUNTED_CANCELLATIONS)
+        else:
+            stats["cancelled"] = int(booking.get("cancel_reason") != "payment_expired")
+    return stats
+
+
+class WalkerStatsRepository(Repository):
+    """Per-walker rollups, one document per walker updated with $inc.
+
+    Buckets are keyed by the booking's start_at, so the dashboard reads four
+    small sub-documents instead of aggregating the walker's history.
+    """
+
+    collection_name = "walker_stats"
+
+    async def record(self, walker_id: str, start_at: Optional[datetime], **counts: float):
+        counts = {field: value for field, value in counts.items() if value}
+        if not counts:
+            return
+        inc = {f"total.{field}": value for field, value in counts.items()}
+        if start_at is not None:
+            for kind, key in period_keys(start_at).items():
+                inc.update({f"{kind}.{key}.{field}": value for field, value in counts.items()})
+        await self._update_one({"walker_id": walker_id}, {"$inc": inc}, upsert=True)
+
+    async def record_transition(self, before: Dict, status: str):
+        """Apply a booking moving from before['status'] to `status`"""
+        after = {**before, "status": status}
+        if status == "cancelled":
+            after["cancelled_from"] = before.get("status")
+        old, new = booking_stats(before), booking_stats(after)
+        counts = {field: new[field] - old[field] for field in ("completed", "cancelled", "earnings")}
+        await self.record(before["walker_id"], before.get("start_at"), **counts)
+
+    async def get(self, walker_id: str, now: datetime) -> Dict[str, PeriodStats]:
+        """Stats for today, this week, this month and all time"""
+        keys = period_keys(now)
+        fields = {"_id": 0, "total": 1}
+        fields.update({f"{kind}.{key}": 1 for kind, key in keys.items()})
+        doc = await self._find_one({"walker_id": walker_id}, fields) or {}
+        return {
+            "today": doc.get("days", {}).get(keys["days"], {}),
+            "week": doc.get("weeks", {}).get(keys["weeks"], {}),
+            "month": doc.get("months", {}).get(keys["months"], {}),
+            "total": doc.get("total", {}),
+        }
@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class WalkerRecord(TypedDict, total=False):
+    id: str
+    user_id: str
+    bio: str
+    specialties: List[str]
+    experience_years: int
+    rating: float
+    rating_sum: int
+    reviews_count: int
+    availability: str
+    location: str
+    price_from: float
+    is_verified: bool
+    profile_image: Optional[str]
+    created_at: datetime
+    search: Dict[str, str]  # analysed terms for the text index, see search.py
+
+
+# Everything but the search terms
+PUBLIC = {"_id": 0, "search": 0}
+
+
+class WalkersRepository(Repository):
+    collection_name = "walkers"
+
+    async def list(self, limit: int = 100, sort_by_rating: bool = False) -> List[WalkerRecord]:
+        sort = [("rating", -1), ("reviews_count", -1)] if sort_by_rating else None
+        return await self._find({}, PUBLIC, sort=sort, limit=limit)
+
+    async def search(self, terms: str, skip: int = 0, limit: int = 20) -> List[WalkerRecord]:
+        """Walkers matching any of the analysed `terms`, best match first; `score` is the text score"""
+        score = {"$meta": "textScore"}
+        return await self._find({"$text": {"$search": terms}}, {**PUBLIC, "score": score},
+                                sort=[("score", score), ("rating", -1)], skip=skip, limit=limit)
+
+    async def get(self, walker_id: str) -> Optional[WalkerRecord]:
+        return await self._find_one({"id": walker_id}, PUBLIC)
+
+    async def get_user_id(self, walker_id: str) -> Optional[str]:
+        doc = await self._find_one({"id": walker_id}, projection("user_id"))
+        return doc["user_id"] if doc else None
+
+    async def get_user_ids(self, walker_ids: Iterable[str]) -> Dict[str, str]:
+        ids = list(set(walker_ids))
+        if not ids:
+            return {}
+        docs = await self._find({"id": {"$in": ids}}, projection("id", "user_id"), limit=len(ids))
+        return {doc["id"]: doc["user_id"] for doc in docs}
+
+    async def get_id_for_user(self, user_id: str) -> Optional[str]:
+        doc = await self._find_one({"user_id": user_id}, projection("id"))
+        return doc["id"] if doc else None
+
+    async def exists_for_user(self, user_id: str) -> bool:
+        return await self._exists({"user_id": user_id})
+
+    async def add_rating(self, walker_id: str, rating: int):
+        """Fold one review into the running sum and count, then refresh the average"""
+        doc = await self._find_one_and_update(
+            {"id": walker_id}, {"$inc": {"rating_sum": rating, "reviews_count": 1}},
+            projection("rating_sum", "reviews_count"),
+        )
+        if not doc:
+            return
+        # Concurrent reviews all $inc safely; only the one that saw the latest count writes the average
+        await self._update_one(
+            {"id": walker_id, "reviews_count": doc["reviews_count"]},
+            {"$set": {"rating": round(doc["rating_sum"] / doc["reviews_count"], 2)}},
+        )
+
+    async def insert(self, doc: WalkerRecord):
+        await self._insert(doc)
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Dict, List, Optional, TypedDict
+
+from .base import Repository, projection
+
+
+class WalkRecord(TypedDict, total=False):
+    id: str
+    booking_id: str
+    owner_user_id: str
+    walker_user_id: str
+    start_time: Optional[datetime]
+    end_time: Optional[datetime]
+    route_data: List[Dict[str, float]]
+    photos: List[str]
+    report_text: Optional[str]
+    status: str
+    created_at: datetime
+
+
+class WalksRepository(Repository):
+    collection_name = "walks"
+
+    async def get(self, booking_id: str) -> Optional[WalkRecord]:
+        return await self._find_one({"booking_id": booking_id}, projection())
+
+    async def get_status(self, booking_id: str) -> Optional[WalkRecord]:
+        """The walk without its route, except for the latest point"""
+        fields = projection("booking_id", "status", "start_time", "end_time")
+        fields["route_data"] = {"$slice": -1}
+        return await self._find_one({"booking_id": booking_id}, fields)
+
+    async def get_or_create(self, doc: WalkRecord) -> WalkRecord:
+        """The walk of doc['booking_id'], inserting `doc` if there is none yet (one upsert, safe to race)"""
+        return await self._find_one_and_update({"booking_id": doc["booking_id"]}, {"$setOnInsert": doc},
+                                               projection(), upsert=True)
+
+    async def update(self, booking_id: str, fields: Dict):
+        await self._update_one({"booking_id": booking_id}, {"$set": fields})
+
+    async def push(self, booking_id: str, field: str, value):
+        await self._update_one({"booking_id": booking_id}, {"$push": {field: value}})
+
+    async def apply(self, booking_id: str, update: Dict) -> WalkRecord:
+        """Run one combined update, creating the walk if needed; returns the walk afterwards"""
+        return await self._find_one_and_update({"booking_id": booking_id}, update, projection(), upsert=True)
+
+    async def push_many(self, booking_id: str, field: str, values: List,
+                        sort: Optional[Dict[str, int]] = None) -> Optional[WalkRecord]:
+        """Append `values` in one write, keeping `field` ordered by `sort` if given; returns the stored `field` afterwards"""
+        push: Dict = {"$each": values}
+        if sort:
+            push["$sort"] = sort
+        return await self._find_one_and_update({"booking_id": booking_id}, {"$push": {field: push}}, projection(field))
@@ -0,0 +1,245 @@
+"""Timers tied to bookings: reminders, no-shows and unpaid-booking expiry.
+
+BookingScheduler keeps the timers that fall due in the next
+SCHEDULER_HORIZON seconds in a hierarchical timing wheel and fires them on
+time, instead of scanning the bookings collection for work. Every
+SCHEDULER_REFILL seconds it (re)loads that horizon from the
+(status, start_at) and (status, created_at) indexes, one
+SCHEDULER_CHUNK-second range query at a time. Timers are keyed by booking
+and kind, so reloading is idempotent and bookings created or confirmed by
+any worker are picked up at the next refill. After a restart the first
+refill also looks SCHEDULER_LOOKBACK seconds back for timers that were
+missed while nothing was running; anything due before that is left alone
+(such as unpaid bookings from before the scheduler existed). Each range is
+read SCHEDULER_PAGE_SIZE bookings at a time.
+
+Only the worker holding the "scheduler" lease in SharedState runs timers;
+the others keep trying to take it over. The handlers re-check the booking
+with a conditional update before acting (see server.py), so a timer fired
+twice around a lease handover still acts once.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from metrics import Counter, Gauge
+from repositories import Repositories
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_TICK = float(os.environ.get('SCHEDULER_TICK', '1'))
+SCHEDULER_HORIZON = float(os.environ.get('SCHEDULER_HORIZON', str(2 * 3600)))
+SCHEDULER_CHUNK = float(os.environ.get('SCHEDULER_CHUNK', str(30 * 60)))
+SCHEDULER_REFILL = float(os.environ.get('SCHEDULER_REFILL', '60'))
+SCHEDULER_LOOKBACK = float(os.environ.get('SCHEDULER_LOOKBACK', str(6 * 3600)))
+SCHEDULER_PAGE_SIZE = int(os.environ.get('SCHEDULER_PAGE_SIZE', '1000'))
+SCHEDULER_LEASE_TTL = float(os.environ.get('SCHEDULER_LEASE_TTL', '30'))
+
+REMINDER_BEFORE = float(os.environ.get('REMINDER_BEFORE_MINUTES', '60')) * 60
+NO_SHOW_AFTER = float(os.environ.get('NO_SHOW_AFTER_MINUTES', '30')) * 60
+PAYMENT_EXPIRY = float(os.environ.get('PAYMENT_EXPIRY_MINUTES', '30')) * 60
+
+SCHEDULER_TIMERS = Gauge("scheduler_timers", "Timers held in the timing wheel")
+SCHEDULER_FIRED = Counter("scheduler_fired_total", "Timers fired", ["kind", "outcome"])
+
+# Timer handler: called with the booking id
+Handler = Callable[[str], Awaitable[Any]]
+
+
+class TimingWheel:
+    """Hierarchical timing wheel.
+
+    Level 0 has `slots` buckets of `tick` seconds; each bucket of level n
+    spans a full turn of level n - 1, so `levels` levels hold timers up to
+    tick * slots ** levels seconds ahead. Adding and cancelling are O(1);
+    a timer moves down a level each time its bucket comes round, and fires
+    from level 0.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 3, now: float = None):
+        self.tick = tick
+        self.slots = slots
+        self.wheels: List[List[Dict[Hashable, Tuple[int, Any]]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self.current = int((time.time() if now is None else now) // tick)  # next tick to process
+        self.where: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self):
+        return len(self.where)
+
+    def _place(self, key: Hashable, due_tick: int, item: Any):
+        due_tick = max(due_tick, self.current)
+        delta = due_tick - self.current
+        level = 0
+        while level < len(self.wheels) - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        # Beyond the top level's range: park in the farthest bucket; it is re-placed when that comes round
+        due_slot = min(due_tick, self.current + self.slots ** len(self.wheels) - 1)
+        slot = (due_slot // self.slots ** level) % self.slots
+        self.wheels[level][slot][key] = (due_tick, item)
+        self.where[key] = (level, slot)
+
+    def add(self, key: Hashable, due: float, item: Any):
+        """Schedule `item` at time `due` (seconds); replaces a timer with the same key"""
+        self.cancel(key)
+        self._place(key, int(due // self.tick), item)
+
+    def cancel(self, key: Hashable):
+        location = self.where.pop(key, None)
+        if location is not None:
+            level, slot = location
+            self.wheels[level][slot].pop(key, None)
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Move the wheel up to `now`; returns the (key, item) of every timer that fell due"""
+        due = []
+        target = int(now // self.tick)
+        while self.current <= target:
+            # Cascade from the top: a bucket coming round at level n refills level n - 1
+            for level in range(len(self.wheels) - 1, 0, -1):
+                span = self.slots ** level
+                if self.current % span == 0:
+                    bucket = self.wheels[level][(self.current // span) % self.slots]
+                    items = list(bucket.items())
+                    bucket.clear()
+                    for key, (due_tick, item) in items:
+                        self._place(key, due_tick, item)
+            bucket = self.wheels[0][self.current % self.slots]
+            for key, (due_tick, item) in list(bucket.items()):
+                if due_tick <= self.current:
+                    del bucket[key]
+                    del self.where[key]
+                    due.append((key, item))
+            self.current += 1
+        return due
+
+
+class BookingScheduler:
+    def __init__(self, repos: Repositories, state: SharedState, handlers: Dict[str, Handler],
+                 tick: float = SCHEDULER_TICK, horizon: float = SCHEDULER_HORIZON, chunk: float = SCHEDULER_CHUNK,
+                 refill: float = SCHEDULER_REFILL, lookback: float = SCHEDULER_LOOKBACK,
+                 lease_ttl: float = SCHEDULER_LEASE_TTL):
+        """`handlers` maps "reminder", "no_show" and "payment_expiry" to coroutines taking a booking id"""
+        self.repos = repos
+        self.state = state
+        self.handlers = handlers
+        self.tick = tick
+        self.horizon = horizon
+        self.chunk = chunk
+        self.refill_interval = refill
+        self.lookback = lookback
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.wheel = TimingWheel(tick)
+        self.leader = False
+        self._next_lease = self._next_refill = 0.0
+        self._loaded_from: datetime = None
+        self._task: asyncio.Task = None
+
+    def _add(self, kind: str, booking_id: str, when: datetime):
+        if kind in self.handlers:
+            self.wheel.add((kind, booking_id), when.timestamp(), kind)
+
+    async def _scan(self, query: Callable[..., Awaitable[List[Dict]]], field: str, start: datetime,
+                    end: datetime) -> AsyncIterator[Dict]:
+        """Bookings whose `field` is in [start, end), one chunk and one page at a time"""
+        while start < end:
+            chunk_end = min(start + timedelta(seconds=self.chunk), end)
+            page_start = start
+            while True:
+                page = await query(page_start, chunk_end, limit=SCHEDULER_PAGE_SIZE)
+                for booking in page:
+                    yield booking
+                if len(page) < SCHEDULER_PAGE_SIZE:
+                    break
+                # Resume at the last value; the bookings sharing it are read again, which is harmless.
+                # A full page of one value moves on by a millisecond, the precision of BSON dates
+                last = page[-1][field]
+                page_start = last if last > page_start else page_start + timedelta(milliseconds=1)
+            start = chunk_end
+
+    async def refill(self, now: datetime):
+        """Load the timers due between the last refill (or the lookback) and the horizon"""
+        start = self._loaded_from or now - timedelta(seconds=self.lookback)
+        end = now + timedelta(seconds=self.horizon)
+        reminder, no_show = timedelta(seconds=REMINDER_BEFORE), timedelta(seconds=NO_SHOW_AFTER)
+        # Confirmed bookings whose reminder or no-show check falls in [start, end)
+        confirmed = partial(self.repos.bookings.list_starting_between, "confirmed")
+        async for booking in self._scan(confirmed, "start_at", start - no_show, end + reminder):
+            start_at = booking["start_at"]
+            if "reminded_at" not in booking and start_at - reminder < end and start_at > now:
+                self._add("reminder", booking["id"], start_at - reminder)
+            if "no_show_at" not in booking and start_at + no_show < end:
+                self._add("no_show", booking["id"], start_at + no_show)
+        # Unpaid bookings whose payment expires in [start, end)
+        expiry = timedelta(seconds=PAYMENT_EXPIRY)
+        unpaid = partial(self.repos.bookings.list_created_between, "pending_payment")
+        async for booking in self._scan(unpaid, "created_at", start - expiry, end - expiry):
+            self._add("payment_expiry", booking["id"], booking["created_at"] + expiry)
+        # Later refills overlap the previous one by a refill interval, for bookings that changed meanwhile
+        self._loaded_from = now - timedelta(seconds=self.refill_interval)
+        SCHEDULER_TIMERS.set(len(self.wheel))
+
+    async def _fire(self, key):
+        kind, booking_id = key
+        try:
+            await self.handlers[kind](booking_id)
+        except Exception:
+            SCHEDULER_FIRED.inc(kind, "error")
+            logger.exception("Scheduled %s for booking %s failed", kind, booking_id)
+        else:
+            SCHEDULER_FIRED.inc(kind, "ok")
+
+    async def _keep_lease(self, now: float):
+        leader = await self.state.acquire_lease("scheduler", self.owner, self.lease_ttl)
+        if leader != self.leader:
+            logger.info("Scheduler lease %s by %s", "taken" if leader else "lost", self.owner)
+            # A new leader starts from the database; one that lost the lease drops its timers
+            self.wheel = TimingWheel(self.tick, now=now)
+            self._loaded_from, self._next_refill = None, 0.0
+        self.leader = leader
+        self._next_lease = now + self.lease_ttl / 3
+
+    async def run_once(self, now: float = None):
+        now = time.time() if now is None else now
+        if now >= self._next_lease:
+            await self._keep_lease(now)
+        if not self.leader:
+            return
+        if now >= self._next_refill:
+            await self.refill(datetime.fromtimestamp(now, timezone.utc))
+            self._next_refill = now + self.refill_interval
+        for key, _ in self.wheel.advance(now):
+            await self._fire(key)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.leader:
+            await self.state.release_lease("scheduler", self.owner)
+            self.leader = False
@@ -0,0 +1,101 @@
+"""Text search over walker profiles and message history.
+
+MongoDB text indexes do the matching and the ranking (textScore), but not
+the language analysis: Mongo stems Spanish but has no Galician, and people
+in Lugo write both, often in the same sentence. So text is analysed here
+instead: lowercased, accents folded, the stop words of both languages
+dropped and every word reduced by a light stemmer that strips Spanish and
+Galician plurals and gender endings (perros/perras/perro -> perr,
+animais/animales -> animal, cans -> can, luces -> luz, meses -> mes).
+The resulting terms are stored in search fields whose text indexes use
+default_language "none", and queries go through the same analyze(), so
+both sides agree.
+
+Walkers carry their terms in a `search` sub-document. Messages are indexed
+in message_search, one document per participant, so that a text index
+prefixed with user_id confines a search to the user's own conversations
+(Mongo can't prefix a text index with the two fields of a message, or with
+an array of them).
+"""
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 10
+
+STOP_WORDS = frozenset("""
+    a al algo ante antes aos as ao con contra cual cuando da das de del desde do donde dos durante e el ela elas
+    ele eles ella ellas en entre era es esa ese eso esta estas este esto estos hay isto iso la las le les lle lles
+    lo los mais me mi mis muy na nas ni no non nos o os ou para pero por porque que se sen seu seus si sin sobre
+    sua suas su sus tambien te ten tu tus un una unas unha unhas uno unos uns xa y ya yo
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Plural endings, first match wins: (suffix, replacement, shortest word it applies to)
+_PLURALS = (
+    ("ciones", "cion", 7), ("cions", "cion", 6),  # accion(e)s
+    ("eses", "", 8),  # ingleses, intereses -> ingl, inter, where their singulars end up too
+    ("ces", "z", 5),  # luces, veces
+    ("ses", "s", 5),  # meses, clases
+    ("ais", "al", 6), ("eis", "el", 6), ("ois", "ol", 6), ("uis", "ul", 6),  # gl. animais, papeis (not pais)
+    ("ns", "n", 4),  # gl. cans
+)
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents (á -> a, ñ -> n, ç -> c)"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(word: str) -> str:
+    """Light Spanish/Galician stemmer: plural, then gender ending.
+
+    Works on folded words (analyze() folds the whole text first); anything
+    else is folded here, so inglés and ingles get the same stem.
+    """
+    if not word.isascii():
+        word = fold(word)
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix, replacement, shortest in _PLURALS:
+        if len(word) >= shortest and word.endswith(suffix):
+            word = word[:-len(suffix)] + replacement
+            break
+    else:
+        if len(word) >= 5 and word.endswith("es") and word[-3] in "lrndzj":  # animales, paseadores
+            word = word[:-2]
+        elif word.endswith("s") and word[-2] in "aeiou":  # perros, paseos, dias
+            word = word[:-1]
+    if (len(word) > 4 and word[-1] in "aeo") or (len(word) == 4 and word[-1] == "e"):  # perro/perra, paseadora, base
+        word = word[:-1]
+    if word.endswith("c"):  # as -ces can be the plural of -z or -ce: luz/luces, dulce/dulces
+        word = word[:-1] + "z"
+    return word
+
+
+def analyze(text: str) -> List[str]:
+    return [stem(word) for word in _TOKEN.findall(fold(text or "")) if word not in STOP_WORDS]
+
+
+def search_terms(*texts: str) -> str:
+    """Distinct terms of the texts, space separated, as stored in the text indexes"""
+    return " ".join(dict.fromkeys(term for text in texts for term in analyze(text)))
+
+
+def walker_search_fields(bio: str, specialties: Iterable[str], location: str) -> Dict[str, str]:
+    # Specialties and zone weigh more than the free-text bio (see the index in persistence.py)
+    return {"tags": search_terms(*specialties, location), "text": search_terms(bio)}
+
+
+def message_search_docs(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """message_search entries for a message: one per participant"""
+    terms = search_terms(message.get("message"))
+    fields = ("id", "sender_id", "recipient_id", "booking_id", "message", "created_at")
+    entry = {field: message.get(field) for field in fields}
+    return [
+        {"user_id": user_id, **entry, "terms": terms}
+        for user_id in dict.fromkeys((message["sender_id"], message["recipient_id"]))
+    ]
@@ -0,0 +1,35 @@
+from typing import Any
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+# Never sent to clients, whatever document or model they end up in
+SECRET_FIELDS = frozenset({"password_hash"})
+
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Returning an instance from a handler skips FastAPI's jsonable_encoder pass;
+    datetimes, dataclasses and UUIDs are encoded natively by orjson.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def strip_secrets(doc: dict) -> dict:
+    for field in SECRET_FIELDS:
+        doc.pop(field, None)
+    return doc
@@ -1,27 +1,57 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Header, Depends, Response
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Header, Depends, Response, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import functools
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal, TYPE_CHECKING
 import uuid
 from datetime import datetime, timezone, timedelta
-import jwt
-import bcrypt
 import base64
-import stripe
+import json
+
+from pymongo.errors import DuplicateKeyError
+
+from persistence import to_document, as_utc, booking_start_at, ensure_indexes, supports_transactions, transaction
+from repositories import SERVICE_TIMEZONE, SIMPLE_BOOKING_STATUSES, STAT_FIELDS, Repositories
+from serialization import FastJSONResponse, dumps, strip_secrets
+from instrumentation import QueryMetricsMiddleware, query_listener
+from metrics import render_latest
+from tracing import LatencyMiddleware, span
+from shared_state import SharedState, create_shared_state
+from ratelimit import RateLimit, email_key
+from idempotency import IdempotencyMiddleware
+from loadshed import LoadSheddingMiddleware
+from compression import CompressionMiddleware, PrecompressedCache
+from loop_monitor import LOOP_BLOCK_ASSERT_MS, loop_monitor
+from walk_state import ROUTE_ORDER, ActiveWalkStore
+from exports import MEDIA_TYPES, date_filter, export_stream
+from search import SEARCH_MAX_PAGES, SEARCH_PAGE_SIZE, message_search_docs, search_terms, walker_search_fields
+from notifications import NotificationDispatcher, build_adapters, outbox_events
+from scheduler import BookingScheduler
+
+# motor, httpx, bcrypt, jwt and stripe are imported where they are first used,
+# which keeps worker cold starts short (see benchmarks/bench_startup.py)
+if TYPE_CHECKING:
+    import httpx
+    from motor.motor_asyncio import AsyncIOMotorClient
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Per worker process; keep MONGO_MAX_POOL_SIZE * workers within what the server accepts
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
 
 # Environment
 JWT_SECRET = os.environ.get('JWT_SECRET')
@@ -30,26 +60,44 @@ GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:8001')
 # EMERGENT_AUTH_URL = os.environ.get('EMERGENT_AUTH_URL', 'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data')
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+# Threads for blocking library calls (bcrypt, Stripe SDK)
+BLOCKING_POOL_SIZE = int(os.environ.get('BLOCKING_POOL_SIZE', str(min(32, (os.cpu_count() or 1) + 4))))
+# "memory" for a single process, "mongo" when running several workers
+SHARED_STATE_BACKEND = os.environ.get('SHARED_STATE_BACKEND', 'memory')
+
+# Resources, opened and closed by the app lifespan (see create_app)
+client: Optional["AsyncIOMotorClient"] = None
+db = None
+repos: Optional[Repositories] = None
+http_client: Optional["httpx.AsyncClient"] = None
+blocking_pool: Optional[ThreadPoolExecutor] = None
+shared_state: Optional[SharedState] = None
+walk_store: Optional[ActiveWalkStore] = None
+dispatcher: Optional[NotificationDispatcher] = None
+scheduler: Optional[BookingScheduler] = None
+
+# Compressed bodies of completed walks, per worker
+precompressed = PrecompressedCache()
 
-# Create the main app
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer(auto_error=False)
 
 # ============ MODELS ============
 
-class User(BaseModel):
+class UserPublic(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: str
     name: str
     picture: Optional[str] = None
-    role: str = "owner"  # owner or walker
-    password_hash: Optional[str] = None
+    role: str = "owner"  # owner, walker or admin (admins are set in the database)
     phone: Optional[str] = None
     address: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class User(UserPublic):
+    password_hash: Optional[str] = None
+
 class UserSession(BaseModel):
     model_config = ConfigDict(extra="ignore")
     session_token: str
@@ -64,7 +112,8 @@ class Walker(BaseModel):
     bio: str
     specialties: List[str] = []
     experience_years: int = 0
-    rating: float = 4.9
+    rating: float = 4.9  # shown until the first review
+    rating_sum: int = 0
     reviews_count: int = 0
     availability: str = "Disponible hoy"
     location: str = "Centro de Lugo"
@@ -99,12 +148,16 @@ class Booking(BaseModel):
     amount: float
     location: Optional[str] = None
     notes: Optional[str] = None
+    start_at: Optional[datetime] = None  # typed date + time, UTC
+    walker_user_id: Optional[str] = None  # the walker's user id (walker_id is the profile), for access checks
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Walk(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     booking_id: str
+    owner_user_id: Optional[str] = None  # copied from the booking, for access checks
+    walker_user_id: Optional[str] = None
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     route_data: List[Dict[str, float]] = []  # [{lat, lng, timestamp}]
@@ -147,6 +200,88 @@ class Message(BaseModel):
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class Review(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    booking_id: str
+    walker_id: str
+    owner_id: str
+    rating: int  # 1-5
+    comment: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+# ============ RESPONSE MODELS ============
+# Declared for the OpenAPI schema; handlers return FastJSONResponse directly,
+# so responses are not re-validated against them.
+
+class AuthResponse(BaseModel):
+    token: str
+    user: UserPublic
+
+class WalkerOut(Walker):
+    user_name: Optional[str] = None
+    user_email: Optional[str] = None
+    user_picture: Optional[str] = None
+
+class BookingOut(Booking):
+    walker_name: Optional[str] = None
+    dog_name: Optional[str] = None
+
+class MessageOut(Message):
+    sender_name: Optional[str] = None
+    recipient_name: Optional[str] = None
+    sender_picture: Optional[str] = None
+    recipient_picture: Optional[str] = None
+
+class ReviewOut(Review):
+    owner_name: Optional[str] = None
+
+class WalkSyncOut(BaseModel):
+    walk: Walk
+    applied: List[str]
+    skipped: List[str]
+
+class ActiveWalkOut(BaseModel):
+    booking_id: str
+    status: str
+    start_time: Optional[datetime] = None
+    last_position: Optional[Dict[str, float]] = None
+
+class PeriodStatsOut(BaseModel):
+    booked: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    earnings: float = 0.0
+    completion_rate: Optional[float] = None
+
+class ScheduledWalkOut(BaseModel):
+    id: str
+    date: str
+    time: str
+    start_at: Optional[datetime] = None
+    duration: int
+    service_type: str
+    status: str
+    amount: float
+    location: Optional[str] = None
+    notes: Optional[str] = None
+    dog_name: Optional[str] = None
+    owner_name: Optional[str] = None
+
+class WalkerDashboardOut(BaseModel):
+    walker_id: str
+    today: List[ScheduledWalkOut]
+    week: List[ScheduledWalkOut]
+    upcoming: List[ScheduledWalkOut]
+    stats: Dict[str, PeriodStatsOut]
+
+class DashboardOut(BaseModel):
+    user: UserPublic
+    dogs: List[Dog]
+    upcoming_bookings: List[BookingOut]
+    active_walk: Optional[ActiveWalkOut] = None
+    unread_count: int
+
 # ============ INPUT MODELS ============
 
 class RegisterInput(BaseModel):
@@ -188,6 +323,17 @@ class UpdateWalkInput(BaseModel):
     route_point: Optional[Dict[str, float]] = None
     report_text: Optional[str] = None
 
+class WalkSyncOperation(BaseModel):
+    op_id: str  # generated by the app, unique per booking
+    type: Literal["start", "update", "photo", "complete"]
+    at: Optional[float] = None  # when it happened on the device, epoch seconds
+    route_point: Optional[Dict[str, float]] = None
+    report_text: Optional[str] = None
+    photo: Optional[str] = None
+
+class WalkSyncInput(BaseModel):
+    operations: List[WalkSyncOperation] = Field(max_length=5000)
+
 class CreateCheckoutInput(BaseModel):
     booking_id: str
     origin_url: str
@@ -197,17 +343,24 @@ class CreateMessageInput(BaseModel):
     message: str
     booking_id: Optional[str] = None
 
+class CreateReviewInput(BaseModel):
+    rating: int = Field(ge=1, le=5)
+    comment: Optional[str] = None
+
 class SimpleBookingInput(BaseModel):
     service_type: str
     date: str
     time: str
     contact: Dict[str, Any]
     pet_details: Optional[str] = None
-    status: str = "pending"
+
+class SimpleBookingStatusInput(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=500)
+    status: Literal["confirmed", "completed", "cancelled"]
 
 # ============ HELPER FUNCTIONS ============
 
-async def get_current_user(authorization: Optional[str] = Header(None), cookie_session: Optional[str] = None) -> Optional[User]:
+async def get_current_user(authorization: Optional[str] = Header(None), cookie_session: Optional[str] = None) -> Optional[UserPublic]:
     """Get current user from session token (cookie or header)"""
     token = None
     
@@ -221,38 +374,65 @@ async def get_current_user(authorization: Optional[str] = Header(None), cookie_s
     if not token:
         return None
     
-    # Check in user_sessions
-    session = await db.user_sessions.find_one({"session_token": token})
-    if session:
-        # Check expiration
-        expires_at = session['expires_at']
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-        if expires_at < datetime.now(timezone.utc):
-            return None
-        # Get user
-        user_doc = await db.users.find_one({"id": session['user_id']}, {"_id": 0})
-        if user_doc:
-            return User(**user_doc)
+    with span("auth"):
+        # Check in user_sessions
+        session = await repos.sessions.get(token)
+        if session:
+            # Check expiration
+            if as_utc(session['expires_at']) < datetime.now(timezone.utc):
+                return None
+            # Get user
+            user_doc = await repos.users.get(session['user_id'])
+            if user_doc:
+                # Trusted DB data without secrets, no need to validate again
+                return UserPublic.model_construct(**user_doc)
     
     return None
 
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the worker pool instead of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_pool, functools.partial(fn, *args, **kwargs))
+
 def hash_password(password: str) -> str:
+    import bcrypt
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
+    import bcrypt
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 def create_jwt_token(user_id: str) -> str:
+    import jwt
     payload = {
         "user_id": user_id,
+        # Unique per session even for logins within the same second
+        "jti": uuid.uuid4().hex,
         "exp": datetime.now(timezone.utc) + timedelta(days=7)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
+def get_stripe():
+    """The Stripe SDK, imported on the first payment request"""
+    import stripe
+    stripe.api_key = STRIPE_API_KEY
+    return stripe
+
+# ============ RATE LIMITS ============
+
+# Polls are sized for the app's timers plus retries and keyed by user, after
+# the session has been verified. Login is sized for a person typing a
+# password and keyed by the email tried; auth_ip_limit caps what one IP can
+# try across emails and registrations.
+auth_ip_limit = RateLimit("auth_ip", rate=30 / 60, burst=30, store=lambda: shared_state)
+login_limit = RateLimit("login", rate=10 / 60, burst=10, store=lambda: shared_state)
+booking_poll_limit = RateLimit("booking_poll", rate=1, burst=20, store=lambda: shared_state)
+walk_poll_limit = RateLimit("walk_poll", rate=1, burst=20, store=lambda: shared_state)
+unread_poll_limit = RateLimit("unread_poll", rate=0.5, burst=10, store=lambda: shared_state)
+
 # ============ AUTH ROUTES ============
 
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", response_model=AuthResponse, dependencies=[Depends(auth_ip_limit)])
 async def register(input: RegisterInput):
     # SOLO PERMITIR REGISTRO COMO CLIENTE
     if input.role == "walker":
@@ -262,8 +442,7 @@ async def register(input: RegisterInput):
     input.role = "owner"
     
     # Check if user exists
-    existing = await db.users.find_one({"email": input.email})
-    if existing:
+    if await repos.users.email_exists(input.email):
         raise HTTPException(400, "Email already registered")
     
     # Create user
@@ -271,12 +450,11 @@ async def register(input: RegisterInput):
         email=input.email,
         name=input.name,
         role=input.role,
-        password_hash=hash_password(input.password)
+        password_hash=await run_blocking(hash_password, input.password)
     )
     
-    doc = user.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.users.insert_one(doc)
+    user_doc = to_document(user)
+    await repos.users.insert(user_doc)
     
     # Create session
     token = create_jwt_token(user.id)
@@ -286,54 +464,48 @@ async def register(input: RegisterInput):
         expires_at=datetime.now(timezone.utc) + timedelta(days=7)
     )
     
-    session_doc = session.model_dump()
-    session_doc['created_at'] = session_doc['created_at'].isoformat()
-    session_doc['expires_at'] = session_doc['expires_at'].isoformat()
-    await db.user_sessions.insert_one(session_doc)
+    await repos.sessions.insert(to_document(session))
     
-    return {"token": token, "user": user.model_dump()}
+    return FastJSONResponse({"token": token, "user": strip_secrets(user_doc)})
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", response_model=AuthResponse, dependencies=[Depends(auth_ip_limit)])
 async def login(input: LoginInput):
+    await login_limit.take(email_key(input.email))
+    
     # Find user
-    user_doc = await db.users.find_one({"email": input.email}, {"_id": 0})
+    user_doc = await repos.users.get_credentials(input.email)
     if not user_doc:
         raise HTTPException(401, "Invalid credentials")
     
     # Verify password
-    if not verify_password(input.password, user_doc['password_hash']):
+    if not await run_blocking(verify_password, input.password, user_doc['password_hash']):
         raise HTTPException(401, "Invalid credentials")
     
-    user = User(**user_doc)
-    
     # Create session
-    token = create_jwt_token(user.id)
+    token = create_jwt_token(user_doc['id'])
     session = UserSession(
         session_token=token,
-        user_id=user.id,
+        user_id=user_doc['id'],
         expires_at=datetime.now(timezone.utc) + timedelta(days=7)
     )
     
-    session_doc = session.model_dump()
-    session_doc['created_at'] = session_doc['created_at'].isoformat()
-    session_doc['expires_at'] = session_doc['expires_at'].isoformat()
-    await db.user_sessions.insert_one(session_doc)
+    await repos.sessions.insert(to_document(session))
     
-    return {"token": token, "user": user.model_dump()}
+    return FastJSONResponse({"token": token, "user": strip_secrets(user_doc)})
 
-@api_router.get("/auth/me")
+@api_router.get("/auth/me", response_model=UserPublic)
 async def get_me(authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
-    return user.model_dump()
+    return FastJSONResponse(user.model_dump())
 
 class UpdateProfileInput(BaseModel):
     name: Optional[str] = None
     phone: Optional[str] = None
     address: Optional[str] = None
 
-@api_router.patch("/auth/me")
+@api_router.patch("/auth/me", response_model=UserPublic)
 async def update_profile(input: UpdateProfileInput, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
@@ -349,11 +521,11 @@ async def update_profile(input: UpdateProfileInput, authorization: Optional[str]
         update_data['address'] = input.address
     
     if update_data:
-        await db.users.update_one({"id": user.id}, {"$set": update_data})
+        await repos.users.update(user.id, update_data)
     
     # Return updated user
-    user_doc = await db.users.find_one({"id": user.id}, {"_id": 0})
-    return User(**user_doc).model_dump()
+    user_doc = await repos.users.get(user.id)
+    return FastJSONResponse(user_doc)
 
 @api_router.post("/auth/session")
 # async def create_session_from_emergent(session_id: str = Header(None, alias="X-Session-ID"), response: Response = None):
@@ -426,7 +598,7 @@ async def logout(authorization: Optional[str] = Header(None), response: Response
         # Delete session
         token = authorization.replace('Bearer ', '') if authorization else None
         if token:
-            await db.user_sessions.delete_one({"session_token": token})
+            await repos.sessions.delete(token)
     
     # Clear cookie
     response.delete_cookie(key="session_token", path="/")
@@ -434,44 +606,64 @@ async def logout(authorization: Optional[str] = Header(None), response: Response
 
 # ============ WALKERS ROUTES ============
 
-@api_router.get("/walkers")
-async def get_walkers(location: Optional[str] = None, specialty: Optional[str] = None):
-    query = {}
-    walkers_docs = await db.walkers.find(query, {"_id": 0}).to_list(100)
+@api_router.get("/walkers", response_model=List[WalkerOut])
+async def get_walkers(location: Optional[str] = None, specialty: Optional[str] = None, sort: Optional[str] = None):
+    # rating is maintained on every review, so sorting is a plain indexed read
+    walkers_docs = await repos.walkers.list(100, sort_by_rating=sort == "rating")
+    
+    # Get user data for all walkers in one query
+    users = await repos.users.get_summaries(w['user_id'] for w in walkers_docs)
+    for walker in walkers_docs:
+        user_doc = users.get(walker['user_id'])
+        if user_doc:
+            walker['user_name'] = user_doc['name']
+            walker['user_picture'] = user_doc.get('picture')
+    
+    return FastJSONResponse(walkers_docs)
+
+@api_router.get("/walkers/search")
+async def search_walkers(q: str = Query(min_length=1, max_length=200),
+                         page: int = Query(1, ge=1, le=SEARCH_MAX_PAGES)):
+    """Walkers whose specialties, zone or bio match `q`, best match first"""
+    terms = search_terms(q)
+    walkers_docs = []
+    if terms:
+        walkers_docs = await repos.walkers.search(terms, (page - 1) * SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE + 1)
+    has_more = len(walkers_docs) > SEARCH_PAGE_SIZE
+    walkers_docs = walkers_docs[:SEARCH_PAGE_SIZE]
     
-    # Get user data for each walker
+    users = await repos.users.get_summaries(w['user_id'] for w in walkers_docs)
     for walker in walkers_docs:
-        user_doc = await db.users.find_one({"id": walker['user_id']}, {"_id": 0})
+        user_doc = users.get(walker['user_id'])
         if user_doc:
             walker['user_name'] = user_doc['name']
             walker['user_picture'] = user_doc.get('picture')
     
-    return walkers_docs
+    return FastJSONResponse({"items": walkers_docs, "page": page, "has_more": has_more})
 
-@api_router.get("/walkers/{walker_id}")
+@api_router.get("/walkers/{walker_id}", response_model=WalkerOut)
 async def get_walker(walker_id: str):
-    walker_doc = await db.walkers.find_one({"id": walker_id}, {"_id": 0})
+    walker_doc = await repos.walkers.get(walker_id)
     if not walker_doc:
         raise HTTPException(404, "Walker not found")
     
     # Get user data
-    user_doc = await db.users.find_one({"id": walker_doc['user_id']}, {"_id": 0})
+    user_doc = await repos.users.get_contact(walker_doc['user_id'])
     if user_doc:
         walker_doc['user_name'] = user_doc['name']
         walker_doc['user_email'] = user_doc['email']
         walker_doc['user_picture'] = user_doc.get('picture')
     
-    return walker_doc
+    return FastJSONResponse(walker_doc)
 
-@api_router.post("/walkers")
+@api_router.post("/walkers", response_model=Walker)
 async def create_walker(input: CreateWalkerInput, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
     
     # Check if walker profile exists
-    existing = await db.walkers.find_one({"user_id": user.id})
-    if existing:
+    if await repos.walkers.exists_for_user(user.id):
         raise HTTPException(400, "Walker profile already exists")
     
     walker = Walker(
@@ -483,27 +675,26 @@ async def create_walker(input: CreateWalkerInput, authorization: Optional[str] =
         price_from=input.price_from
     )
     
-    doc = walker.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.walkers.insert_one(doc)
+    doc = to_document(walker)
+    await repos.walkers.insert({**doc, "search": walker_search_fields(walker.bio, walker.specialties, walker.location)})
     
     # Update user role
-    await db.users.update_one({"id": user.id}, {"$set": {"role": "walker"}})
+    await repos.users.update(user.id, {"role": "walker"})
     
-    return walker.model_dump()
+    return FastJSONResponse(doc)
 
 # ============ DOGS ROUTES ============
 
-@api_router.get("/dogs")
+@api_router.get("/dogs", response_model=List[Dog])
 async def get_my_dogs(authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
     
-    dogs = await db.dogs.find({"owner_id": user.id}, {"_id": 0}).to_list(100)
-    return dogs
+    dogs = await repos.dogs.list_for_owner(user.id)
+    return FastJSONResponse(dogs)
 
-@api_router.post("/dogs")
+@api_router.post("/dogs", response_model=Dog)
 async def create_dog(input: CreateDogInput, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
@@ -518,44 +709,133 @@ async def create_dog(input: CreateDogInput, authorization: Optional[str] = Heade
         special_needs=input.special_needs
     )
     
-    doc = dog.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.dogs.insert_one(doc)
+    doc = to_document(dog)
+    await repos.dogs.insert(doc)
     
-    return dog.model_dump()
+    return FastJSONResponse(doc)
+
+# ============ ACCESS CHECKS ============
+
+def _parties(owner_user_id: Optional[str], walker_user_id: Optional[str]) -> Optional[Dict[str, str]]:
+    if not owner_user_id or not walker_user_id:
+        return None
+    return {"owner": owner_user_id, "walker": walker_user_id}
+
+async def _booking_parties(booking_id: str) -> Optional[Dict[str, str]]:
+    booking = await repos.bookings.get_fields(booking_id, "owner_id", "walker_id", "walker_user_id")
+    if not booking:
+        booking = await repos.bookings_archive.get(booking_id)
+    if not booking:
+        return None
+    # Bookings from before walker_user_id existed (tools/backfill_access_fields.py) need the walker profile
+    walker_user_id = booking.get('walker_user_id') or await repos.walkers.get_user_id(booking['walker_id'])
+    return _parties(booking['owner_id'], walker_user_id)
+
+async def authorize_booking(request: Request, user: UserPublic, booking_id: str,
+                            roles=("owner", "walker"), parties: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Require `user` to be the booking's owner or walker (as allowed by `roles`).
+
+    Pass `parties` when the handler already read a document carrying
+    owner_user_id/walker_user_id; otherwise the booking is read once and the
+    answer cached for the rest of the request. Returns {"owner": ..., "walker": ...}.
+    """
+    cache = getattr(request.state, "booking_parties", None)
+    if cache is None:
+        cache = request.state.booking_parties = {}
+    if parties is None:
+        parties = cache.get(booking_id)
+    if parties is None:
+        parties = await _booking_parties(booking_id)
+        if parties is None:
+            raise HTTPException(404, "Booking not found")
+    cache[booking_id] = parties
+    if not any(parties[role] == user.id for role in roles):
+        raise HTTPException(403, "Not authorized")
+    return parties
 
 # ============ BOOKINGS ROUTES ============
 
-@api_router.get("/bookings")
+# Status changes users are told about: notification kind, and who gets it
+STATUS_NOTIFICATIONS = {
+    "confirmed": ("booking_confirmed", ("owner_id", "walker_user_id")),
+    "in_progress": ("walk_started", ("owner_id",)),
+    "completed": ("walk_completed", ("owner_id",)),
+    "cancelled": ("booking_cancelled", ("owner_id", "walker_user_id")),
+}
+
+async def set_booking_status(booking_id: str, status: str, expected: Optional[str] = None, **fields) -> bool:
+    """Move a booking to `status`, keeping the walker rollups in step.
+
+    Every status change goes through here. Returns False when the booking
+    does not exist or already had that status (or not the `expected` one), so
+    repeats are not counted twice. The change, the rollups and the outbox
+    notification commit together.
+    """
+    async def apply():
+        before = await repos.bookings.transition(booking_id, status, fields, expected)
+        if before is None:
+            return False
+        if status == "cancelled":
+            # walker_stats only counts cancellations of confirmed or started walks
+            await repos.bookings.update(booking_id, {"cancelled_from": before['status']})
+        await repos.walker_stats.record_transition(before, status)
+        if status in STATUS_NOTIFICATIONS:
+            kind, parties = STATUS_NOTIFICATIONS[status]
+            await repos.outbox.add(outbox_events(kind, (before.get(party) for party in parties), dispatcher.channels,
+                                                 booking_id=booking_id, date=before.get('date'), time=before.get('time')))
+        return True
+
+    if not await transaction(client, apply):
+        return False
+    dispatcher.wake()
+    return True
+
+async def enrich_bookings(bookings: List[Dict]):
+    """Add walker_name and dog_name in place, one query per collection"""
+    walker_user_ids, dog_names = await asyncio.gather(
+        repos.walkers.get_user_ids(b['walker_id'] for b in bookings),
+        repos.dogs.get_names(b['dog_id'] for b in bookings),
+    )
+    walker_users = await repos.users.get_summaries(walker_user_ids.values())
+    for booking in bookings:
+        if booking['walker_id'] in walker_user_ids:
+            user_doc = walker_users.get(walker_user_ids[booking['walker_id']])
+            booking['walker_name'] = user_doc['name'] if user_doc else "Unknown"
+        
+        if booking['dog_id'] in dog_names:
+            booking['dog_name'] = dog_names[booking['dog_id']]
+
+@api_router.get("/bookings", response_model=List[BookingOut])
 async def get_my_bookings(authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
     
+    limit = 100
     if user.role == "owner":
-        bookings = await db.bookings.find({"owner_id": user.id}, {"_id": 0}).to_list(100)
+        bookings = await repos.bookings.list_for_owner(user.id, limit)
+        if len(bookings) < limit:
+            bookings += await repos.bookings_archive.list_for_owner(user.id, limit - len(bookings))
     else:
-        bookings = await db.bookings.find({"walker_id": user.id}, {"_id": 0}).to_list(100)
-    
-    # Enrich with walker/dog data
-    for booking in bookings:
-        walker_doc = await db.walkers.find_one({"id": booking['walker_id']}, {"_id": 0})
-        if walker_doc:
-            user_doc = await db.users.find_one({"id": walker_doc['user_id']}, {"_id": 0})
-            booking['walker_name'] = user_doc['name'] if user_doc else "Unknown"
-        
-        dog_doc = await db.dogs.find_one({"id": booking['dog_id']}, {"_id": 0})
-        if dog_doc:
-            booking['dog_name'] = dog_doc['name']
+        # Bookings reference the walker profile, not the user
+        walker_id = await repos.walkers.get_id_for_user(user.id)
+        bookings = await repos.bookings.list_for_walker(walker_id, limit) if walker_id else []
+        if walker_id and len(bookings) < limit:
+            bookings += await repos.bookings_archive.list_for_walker(walker_id, limit - len(bookings))
     
-    return bookings
+    await enrich_bookings(bookings)
+    return FastJSONResponse(bookings)
 
-@api_router.post("/bookings")
+@api_router.post("/bookings", response_model=Booking)
 async def create_booking(input: CreateBookingInput, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
     
+    walker_user_id = await repos.walkers.get_user_id(input.walker_id)
+    if not walker_user_id:
+        raise HTTPException(404, "Walker not found")
+    
     booking = Booking(
         owner_id=user.id,
         walker_id=input.walker_id,
@@ -567,32 +847,33 @@ async def create_booking(input: CreateBookingInput, authorization: Optional[str]
         amount=input.amount,
         location=input.location,
         notes=input.notes,
+        start_at=booking_start_at(input.date, input.time),
+        walker_user_id=walker_user_id,
         status="pending_payment"
     )
     
-    doc = booking.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.bookings.insert_one(doc)
+    doc = to_document(booking)
+    await repos.bookings.insert(doc)
+    await repos.walker_stats.record(doc['walker_id'], doc['start_at'], booked=1)
     
-    return booking.model_dump()
+    return FastJSONResponse(doc)
 
-@api_router.get("/bookings/{booking_id}")
-async def get_booking(booking_id: str, authorization: Optional[str] = Header(None)):
+@api_router.get("/bookings/{booking_id}", response_model=Booking)
+async def get_booking(booking_id: str, request: Request, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    await booking_poll_limit.take(f"user:{user.id}")
     
-    booking = await db.bookings.find_one({"id": booking_id}, {"_id": 0})
+    booking = await repos.bookings.get(booking_id) or await repos.bookings_archive.get(booking_id)
     if not booking:
         raise HTTPException(404, "Booking not found")
     
-    # Check authorization
-    if booking['owner_id'] != user.id:
-        walker = await db.walkers.find_one({"id": booking['walker_id']})
-        if not walker or walker['user_id'] != user.id:
-            raise HTTPException(403, "Not authorized")
+    # The booking carries both parties; no second read
+    await authorize_booking(request, user, booking_id,
+                            parties=_parties(booking['owner_id'], booking.get('walker_user_id')))
     
-    return booking
+    return FastJSONResponse(booking)
 
 @api_router.patch("/bookings/{booking_id}/cancel")
 async def cancel_booking(booking_id: str, authorization: Optional[str] = Header(None)):
@@ -600,18 +881,17 @@ async def cancel_booking(booking_id: str, authorization: Optional[str] = Header(
     if not user:
         raise HTTPException(401, "Not authenticated")
     
-    booking = await db.bookings.find_one({"id": booking_id})
+    booking = await repos.bookings.get_fields(booking_id, "owner_id", "amount", "date", "time", "start_at")
     if not booking:
         raise HTTPException(404, "Booking not found")
     
     if booking['owner_id'] != user.id:
         raise HTTPException(403, "Not authorized")
     
-    # Parse booking date and time
-    from datetime import datetime, timezone, timedelta
-    booking_datetime_str = f"{booking['date']} {booking['time']}"
-    booking_datetime = datetime.strptime(booking_datetime_str, "%Y-%m-%d %H:%M")
-    booking_datetime = booking_datetime.replace(tzinfo=timezone.utc)
+    # Bookings created before start_at existed still need their strings parsed
+    booking_datetime = as_utc(booking.get('start_at')) or booking_start_at(booking['date'], booking['time'])
+    if booking_datetime is None:
+        raise HTTPException(400, "Booking has an invalid date or time")
     
     now = datetime.now(timezone.utc)
     time_until_booking = booking_datetime - now
@@ -633,14 +913,11 @@ async def cancel_booking(booking_id: str, authorization: Optional[str] = Header(
         refund_description = f"Sin reembolso. Cancelación con menos de 2 horas de antelación. Se cobra el importe completo ({amount}€)."
     
     # Update booking status
-    await db.bookings.update_one(
-        {"id": booking_id},
-        {"$set": {
-            "status": "cancelled",
-            "cancelled_at": datetime.now(timezone.utc).isoformat(),
-            "refund_amount": refund_amount,
-            "refund_description": refund_description,
-        }}
+    await set_booking_status(
+        booking_id, "cancelled",
+        cancelled_at=datetime.now(timezone.utc),
+        refund_amount=refund_amount,
+        refund_description=refund_description,
     )
     
     return {
@@ -650,132 +927,377 @@ async def cancel_booking(booking_id: str, authorization: Optional[str] = Header(
         "hours_until_booking": hours_until_booking,
     }
 
-# ============ WALKS ROUTES ============
+# ============ REVIEWS ROUTES ============
 
-@api_router.get("/walks/{booking_id}")
-async def get_walk(booking_id: str):
-    walk = await db.walks.find_one({"booking_id": booking_id}, {"_id": 0})
+@api_router.post("/bookings/{booking_id}/review", response_model=Review)
+async def create_review(booking_id: str, input: CreateReviewInput, authorization: Optional[str] = Header(None)):
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    
+    booking = await repos.bookings.get_fields(booking_id, "owner_id", "walker_id", "status")
+    if not booking:
+        raise HTTPException(404, "Booking not found")
+    if booking['owner_id'] != user.id:
+        raise HTTPException(403, "Not authorized")
+    if booking['status'] != "completed":
+        raise HTTPException(400, "Only completed walks can be reviewed")
+    
+    review = Review(
+        booking_id=booking_id,
+        walker_id=booking['walker_id'],
+        owner_id=user.id,
+        rating=input.rating,
+        comment=input.comment
+    )
+    doc = to_document(review)
+    try:
+        await repos.reviews.insert(doc)
+    except DuplicateKeyError:
+        raise HTTPException(409, "Booking already reviewed")
+    await repos.walkers.add_rating(booking['walker_id'], input.rating)
+    
+    return FastJSONResponse(doc)
+
+@api_router.get("/walkers/{walker_id}/reviews", response_model=List[ReviewOut])
+async def get_walker_reviews(walker_id: str):
+    reviews = await repos.reviews.list_for_walker(walker_id)
+    owners = await repos.users.get_summaries(r['owner_id'] for r in reviews)
+    for review in reviews:
+        owner_doc = owners.get(review['owner_id'])
+        review['owner_name'] = owner_doc['name'] if owner_doc else None
+    return FastJSONResponse(reviews)
+
+# ============ DASHBOARD ROUTES ============
+
+async def _upcoming_bookings(owner_id: str) -> List[Dict]:
+    bookings = await repos.bookings.list_upcoming_for_owner(owner_id, datetime.now(timezone.utc))
+    await enrich_bookings(bookings)
+    return bookings
+
+async def _active_walk(owner_id: str) -> Optional[Dict]:
+    booking_id = await repos.bookings.get_in_progress_id(owner_id)
+    if not booking_id:
+        return None
+    walk = await repos.walks.get_status(booking_id)
     if not walk:
-        # Create walk if doesn't exist
-        walk_obj = Walk(booking_id=booking_id)
-        doc = walk_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.walks.insert_one(doc)
-        return walk_obj.model_dump()
+        return None
+    route = walk.pop('route_data', None)
+    walk['last_position'] = route[-1] if route else None
     return walk
 
+@api_router.get("/dashboard", response_model=DashboardOut)
+async def get_dashboard(authorization: Optional[str] = Header(None)):
+    """Everything the owner screens show, for one auth check and one round trip"""
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    if user.role != "owner":
+        raise HTTPException(403, "Dashboard is for owners")
+    
+    dogs, upcoming, active_walk, unread = await asyncio.gather(
+        repos.dogs.list_for_owner(user.id),
+        _upcoming_bookings(user.id),
+        _active_walk(user.id),
+        repos.messages.count_unread(user.id),
+    )
+    return FastJSONResponse({
+        "user": user,
+        "dogs": dogs,
+        "upcoming_bookings": upcoming,
+        "active_walk": active_walk,
+        "unread_count": unread,
+    })
+
+def _with_completion_rate(stats: Dict) -> Dict:
+    stats = {field: stats.get(field, 0) for field in STAT_FIELDS}
+    finished = stats['completed'] + stats['cancelled']
+    stats['completion_rate'] = stats['completed'] / finished if finished else None
+    return stats
+
+@api_router.get("/walkers/me/dashboard", response_model=WalkerDashboardOut)
+async def get_walker_dashboard(authorization: Optional[str] = Header(None)):
+    """Schedule, upcoming walks and earnings for the signed-in walker"""
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    walker_id = await repos.walkers.get_id_for_user(user.id)
+    if not walker_id:
+        raise HTTPException(404, "Walker profile not found")
+    
+    now = datetime.now(timezone.utc)
+    # Days and weeks start at midnight in Lugo, like the walker_stats buckets
+    today = now.astimezone(SERVICE_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today - timedelta(days=today.weekday())
+    schedule, stats = await asyncio.gather(
+        repos.bookings.walker_schedule(walker_id, week_start, week_start + timedelta(days=7), now),
+        repos.walker_stats.get(walker_id, now),
+    )
+    tomorrow = today + timedelta(days=1)
+    return FastJSONResponse({
+        "walker_id": walker_id,
+        "today": [b for b in schedule['week'] if today <= b['start_at'] < tomorrow],
+        "week": schedule['week'],
+        "upcoming": schedule['upcoming'],
+        "stats": {period: _with_completion_rate(values) for period, values in stats.items()},
+    })
+
+# ============ WALKS ROUTES ============
+
+@api_router.get("/walks/{booking_id}", response_model=Walk)
+async def get_walk(booking_id: str, request: Request, authorization: Optional[str] = Header(None)):
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    await walk_poll_limit.take(f"user:{user.id}")
+    
+    # Walks in progress on this worker are served from memory
+    walk = walk_store.get(booking_id)
+    if walk is None:
+        walk = await repos.walks.get(booking_id) or await repos.walks_archive.get(booking_id)
+    if walk is not None:
+        await authorize_booking(request, user, booking_id,
+                                parties=_parties(walk.get('owner_user_id'), walk.get('walker_user_id')))
+        if walk.get('status') == "completed":
+            # Final (archived walks included): compressed once per worker, then served from memory or as a 304
+            return await precompressed.response(request, dumps(walk), run_blocking)
+        return FastJSONResponse(walk)
+    
+    # Create walk if doesn't exist
+    parties = await authorize_booking(request, user, booking_id)
+    walk = await repos.walks.get_or_create(
+        to_document(Walk(booking_id=booking_id, owner_user_id=parties['owner'], walker_user_id=parties['walker'])))
+    return FastJSONResponse(walk)
+
 @api_router.post("/walks/{booking_id}/start")
-async def start_walk(booking_id: str, authorization: Optional[str] = Header(None)):
+async def start_walk(booking_id: str, request: Request, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    parties = await authorize_booking(request, user, booking_id, roles=("walker",))
     
     # Update walk
-    walk = await db.walks.find_one({"booking_id": booking_id})
-    if not walk:
-        walk_obj = Walk(booking_id=booking_id, status="in_progress", start_time=datetime.now(timezone.utc))
-        doc = walk_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        doc['start_time'] = doc['start_time'].isoformat()
-        await db.walks.insert_one(doc)
-    else:
-        await db.walks.update_one(
-            {"booking_id": booking_id},
-            {"$set": {"status": "in_progress", "start_time": datetime.now(timezone.utc).isoformat()}}
-        )
+    fields = {"status": "in_progress", "start_time": datetime.now(timezone.utc),
+              "owner_user_id": parties['owner'], "walker_user_id": parties['walker']}
+    defaults = to_document(Walk(booking_id=booking_id, **fields))
+    # One upsert, so a concurrent start or poll creating the walk can't collide with it
+    await repos.walks.apply(booking_id, {"$set": fields,
+                                         "$setOnInsert": {k: v for k, v in defaults.items() if k not in fields}})
     
     # Update booking
-    await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "in_progress"}})
+    await set_booking_status(booking_id, "in_progress")
+    await walk_store.track(booking_id)
     
     return {"message": "Walk started"}
 
 @api_router.post("/walks/{booking_id}/update")
-async def update_walk(booking_id: str, input: UpdateWalkInput, authorization: Optional[str] = Header(None)):
+async def update_walk(booking_id: str, input: UpdateWalkInput, request: Request, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    # Hot path: the walk in progress, which the fix is buffered into anyway, answers the check
+    live = await walk_store.track(booking_id)
+    await authorize_booking(request, user, booking_id, roles=("walker",),
+                            parties=_parties(live.doc.get('owner_user_id'), live.doc.get('walker_user_id')) if live else None)
     
     update_data = {}
+    synced_until = None
     if input.route_point:
-        # Add route point
-        await db.walks.update_one(
-            {"booking_id": booking_id},
-            {"$push": {"route_data": input.route_point}}
-        )
+        # Buffered while the walk is in progress, written through otherwise
+        walk = await walk_store.add_point(booking_id, input.route_point)
+        if walk is None:
+            await repos.walks.push(booking_id, "route_data", input.route_point)
+            synced_until = input.route_point.get('timestamp')
+        else:
+            synced_until = walk.synced_until
     if input.report_text:
         update_data['report_text'] = input.report_text
     
     if update_data:
-        await db.walks.update_one({"booking_id": booking_id}, {"$set": update_data})
+        await repos.walks.update(booking_id, update_data)
+        await walk_store.apply(booking_id, update_data)
     
-    return {"message": "Walk updated"}
+    # Fixes after synced_until are still buffered, and logged in the SharedState until flushed (see walk_state)
+    return {"message": "Walk updated", "synced_until": synced_until}
 
 @api_router.post("/walks/{booking_id}/complete")
-async def complete_walk(booking_id: str, photo: Optional[str] = None, report: Optional[str] = None, authorization: Optional[str] = Header(None)):
+async def complete_walk(booking_id: str, request: Request, photo: Optional[str] = None, report: Optional[str] = None, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    await authorize_booking(request, user, booking_id, roles=("walker",))
     
     update_data = {
         "status": "completed",
-        "end_time": datetime.now(timezone.utc).isoformat()
+        "end_time": datetime.now(timezone.utc)
     }
     
     if photo:
-        await db.walks.update_one(
-            {"booking_id": booking_id},
-            {"$push": {"photos": photo}}
-        )
+        await repos.walks.push(booking_id, "photos", photo)
     
     if report:
         update_data['report_text'] = report
     
-    await db.walks.update_one({"booking_id": booking_id}, {"$set": update_data})
-    await db.bookings.update_one({"id": booking_id}, {"$set": {"status": "completed"}})
+    # Completed first, so no worker starts buffering the walk again once they have flushed
+    await repos.walks.update(booking_id, update_data)
+    await walk_store.finish(booking_id)
+    await set_booking_status(booking_id, "completed")
     
     return {"message": "Walk completed"}
 
+def _sync_update(booking_id: str, operations: List[WalkSyncOperation], parties: Dict[str, str],
+                 status: Optional[str] = None) -> Dict:
+    """Fold ordered operations into one walk update.
+
+    `status` is the walk's current one; a start that arrives once the walk is
+    completed (a late retry from the queue) does not reopen it.
+    """
+    fields: Dict[str, Any] = {}
+    points, photos = [], []
+    for op in operations:
+        at = datetime.fromtimestamp(op.at, timezone.utc) if op.at is not None else datetime.now(timezone.utc)
+        if op.type == "start" and status != "completed":
+            fields.update(status="in_progress", start_time=at)
+            status = "in_progress"
+        elif op.type == "complete":
+            fields.update(status="completed", end_time=at)
+            status = "completed"
+        if op.route_point:
+            points.append(op.route_point)
+        if op.photo:
+            photos.append(op.photo)
+        if op.report_text:
+            fields['report_text'] = op.report_text
+    
+    update: Dict[str, Any] = {}
+    if fields:
+        update['$set'] = fields
+    push = {name: {"$each": values} for name, values in (("route_data", points), ("photos", photos)) if values}
+    if points:
+        push['route_data']['$sort'] = ROUTE_ORDER
+    if push:
+        update['$push'] = push
+    defaults = to_document(Walk(booking_id=booking_id, owner_user_id=parties['owner'], walker_user_id=parties['walker']))
+    update['$setOnInsert'] = {k: v for k, v in defaults.items() if k not in fields and k not in push}
+    return update
+
+@api_router.post("/walks/{booking_id}/sync", response_model=WalkSyncOut)
+async def sync_walk(booking_id: str, input: WalkSyncInput, request: Request, authorization: Optional[str] = Header(None)):
+    """Apply operations queued by the walker app while offline.
+
+    Operations are applied in order, at most once per op_id, as a single
+    walk write; the response carries the reconciled walk.
+    """
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    parties = await authorize_booking(request, user, booking_id, roles=("walker",))
+    
+    # Ids repeated within the batch count once, at their first position
+    unique: Dict[str, WalkSyncOperation] = {}
+    for op in input.operations:
+        unique.setdefault(op.op_id, op)
+    operations = list(unique.values())
+    
+    # Buffered fixes go first so the route stays in order
+    await walk_store.finish(booking_id)
+    
+    recorded: List[str] = []
+    
+    async def apply():
+        # The ids are recorded in the same transaction as the walk write, so
+        # they are never marked as applied without it
+        claimed = set(await repos.walk_sync_ops.claim(booking_id, [op.op_id for op in operations]))
+        recorded[:] = claimed
+        pending = [op for op in operations if op.op_id in claimed]
+        if not pending:
+            return None, claimed, pending
+        current = await repos.walks.get_status(booking_id)
+        update = _sync_update(booking_id, pending, parties, current.get('status') if current else None)
+        return await repos.walks.apply(booking_id, update), claimed, pending
+    
+    try:
+        walk, claimed, pending = await transaction(client, apply)
+    except Exception:
+        if recorded and not supports_transactions(client):
+            # No transaction to roll the ids back with; forget them so the app can retry
+            await repos.walk_sync_ops.release(booking_id, recorded)
+        raise
+    skipped = [op.op_id for op in operations if op.op_id not in claimed]
+    if not pending:
+        walk = walk_store.get(booking_id) or await repos.walks.get(booking_id)
+        return FastJSONResponse({"walk": walk, "applied": [], "skipped": skipped})
+    
+    types = {op.type for op in pending}
+    if "start" in types and walk.get('status') == "in_progress":
+        await set_booking_status(booking_id, "in_progress", expected="confirmed")
+    if "complete" in types:
+        await set_booking_status(booking_id, "completed")
+    
+    return FastJSONResponse({"walk": walk, "applied": [op.op_id for op in pending], "skipped": skipped})
+
 @api_router.post("/walks/{booking_id}/photos")
-async def add_walk_photo(booking_id: str, photo_base64: str, authorization: Optional[str] = Header(None)):
+async def add_walk_photo(booking_id: str, photo_base64: str, request: Request, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    await authorize_booking(request, user, booking_id, roles=("walker",))
     
-    await db.walks.update_one(
-        {"booking_id": booking_id},
-        {"$push": {"photos": photo_base64}}
-    )
+    await repos.walks.push(booking_id, "photos", photo_base64)
+    await walk_store.apply(booking_id, push={"photos": photo_base64})
     
     return {"message": "Photo added"}
 
 # ============ MESSAGES ROUTES ============
 
-@api_router.get("/messages")
+@api_router.get("/messages", response_model=List[MessageOut])
 async def get_messages(authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
     
     # Get messages where user is sender or recipient
-    messages = await db.messages.find({
-        "$or": [
-            {"sender_id": user.id},
-            {"recipient_id": user.id}
-        ]
-    }, {"_id": 0}).sort("created_at", -1).to_list(100)
-    
-    # Enrich with user data
+    limit = 100
+    messages = await repos.messages.list_for_user(user.id, limit)
+    if len(messages) < limit:
+        # Archived messages are all older than live ones, so they go at the end
+        messages += await repos.messages_archive.list_for_user(user.id, limit - len(messages))
+    
+    await _add_user_names(messages)
+    return FastJSONResponse(messages)
+
+async def _add_user_names(messages: List[Dict[str, Any]]):
+    users = await repos.users.get_summaries(
+        uid for msg in messages for uid in (msg['sender_id'], msg['recipient_id'])
+    )
     for msg in messages:
-        sender_doc = await db.users.find_one({"id": msg['sender_id']}, {"_id": 0})
-        recipient_doc = await db.users.find_one({"id": msg['recipient_id']}, {"_id": 0})
+        sender_doc = users.get(msg['sender_id'])
+        recipient_doc = users.get(msg['recipient_id'])
         msg['sender_name'] = sender_doc['name'] if sender_doc else "Unknown"
         msg['recipient_name'] = recipient_doc['name'] if recipient_doc else "Unknown"
-        msg['sender_picture'] = sender_doc.get('picture')
-        msg['recipient_picture'] = recipient_doc.get('picture')
+        msg['sender_picture'] = sender_doc.get('picture') if sender_doc else None
+        msg['recipient_picture'] = recipient_doc.get('picture') if recipient_doc else None
+
+@api_router.get("/messages/search")
+async def search_messages(q: str = Query(min_length=1, max_length=200),
+                          page: int = Query(1, ge=1, le=SEARCH_MAX_PAGES),
+                          authorization: Optional[str] = Header(None)):
+    """The user's own messages (sent or received, archived too) matching `q`, best match first"""
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
     
-    return messages
-
-@api_router.post("/messages")
+    terms = search_terms(q)
+    messages = []
+    if terms:
+        messages = await repos.message_search.search(user.id, terms, (page - 1) * SEARCH_PAGE_SIZE,
+                                                     SEARCH_PAGE_SIZE + 1)
+    has_more = len(messages) > SEARCH_PAGE_SIZE
+    messages = messages[:SEARCH_PAGE_SIZE]
+    await _add_user_names(messages)
+    return FastJSONResponse({"items": messages, "page": page, "has_more": has_more})
+
+@api_router.post("/messages", response_model=Message)
 async def send_message(input: CreateMessageInput, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
@@ -788,11 +1310,17 @@ async def send_message(input: CreateMessageInput, authorization: Optional[str] =
         booking_id=input.booking_id
     )
     
-    doc = message.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.messages.insert_one(doc)
+    doc = to_document(message)
+    async def apply():
+        await repos.messages.insert(doc)
+        await repos.message_search.add(message_search_docs(doc))
+        await repos.outbox.add(outbox_events("message_received", [input.recipient_id], dispatcher.channels,
+                                             message_id=message.id, sender_name=user.name, preview=input.message[:100]))
+
+    await transaction(client, apply)
+    dispatcher.wake()
     
-    return message.model_dump()
+    return FastJSONResponse(doc)
 
 @api_router.patch("/messages/{message_id}/read")
 async def mark_message_read(message_id: str, authorization: Optional[str] = Header(None)):
@@ -800,10 +1328,7 @@ async def mark_message_read(message_id: str, authorization: Optional[str] = Head
     if not user:
         raise HTTPException(401, "Not authenticated")
     
-    await db.messages.update_one(
-        {"id": message_id, "recipient_id": user.id},
-        {"$set": {"read": True}}
-    )
+    await repos.messages.mark_read(message_id, user.id)
     
     return {"message": "Marked as read"}
 
@@ -812,8 +1337,9 @@ async def get_unread_count(authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization=authorization)
     if not user:
         raise HTTPException(401, "Not authenticated")
+    await unread_poll_limit.take(f"user:{user.id}")
     
-    count = await db.messages.count_documents({"recipient_id": user.id, "read": False})
+    count = await repos.messages.count_unread(user.id)
     return {"count": count}
 
 # ============ SIMPLE BOOKINGS ROUTES ============
@@ -822,27 +1348,26 @@ async def get_unread_count(authorization: Optional[str] = Header(None)):
 async def create_simple_booking(input: SimpleBookingInput):
     """Create a simple booking without authentication"""
     
+    # Requests always enter the intake queue as pending; staff move them on
     booking = SimpleBooking(
         service_type=input.service_type,
         date=input.date,
         time=input.time,
         contact=input.contact,
         pet_details=input.pet_details,
-        status=input.status
     )
     
-    doc = booking.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.simple_bookings.insert_one(doc)
+    await repos.simple_bookings.insert(to_document(booking))
     
     return {"message": "Booking request received", "booking_id": booking.id}
 
-@api_router.get("/simple-bookings")
-async def get_simple_bookings():
-    """Get all simple bookings - admin only for now"""
+@api_router.get("/simple-bookings", response_model=List[SimpleBooking])
+async def get_simple_bookings(authorization: Optional[str] = Header(None)):
+    """Newest 100 simple bookings; the filtered queue is /admin/simple-bookings"""
+    await require_admin(authorization)
     
-    bookings = await db.simple_bookings.find({}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return bookings
+    bookings = await repos.simple_bookings.list_recent(100)
+    return FastJSONResponse(bookings)
 
 # ============ PAYMENTS ROUTES ============
 
@@ -860,7 +1385,7 @@ async def create_checkout_session(input: CreateCheckoutInput, authorization: Opt
         raise HTTPException(401, "Not authenticated")
     
     # Get booking
-    booking = await db.bookings.find_one({"id": input.booking_id})
+    booking = await repos.bookings.get_fields(input.booking_id, "owner_id", "walker_id", "amount")
     if not booking:
         raise HTTPException(404, "Booking not found")
     
@@ -875,32 +1400,34 @@ async def create_checkout_session(input: CreateCheckoutInput, authorization: Opt
     webhook_url = f"{host_url}/api/webhook/stripe"
 
     # Initialize Stripe
-    stripe.api_key = STRIPE_API_KEY
+    stripe = get_stripe()
 
     success_url = f"{input.origin_url}/pago-exitoso?session_id={{{{CHECKOUT_SESSION_ID}}}}"
     cancel_url = f"{input.origin_url}/reservar/{booking['walker_id']}"
 
     # Create Stripe checkout session
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        line_items=[{
-            'price_data': {
-                'currency': 'eur',
-                'product_data': {
-                    'name': 'Reserva de paseo',
+    with span("stripe"):
+        session = await run_blocking(
+            stripe.checkout.Session.create,
+            payment_method_types=['card'],
+            line_items=[{
+                'price_data': {
+                    'currency': 'eur',
+                    'product_data': {
+                        'name': 'Reserva de paseo',
+                    },
+                    'unit_amount': int(amount * 100),  # Stripe usa centavos
                 },
-                'unit_amount': int(amount * 100),  # Stripe usa centavos
-            },
-            'quantity': 1,
-        }],
-        mode='payment',
-        success_url=success_url,
-        cancel_url=cancel_url,
-        metadata={
-            "booking_id": input.booking_id,
-            "user_id": user.id
-        }
-    )
+                'quantity': 1,
+            }],
+            mode='payment',
+            success_url=success_url,
+            cancel_url=cancel_url,
+            metadata={
+                "booking_id": input.booking_id,
+                "user_id": user.id
+            }
+        )
     # Create payment transaction
     transaction = PaymentTransaction(
         session_id=session.id,
@@ -913,9 +1440,7 @@ async def create_checkout_session(input: CreateCheckoutInput, authorization: Opt
         metadata={"booking_id": input.booking_id}
     )
     
-    doc = transaction.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.payment_transactions.insert_one(doc)
+    await repos.payments.insert(to_document(transaction))
     
     return {"url": session.url, "session_id": session.id}
 
@@ -926,7 +1451,7 @@ async def get_checkout_status(session_id: str, authorization: Optional[str] = He
         raise HTTPException(401, "Not authenticated")
     
     # Check if already processed
-    transaction = await db.payment_transactions.find_one({"session_id": session_id})
+    transaction = await repos.payments.get_status(session_id)
     if not transaction:
         raise HTTPException(404, "Transaction not found")
     
@@ -934,25 +1459,18 @@ async def get_checkout_status(session_id: str, authorization: Optional[str] = He
         return {"status": "complete", "payment_status": "paid", "already_processed": True}
     
     # Get status from Stripe
-    webhook_url = f"{BACKEND_URL}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=STRIPE_API_KEY, webhook_url=webhook_url)
+    stripe = get_stripe()
     
     try:
-        checkout_status = stripe.checkout.Session.retrieve(session_id)
+        with span("stripe"):
+            checkout_status = await run_blocking(stripe.checkout.Session.retrieve, session_id)
         
         # Update transaction if paid
         if checkout_status.payment_status == 'paid' and transaction['payment_status'] != 'paid':
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": {"payment_status": "paid", "status": "completed"}}
-            )
+            await repos.payments.mark_paid(session_id)
             
             # Update booking status
-            booking_id = transaction['booking_id']
-            await db.bookings.update_one(
-                {"id": booking_id},
-                {"$set": {"status": "confirmed"}}
-            )
+            await set_booking_status(transaction['booking_id'], "confirmed")
         
         return {
             "status": checkout_status.status,
@@ -970,7 +1488,7 @@ async def stripe_webhook(request: Request):
     
     try:
         # Verify webhook signature
-        event = stripe.Webhook.construct_event(
+        event = get_stripe().Webhook.construct_event(
             body, signature, STRIPE_WEBHOOK_SECRET
         )
 
@@ -979,24 +1497,111 @@ async def stripe_webhook(request: Request):
         
         if event['type'] == 'checkout.session.completed':
             # Update transaction
-            transaction = await db.payment_transactions.find_one({"session_id": webhook_response.id})
+            transaction = await repos.payments.get_status(webhook_response.id)
             if transaction and transaction['payment_status'] != 'paid':
-                await db.payment_transactions.update_one(
-                    {"session_id": webhook_response.id},
-                    {"$set": {"payment_status": "paid", "status": "completed"}}
-                )
+                await repos.payments.mark_paid(webhook_response.id)
                 
                 # Update booking
-                booking_id = transaction['booking_id']
-                await db.bookings.update_one(
-                    {"id": booking_id},
-                    {"$set": {"status": "confirmed"}}
-                )
+                await set_booking_status(transaction['booking_id'], "confirmed")
         
         return {"received": True}
     except Exception as e:
         raise HTTPException(400, f"Webhook error: {str(e)}")
 
+# ============ ADMIN ROUTES ============
+
+async def require_admin(authorization: Optional[str]) -> UserPublic:
+    user = await get_current_user(authorization=authorization)
+    if not user:
+        raise HTTPException(401, "Not authenticated")
+    if user.role != "admin":
+        raise HTTPException(403, "Admins only")
+    return user
+
+@api_router.get("/admin/export/{dataset}")
+async def export_dataset(
+    dataset: Literal["bookings", "payments", "simple-bookings"],
+    format: Literal["csv", "ndjson"] = "csv",
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    gzip: bool = False,
+    authorization: Optional[str] = Header(None),
+):
+    """Stream a whole collection, filtered on created_at in [from, to)"""
+    await require_admin(authorization)
+    
+    query = date_filter(as_utc(date_from), as_utc(date_to))
+    filename = f"{dataset}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_stream(repos, dataset, format, query, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+SERVICE_DATE = r"^\d{4}-\d{2}-\d{2}$"
+
+def _queue_cursor(doc: Dict[str, Any]) -> str:
+    key = json.dumps([doc.get("date"), doc.get("time"), doc.get("id")])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def _parse_queue_cursor(cursor: str):
+    try:
+        date, time, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    return date, time, booking_id
+
+@api_router.get("/admin/simple-bookings")
+async def list_simple_booking_queue(
+    status: Optional[Literal["pending", "confirmed", "completed", "cancelled"]] = None,
+    service_type: Optional[str] = None,
+    date_from: Optional[str] = Query(None, pattern=SERVICE_DATE),
+    date_to: Optional[str] = Query(None, pattern=SERVICE_DATE),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    authorization: Optional[str] = Header(None),
+):
+    """Simple bookings by service slot, filtered; pass next_cursor back as cursor for the next page"""
+    await require_admin(authorization)
+    
+    after = _parse_queue_cursor(cursor) if cursor else None
+    # One extra row says whether there is a next page, so a full last page has no cursor
+    items = await repos.simple_bookings.list_queue(
+        [status] if status else SIMPLE_BOOKING_STATUSES, service_type, date_from, date_to, after, limit + 1
+    )
+    next_cursor = _queue_cursor(items[limit - 1]) if len(items) > limit else None
+    items = items[:limit]
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+@api_router.get("/admin/simple-bookings/counts")
+async def count_simple_bookings(
+    service_type: Optional[str] = None,
+    date_from: Optional[str] = Query(None, pattern=SERVICE_DATE),
+    date_to: Optional[str] = Query(None, pattern=SERVICE_DATE),
+    authorization: Optional[str] = Header(None),
+):
+    """Simple bookings per status, with the same filters as the queue"""
+    await require_admin(authorization)
+    
+    return await repos.simple_bookings.count_by_status(service_type, date_from, date_to)
+
+@api_router.post("/admin/simple-bookings/status")
+async def set_simple_bookings_status(input: SimpleBookingStatusInput, authorization: Optional[str] = Header(None)):
+    """Move a batch of simple bookings to a new status.
+
+    Requests whose current status can't lead there (e.g. completing a
+    pending one) are skipped; `updated` says how many moved.
+    """
+    admin = await require_admin(authorization)
+    
+    ids = list(dict.fromkeys(input.ids))
+    updated = await repos.simple_bookings.set_status(ids, input.status, admin.id)
+    return {"requested": len(ids), "updated": updated}
+
 # ============ UTILITY ============
 
 @api_router.get("/config")
@@ -1005,15 +1610,8 @@ async def get_config():
         "google_maps_api_key": GOOGLE_MAPS_API_KEY
     }
 
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def get_metrics():
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -1021,6 +1619,146 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# ============ SCHEDULED JOBS ============
+
+async def _notify_marked(booking_id: str, field: str, kind: str, **conditions) -> bool:
+    """Stamp `field` on a confirmed booking and notify both parties, once"""
+    async def apply():
+        booking = await repos.bookings.mark_once(booking_id, field, "confirmed", conditions)
+        if booking is None:
+            return False
+        await repos.outbox.add(outbox_events(kind, (booking['owner_id'], booking.get('walker_user_id')),
+                                             dispatcher.channels, booking_id=booking_id,
+                                             date=booking.get('date'), time=booking.get('time')))
+        return True
+
+    if not await transaction(client, apply):
+        return False
+    dispatcher.wake()
+    return True
+
+async def remind_booking(booking_id: str):
+    # Too late to remind once the walk should have started
+    await _notify_marked(booking_id, "reminded_at", "booking_reminder",
+                         start_at={"$gt": datetime.now(timezone.utc)})
+
+async def flag_no_show(booking_id: str):
+    # Still "confirmed" this long after start_at: the walk was never started
+    if await _notify_marked(booking_id, "no_show_at", "walk_no_show"):
+        logger.info("Booking %s flagged as no-show", booking_id)
+
+async def expire_unpaid_booking(booking_id: str):
+    await set_booking_status(booking_id, "cancelled", expected="pending_payment",
+                             cancelled_at=datetime.now(timezone.utc), cancel_reason="payment_expired")
+
+SCHEDULED_JOBS = {"reminder": remind_booking, "no_show": flag_no_show, "payment_expiry": expire_unpaid_booking}
+
+# ============ APP FACTORY ============
+
+# Seconds spent in each startup step, reported by benchmarks/bench_startup.py
+startup_timings: Dict[str, float] = {}
+
+async def _timed(name, coro):
+    start = time.perf_counter()
+    try:
+        await coro
+    except Exception:
+        logger.exception("Startup step %s failed", name)
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+async def warm_connection_pool():
+    # Concurrent pings make the driver open minPoolSize connections up front
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))))
+
+async def open_resources(database=None):
+    global client, db, repos, http_client, blocking_pool, shared_state, walk_store, dispatcher, scheduler
+    start = time.perf_counter()
+    import httpx
+    if database is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(
+            mongo_url,
+            tz_aware=True,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=[query_listener],
+        )
+        database = client[os.environ['DB_NAME']]
+    db = database
+    repos = Repositories(db)
+    http_client = httpx.AsyncClient(timeout=10)
+    blocking_pool = ThreadPoolExecutor(BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    shared_state = create_shared_state(SHARED_STATE_BACKEND, db)
+    loop_monitor.start()
+    walk_store = ActiveWalkStore(repos, shared_state)
+    walk_store.start()
+    dispatcher = NotificationDispatcher(repos, build_adapters(http_client))
+    dispatcher.start()
+    scheduler = BookingScheduler(repos, shared_state, SCHEDULED_JOBS)
+    scheduler.start()
+    startup_timings["resources"] = time.perf_counter() - start
+
+    # Independent round trips, run concurrently; a failure is logged, not fatal
+    steps = [_timed("indexes", ensure_indexes(db)), _timed("shared_state", shared_state.setup())]
+    if client is not None:
+        steps.append(_timed("connection_pool", warm_connection_pool()))
+    await asyncio.gather(*steps)
+    startup_timings["total"] = time.perf_counter() - start
+    logger.info("Startup took %.0f ms", startup_timings["total"] * 1000)
+
+async def close_resources():
+    await loop_monitor.stop()
+    await walk_store.close()
+    await scheduler.close()
+    await dispatcher.close()
+    await shared_state.close()
+    await http_client.aclose()
+    blocking_pool.shutdown(wait=False)
+    if client is not None:
+        client.close()
+
+def create_app(database=None) -> FastAPI:
+    """Build the ASGI app.
+
+    Every worker process builds one, `app` below, when it imports this module
+    (uvicorn server:app, or gunicorn -c gunicorn.conf.py); the Mongo client,
+    HTTP client and worker pool are opened in the lifespan, after the fork.
+    Pass `database` to run against an existing database object, e.g. a
+    mongomock one.
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await open_resources(database)
+        try:
+            yield
+        finally:
+            await close_resources()
+        if LOOP_BLOCK_ASSERT_MS:
+            loop_monitor.assert_no_blocking()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+
+    # Inside load shedding, so a shed request never claims its Idempotency-Key
+    app.add_middleware(IdempotencyMiddleware, store=lambda: repos.idempotency_keys if repos is not None else None)
+    # Shedding happens before any other work; the 503s still show up in the latency metrics
+    app.add_middleware(LoadSheddingMiddleware)
+    # LatencyMiddleware sits inside QueryMetricsMiddleware so traces can read the request's query stats
+    app.add_middleware(LatencyMiddleware)
+    app.add_middleware(QueryMetricsMiddleware)
+    # Outside the latency metrics, which time the handlers; compression has its own counters
+    app.add_middleware(CompressionMiddleware, run_blocking=run_blocking)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+# The app servers import this one; tests and benchmarks build their own with create_app(database)
+app = create_app()
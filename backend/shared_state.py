@@ -0,0 +1,299 @@
+"""State shared between worker processes: cache, counters and pub/sub.
+
+In-process dicts stop being correct as soon as the app runs under several
+uvicorn/gunicorn workers, so anything that must be seen by every worker goes
+through a SharedState. InMemorySharedState is for a single process (dev,
+tests); MongoSharedState keeps everything in MongoDB, which every worker
+already talks to.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Idle buckets kept by InMemorySharedState before the least recently used are dropped
+MAX_BUCKETS = int(os.environ.get('MAX_BUCKETS', '100000'))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _expiry(ttl: Optional[float]) -> Optional[datetime]:
+    return _now() + timedelta(seconds=ttl) if ttl else None
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: int) -> Tuple[bool, float, float]:
+    """(allowed, tokens left, retry after) for one take from a bucket last seen at `updated`"""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class SharedState:
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Increment a counter; ttl applies when the counter is created"""
+        raise NotImplementedError
+
+    async def add_member(self, key: str, member: Any, ttl: Optional[float] = None):
+        """Add `member` to the set at `key` (read back as a list); ttl applies when the set is created"""
+        raise NotImplementedError
+
+    async def take_token(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Token bucket refilled at `rate`/s up to `burst`.
+
+        Returns (allowed, seconds until a token is available).
+        """
+        raise NotImplementedError
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew an exclusive lease for `ttl` seconds; False while another owner holds it"""
+        raise NotImplementedError
+
+    async def release_lease(self, key: str, owner: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str) -> AsyncIterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def setup(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemorySharedState(SharedState):
+    def __init__(self):
+        self._values: Dict[str, Tuple[Any, Optional[datetime]]] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+        # key -> (tokens, updated, expires); oldest use first, so idle buckets sit at the front
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    def _live(self, key):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= _now():
+            del self._values[key]
+            return None
+        return entry
+
+    async def get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key, value, ttl=None):
+        self._values[key] = (value, _expiry(ttl))
+
+    async def delete(self, key):
+        self._values.pop(key, None)
+
+    async def incr(self, key, amount=1, ttl=None):
+        entry = self._live(key)
+        if entry is None:
+            entry = (0, _expiry(ttl))
+        value = entry[0] + amount
+        self._values[key] = (value, entry[1])
+        return value
+
+    async def add_member(self, key, member, ttl=None):
+        entry = self._live(key)
+        if entry is None:
+            entry = self._values[key] = ([], _expiry(ttl))
+        if member not in entry[0]:
+            entry[0].append(member)
+
+    async def take_token(self, key, rate, burst):
+        now = time.monotonic()
+        tokens, updated, _ = self._buckets.pop(key, (burst, now, now))
+        allowed, tokens, retry_after = _refill(tokens, updated, now, rate, burst)
+        # Past its expiry a bucket has refilled to full, so dropping it changes nothing;
+        # same idle TTL as MongoSharedState's bucket documents
+        self._buckets[key] = (tokens, now, now + burst / rate * 2)
+        while self._buckets:
+            oldest = next(iter(self._buckets.values()))
+            if oldest[2] > now and len(self._buckets) <= MAX_BUCKETS:
+                break
+            self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    async def acquire_lease(self, key, owner, ttl):
+        entry = self._live(f"lease:{key}")
+        if entry is not None and entry[0] != owner:
+            return False
+        self._values[f"lease:{key}"] = (owner, _expiry(ttl))
+        return True
+
+    async def release_lease(self, key, owner):
+        entry = self._live(f"lease:{key}")
+        if entry is not None and entry[0] == owner:
+            del self._values[f"lease:{key}"]
+
+    async def publish(self, channel, message):
+        for queue in self._subscribers[channel]:
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        self._subscribers[channel].append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].remove(queue)
+
+
+class MongoSharedState(SharedState):
+    """SharedState on MongoDB.
+
+    Values and counters live in `shared_state` (expired entries are ignored on
+    read and removed by a TTL index). Pub/sub messages are appended to
+    `shared_events` with a global sequence number and subscribers poll for
+    anything newer than what they have seen. Delivery is best effort: a
+    message published while a subscriber is not polling is still seen, but
+    one that commits out of sequence order can be skipped.
+    """
+
+    def __init__(self, db, poll_interval: float = 0.5, event_ttl: int = 3600):
+        self.values = db.shared_state
+        self.events = db.shared_events
+        self.poll_interval = poll_interval
+        self.event_ttl = event_ttl
+
+    async def setup(self):
+        await self.values.create_index("expires_at", expireAfterSeconds=0)
+        await self.events.create_index([("channel", 1), ("seq", 1)])
+        await self.events.create_index("created_at", expireAfterSeconds=self.event_ttl)
+
+    async def get(self, key):
+        doc = await self.values.find_one({"_id": key}, {"value": 1, "expires_at": 1})
+        if not doc or (doc.get("expires_at") and doc["expires_at"] <= _now()):
+            return None
+        return doc["value"]
+
+    async def set(self, key, value, ttl=None):
+        await self.values.replace_one({"_id": key}, {"value": value, "expires_at": _expiry(ttl)}, upsert=True)
+
+    async def delete(self, key):
+        await self.values.delete_one({"_id": key})
+
+    async def incr(self, key, amount=1, ttl=None):
+        now = _now()
+        # An expired counter that the TTL monitor has not removed yet starts over
+        await self.values.delete_one({"_id": key, "expires_at": {"$lte": now}})
+        update = {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": _expiry(ttl)}}
+        try:
+            doc = await self.values.find_one_and_update(
+                {"_id": key}, update, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker created the counter between our find and insert
+            doc = await self.values.find_one_and_update(
+                {"_id": key}, update, return_document=ReturnDocument.AFTER,
+            )
+        return doc["value"]
+
+    async def add_member(self, key, member, ttl=None):
+        # Same expiry handling as incr
+        await self.values.delete_one({"_id": key, "expires_at": {"$lte": _now()}})
+        update = {"$addToSet": {"value": member}, "$setOnInsert": {"expires_at": _expiry(ttl)}}
+        try:
+            await self.values.update_one({"_id": key}, update, upsert=True)
+        except DuplicateKeyError:
+            await self.values.update_one({"_id": key}, update)
+
+    async def take_token(self, key, rate, burst):
+        # Compare-and-set on the bucket's last update time; a lost race retries
+        # against the winner's state
+        bucket_id = f"bucket:{key}"
+        idle_ttl = timedelta(seconds=burst / rate * 2)
+        for _ in range(3):
+            now = _now()
+            doc = await self.values.find_one({"_id": bucket_id}, {"tokens": 1, "updated": 1})
+            if doc is None:
+                allowed, tokens, retry_after = _refill(burst, 0, 0, rate, burst)
+                try:
+                    await self.values.insert_one({"_id": bucket_id, "tokens": tokens, "updated": now,
+                                                  "expires_at": now + idle_ttl})
+                except DuplicateKeyError:
+                    continue
+                return allowed, retry_after
+            updated = doc["updated"]
+            allowed, tokens, retry_after = _refill(
+                doc["tokens"], updated.timestamp(), now.timestamp(), rate, burst)
+            result = await self.values.update_one(
+                {"_id": bucket_id, "updated": updated},
+                {"$set": {"tokens": tokens, "updated": now, "expires_at": now + idle_ttl}},
+            )
+            if result.modified_count:
+                return allowed, retry_after
+        # Heavy contention on one key is itself a sign of abuse
+        return False, 1 / rate
+
+    async def acquire_lease(self, key, owner, ttl):
+        now = _now()
+        try:
+            # Matches when we hold the lease or it has run out; otherwise the upsert collides
+            await self.values.update_one(
+                {"_id": f"lease:{key}", "$or": [{"value": owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"value": owner, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_lease(self, key, owner):
+        await self.values.delete_one({"_id": f"lease:{key}", "value": owner})
+
+    async def _next_seq(self) -> int:
+        doc = await self.values.find_one_and_update(
+            {"_id": "__shared_events_seq__"}, {"$inc": {"value": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return doc["value"]
+
+    async def publish(self, channel, message):
+        await self.events.insert_one({
+            "channel": channel, "seq": await self._next_seq(), "message": message, "created_at": _now(),
+        })
+
+    async def subscribe(self, channel):
+        last = await self.events.find_one({"channel": channel}, {"seq": 1}, sort=[("seq", -1)])
+        last_seq = last["seq"] if last else 0
+        while True:
+            docs = await self.events.find(
+                {"channel": channel, "seq": {"$gt": last_seq}}, {"seq": 1, "message": 1}
+            ).sort("seq", 1).to_list(100)
+            for doc in docs:
+                last_seq = doc["seq"]
+                yield doc["message"]
+            if not docs:
+                await asyncio.sleep(self.poll_interval)
+
+
+def create_shared_state(backend: str, db) -> SharedState:
+    if backend == "memory":
+        return InMemorySharedState()
+    if backend == "mongo":
+        return MongoSharedState(db)
+    raise ValueError(f"Unknown shared state backend: {backend}")
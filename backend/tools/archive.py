@@ -0,0 +1,46 @@
+"""Archive finished walks, old messages and closed bookings.
+
+Run from the backend directory, e.g. nightly:
+
+    python -m tools.archive [--only walks,messages] [--batch-size 500] [--max-batches 100] [--resume] [--dry-run]
+
+Age limits come from WALK_ARCHIVE_DAYS, MESSAGE_ARCHIVE_DAYS and
+BOOKING_ARCHIVE_DAYS (see archive.py). --max-batches bounds the work of one
+run; --resume continues a previous run from its checkpoint, with the same
+cutoff.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from archive import POLICIES, run_archive
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        results = await run_archive(db, args.only.split(","), batch_size=args.batch_size,
+                                    max_batches=args.max_batches, resume=args.resume, dry_run=args.dry_run)
+        for name, count in results.items():
+            print(f"{name}: {count} documents {'to archive' if args.dry_run else 'archived'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old documents to the archive collections")
+    parser.add_argument("--only", default=",".join(POLICIES), help="comma-separated collections")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-batches", type=int)
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args))
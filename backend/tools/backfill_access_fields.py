@@ -0,0 +1,90 @@
+"""Backfill the denormalized access fields on bookings and walks.
+
+Bookings carry walker_user_id and walks carry owner_user_id/walker_user_id
+so that authorization checks read one document. Documents written before
+those fields existed are filled in here; run from the backend directory
+after deploying:
+
+    python -m tools.backfill_access_fields [--batch-size 1000] [--dry-run]
+
+Each batch resolves its walkers (or bookings) with one $in query and writes
+with one unordered bulk_write, so the run is safe to interrupt and repeat.
+Until it has finished, the API resolves missing fields on every check.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def _batches(collection, query, fields, batch_size):
+    last_id = None
+    while True:
+        page = dict(query)
+        if last_id is not None:
+            page["_id"] = {"$gt": last_id}
+        docs = await collection.find(page, fields).sort("_id", 1).limit(batch_size).to_list(None)
+        if not docs:
+            return
+        yield docs
+        last_id = docs[-1]["_id"]
+
+
+async def backfill_bookings(db, batch_size, dry_run):
+    updated = 0
+    query = {"walker_user_id": {"$exists": False}}
+    async for docs in _batches(db.bookings, query, {"walker_id": 1}, batch_size):
+        walker_ids = list({doc["walker_id"] for doc in docs})
+        walkers = await db.walkers.find({"id": {"$in": walker_ids}}, {"_id": 0, "id": 1, "user_id": 1}).to_list(None)
+        user_ids = {walker["id"]: walker["user_id"] for walker in walkers}
+        ops = [UpdateOne({"_id": doc["_id"]}, {"$set": {"walker_user_id": user_ids[doc["walker_id"]]}})
+               for doc in docs if doc["walker_id"] in user_ids]
+        updated += len(ops)
+        if ops and not dry_run:
+            await db.bookings.bulk_write(ops, ordered=False)
+    return updated
+
+
+async def backfill_walks(db, batch_size, dry_run):
+    updated = 0
+    query = {"$or": [{"owner_user_id": {"$exists": False}}, {"walker_user_id": {"$exists": False}}]}
+    async for docs in _batches(db.walks, query, {"booking_id": 1}, batch_size):
+        booking_ids = list({doc["booking_id"] for doc in docs})
+        bookings = await db.bookings.find(
+            {"id": {"$in": booking_ids}}, {"_id": 0, "id": 1, "owner_id": 1, "walker_user_id": 1}).to_list(None)
+        parties = {booking["id"]: booking for booking in bookings if booking.get("walker_user_id")}
+        ops = [UpdateOne({"_id": doc["_id"]}, {"$set": {
+                   "owner_user_id": parties[doc["booking_id"]]["owner_id"],
+                   "walker_user_id": parties[doc["booking_id"]]["walker_user_id"],
+               }}) for doc in docs if doc["booking_id"] in parties]
+        updated += len(ops)
+        if ops and not dry_run:
+            await db.walks.bulk_write(ops, ordered=False)
+    return updated
+
+
+async def main(batch_size, dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        # Bookings first: walks copy their fields from them
+        verb = "to update" if dry_run else "updated"
+        print(f"bookings: {await backfill_bookings(db, batch_size, dry_run)} {verb}")
+        print(f"walks: {await backfill_walks(db, batch_size, dry_run)} {verb}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill access fields on bookings and walks")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
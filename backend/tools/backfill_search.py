@@ -0,0 +1,90 @@
+"""Build the search terms of walkers and the message_search index.
+
+New walkers and messages are indexed when they are written; this fills in
+the ones written before search existed, messages_archive included, and
+re-analyses everything after a change to search.py. Run from the backend
+directory after deploying (the text indexes themselves are created at
+startup):
+
+    python -m tools.backfill_search [--only walkers,messages] [--batch-size 1000] [--dry-run]
+
+Documents are read in _id order and written with unordered bulk upserts,
+so the run is safe to interrupt and repeat.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from repositories import MessageSearchRepository, unpack
+from search import message_search_docs, walker_search_fields
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+MESSAGE_FIELDS = {"id": 1, "sender_id": 1, "recipient_id": 1, "booking_id": 1, "message": 1, "created_at": 1}
+
+
+async def _batches(collection, fields, batch_size):
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = await collection.find(query, fields).sort("_id", 1).limit(batch_size).to_list(None)
+        if not docs:
+            return
+        yield docs
+        last_id = docs[-1]["_id"]
+
+
+async def backfill_walkers(db, batch_size, dry_run):
+    updated = 0
+    async for docs in _batches(db.walkers, {"bio": 1, "specialties": 1, "location": 1}, batch_size):
+        ops = [UpdateOne({"_id": doc["_id"]}, {"$set": {"search": walker_search_fields(
+                   doc.get("bio", ""), doc.get("specialties") or [], doc.get("location", ""))}})
+               for doc in docs]
+        updated += len(ops)
+        if not dry_run:
+            await db.walkers.bulk_write(ops, ordered=False)
+    return updated
+
+
+async def backfill_messages(db, batch_size, dry_run):
+    index = MessageSearchRepository(db)
+    indexed = 0
+    async for docs in _batches(db.messages, MESSAGE_FIELDS, batch_size):
+        entries = [entry for doc in docs for entry in message_search_docs(doc)]
+        indexed += len(docs)
+        if not dry_run:
+            await index.upsert(entries)
+    async for records in _batches(db.messages_archive, {"data": 1}, batch_size):
+        entries = [entry for record in records for entry in message_search_docs(unpack(record))]
+        indexed += len(records)
+        if not dry_run:
+            await index.upsert(entries)
+    return indexed
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    verb = "to index" if args.dry_run else "indexed"
+    try:
+        only = args.only.split(",")
+        if "walkers" in only:
+            print(f"walkers: {await backfill_walkers(db, args.batch_size, args.dry_run)} {verb}")
+        if "messages" in only:
+            print(f"messages: {await backfill_messages(db, args.batch_size, args.dry_run)} {verb}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index walkers and messages for search")
+    parser.add_argument("--only", default="walkers,messages")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,291 @@
+"""Generate a large synthetic dataset for local performance work.
+
+Run from the backend directory:
+
+    python -m tools.generate_data --owners 1000000 --workers 8 [--drop]
+
+Owners are split into --shards partitions that the worker processes pick up.
+Every shard has its own random generator derived from --seed, so the same
+arguments produce the same documents, ids included, whatever --workers is. Documents are built from the models in server.py
+and written with unordered insert_many batches.
+
+The server keeps derived collections in step as it writes: message_search,
+walker_stats and the walkers' rating aggregates (from reviews, which are
+generated for a share of the completed walks). Those are not generated
+here; once the shards are in, the generator runs the tools that rebuild them
+from the source documents:
+
+    python -m tools.backfill_search --only messages
+    python -m tools.rebuild_walker_stats
+    python -m tools.recompute_ratings
+
+With --skip-derived it only prints these commands, e.g. to run them later.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+LUGO = (43.0097, -7.5560)
+# bcrypt of "synthetic-password" with a fixed, low-cost salt so output is deterministic
+PASSWORD_HASH = "$2b$04$syntheticdatasetsalt..YVMXo7QlC8bdBj2g4ZmjgtVG3C//e5G"
+
+SERVICES = {"basico": (15.0, 30), "estandar": (22.0, 45), "premium": (30.0, 60), "especial": (25.0, 45)}
+PAST_STATUSES = (("completed", 80), ("cancelled", 12), ("confirmed", 8))
+FUTURE_STATUSES = (("confirmed", 70), ("pending_payment", 25), ("cancelled", 5))
+RATINGS = ((5, 60), (4, 25), (3, 10), (2, 3), (1, 2))
+REVIEW_COMMENTS = ("Muy puntual", "Mi perro vuelve encantado", "Todo perfecto", None)
+DERIVED_COMMANDS = (
+    "python -m tools.backfill_search --only messages",
+    "python -m tools.rebuild_walker_stats",
+    "python -m tools.recompute_ratings",
+)
+DOG_SIZES = ("Pequeño", "Mediano", "Grande")
+BREEDS = ("Mestizo", "Labrador", "Pastor Alemán", "Beagle", "Border Collie", "Galgo", "Caniche", None)
+SPECIALTIES = ("Perros grandes", "Cachorros", "Perros mayores", "Adiestramiento", "Paseos largos", "Gatos")
+ZONES = ("Centro de Lugo", "A Milagrosa", "O Sagrado Corazón", "Paseo do Miño", "San Roque", "Fingoi")
+PHRASES = (
+    "¿A qué hora pasas mañana?", "Todo perfecto, gracias", "Hoy ha comido poco",
+    "Fuimos hasta el Miño", "Recuerda el arnés nuevo", "Graciñas!", "¿Podemos cambiar la hora?",
+)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _poisson(rng: random.Random, lam: float) -> int:
+    # Knuth; fine for the small means we use
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def _weighted(rng: random.Random, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _route(rng: random.Random, points: int, start: datetime):
+    lat, lng = LUGO[0] + rng.uniform(-0.02, 0.02), LUGO[1] + rng.uniform(-0.02, 0.02)
+    ts = start.timestamp()
+    route = []
+    for i in range(points):
+        lat += rng.gauss(0, 0.00015)
+        lng += rng.gauss(0, 0.00015)
+        route.append({"lat": round(lat, 6), "lng": round(lng, 6), "timestamp": ts + i * 5})
+    return route
+
+
+def walker_users(args):
+    """The walker population, shared by every shard"""
+    import server
+    from search import walker_search_fields
+
+    rng = random.Random(f"{args.seed}-walkers")
+    users, walkers = [], []
+    for i in range(args.walkers):
+        user = server.User(id=_uuid(rng), email=f"walker{i}@synthetic.example.com", name=f"Paseador {i}",
+                           role="walker", password_hash=PASSWORD_HASH, created_at=args.epoch - timedelta(days=400))
+        walker = server.Walker(
+            id=_uuid(rng), user_id=user.id, bio=f"Paseos por {rng.choice(ZONES)}",
+            specialties=rng.sample(SPECIALTIES, rng.randint(1, 3)), experience_years=rng.randint(0, 15),
+            location=rng.choice(ZONES), price_from=rng.choice((4.0, 5.0, 6.0)), created_at=user.created_at,
+        )
+        users.append(server.to_document(user))
+        walkers.append({**server.to_document(walker),
+                        "search": walker_search_fields(walker.bio, walker.specialties, walker.location)})
+    return users, walkers
+
+
+def generate_shard(args, shard, start, end, walkers, walker_user_ids):
+    """Yield (collection, document) for owners [start, end)"""
+    import server
+
+    rng = random.Random(f"{args.seed}-{shard}")
+    for i in range(start, end):
+        created = args.epoch - timedelta(days=rng.uniform(0, 365))
+        owner = server.User(id=_uuid(rng), email=f"owner{i}@synthetic.example.com", name=f"Cliente {i}",
+                            password_hash=PASSWORD_HASH, address=rng.choice(ZONES), created_at=created)
+        yield "users", server.to_document(owner)
+
+        dogs = []
+        for _ in range(max(1, _poisson(rng, args.dogs_per_owner))):
+            dog = server.Dog(id=_uuid(rng), owner_id=owner.id, name=f"Can {rng.randint(1, 9999)}",
+                             breed=rng.choice(BREEDS), size=rng.choice(DOG_SIZES), age=rng.randint(1, 15),
+                             created_at=created)
+            dogs.append(dog)
+            yield "dogs", server.to_document(dog)
+
+        booked_walkers = set()
+        for _ in range(_poisson(rng, args.bookings_per_owner)):
+            walker_index = int(rng.paretovariate(1.2)) % len(walkers)  # a few popular walkers
+            walker = walkers[walker_index]
+            booked_walkers.add(walker_index)
+            service_type = rng.choice(tuple(SERVICES))
+            amount, duration = SERVICES[service_type]
+            start_at = (args.epoch + timedelta(days=rng.uniform(-args.history_days, 30))).replace(
+                minute=rng.choice((0, 30)), second=0, microsecond=0)
+            status = _weighted(rng, PAST_STATUSES if start_at < args.epoch else FUTURE_STATUSES)
+            local_start = start_at.astimezone(server.SERVICE_TIMEZONE)
+            booking = server.Booking(
+                id=_uuid(rng), owner_id=owner.id, walker_id=walker["id"], dog_id=rng.choice(dogs).id,
+                service_type=service_type, date=local_start.strftime("%Y-%m-%d"), time=local_start.strftime("%H:%M"),
+                duration=duration, amount=amount, location=owner.address, status=status, start_at=start_at,
+                walker_user_id=walker_user_ids[walker["id"]],
+                created_at=start_at - timedelta(days=rng.uniform(0.1, 14)),
+            )
+            yield "bookings", server.to_document(booking)
+
+            if status != "pending_payment":
+                yield "payment_transactions", server.to_document(server.PaymentTransaction(
+                    id=_uuid(rng), session_id=f"cs_synthetic_{_uuid(rng)}", booking_id=booking.id, user_id=owner.id,
+                    amount=amount, payment_status="paid", status="completed",
+                    metadata={"booking_id": booking.id}, created_at=booking.created_at,
+                ))
+
+            if status == "completed":
+                points = max(2, int(rng.gauss(args.route_points, args.route_points / 4)))
+                yield "walks", server.to_document(server.Walk(
+                    id=_uuid(rng), booking_id=booking.id, owner_user_id=owner.id,
+                    walker_user_id=booking.walker_user_id, start_time=start_at,
+                    end_time=start_at + timedelta(minutes=duration), route_data=_route(rng, points, start_at),
+                    report_text="Paseo tranquilo", status="completed", created_at=start_at,
+                ))
+                if rng.random() < args.review_rate:
+                    yield "reviews", server.to_document(server.Review(
+                        id=_uuid(rng), booking_id=booking.id, walker_id=walker["id"], owner_id=owner.id,
+                        rating=_weighted(rng, RATINGS), comment=rng.choice(REVIEW_COMMENTS),
+                        created_at=start_at + timedelta(minutes=duration + rng.uniform(5, 600)),
+                    ))
+
+        partners = [walker_user_ids[walkers[w]["id"]] for w in booked_walkers] or [walker_user_ids[rng.choice(walkers)["id"]]]
+        for _ in range(_poisson(rng, args.messages_per_owner)):
+            partner = rng.choice(partners)
+            sent = args.epoch - timedelta(days=rng.expovariate(1 / 30))
+            sender, recipient = (owner.id, partner) if rng.random() < 0.5 else (partner, owner.id)
+            yield "messages", server.to_document(server.Message(
+                id=_uuid(rng), sender_id=sender, recipient_id=recipient, message=rng.choice(PHRASES),
+                read=sent < args.epoch - timedelta(days=2) or rng.random() < 0.5, created_at=sent,
+            ))
+
+
+def run_shard(job):
+    args, shard, start, end, walkers, walker_user_ids = job
+    db = MongoClient(args.mongo_url)[args.db_name]
+    batches, counts = {}, {}
+    for name, doc in generate_shard(args, shard, start, end, walkers, walker_user_ids):
+        batch = batches.setdefault(name, [])
+        batch.append(doc)
+        if len(batch) >= args.batch_size:
+            db[name].insert_many(batch, ordered=False)
+            counts[name] = counts.get(name, 0) + len(batch)
+            batch.clear()
+    for name, batch in batches.items():
+        if batch:
+            db[name].insert_many(batch, ordered=False)
+            counts[name] = counts.get(name, 0) + len(batch)
+    return counts
+
+
+async def derive(args):
+    """Rebuild the derived collections from what the shards wrote"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from tools.backfill_search import backfill_messages
+    from tools.rebuild_walker_stats import rebuild
+    from tools.recompute_ratings import recompute
+
+    client = AsyncIOMotorClient(args.mongo_url, tz_aware=True)
+    db = client[args.db_name]
+    try:
+        return {
+            "message_search": await backfill_messages(db, args.batch_size, False),
+            "walker_stats": await rebuild(db, False),
+            "ratings": await recompute(db, args.batch_size, False),
+        }
+    finally:
+        client.close()
+
+
+def main(args):
+    # server.py (imported for its models, also by the workers) reads these at import time
+    os.environ.setdefault('MONGO_URL', args.mongo_url)
+    os.environ.setdefault('DB_NAME', args.db_name)
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    client = MongoClient(args.mongo_url)
+    db = client[args.db_name]
+    if args.drop:
+        client.drop_database(args.db_name)
+
+    started = time.perf_counter()
+    users, walkers = walker_users(args)
+    db.users.insert_many(users, ordered=False)
+    db.walkers.insert_many(walkers, ordered=False)
+    walker_user_ids = {w["id"]: w["user_id"] for w in walkers}
+
+    shard_size = math.ceil(args.owners / args.shards)
+    jobs = [
+        (args, shard, shard * shard_size, min(args.owners, (shard + 1) * shard_size), walkers, walker_user_ids)
+        for shard in range(args.shards) if shard * shard_size < args.owners
+    ]
+    totals = {"users": len(users), "walkers": len(walkers)}
+    with Pool(args.workers) as pool:
+        for counts in pool.imap_unordered(run_shard, jobs):
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+            print(f"shard done: {counts}", flush=True)
+
+    elapsed = time.perf_counter() - started
+    documents = sum(totals.values())
+    report = {"seed": args.seed, "documents": documents, "collections": totals,
+              "seconds": round(elapsed, 1), "docs_per_second": round(documents / elapsed)}
+    if args.skip_derived:
+        print("Derived collections not built; from the backend directory run:", *DERIVED_COMMANDS, sep="\n    ")
+    else:
+        derived_started = time.perf_counter()
+        report["derived"] = asyncio.run(derive(args))
+        report["derived_seconds"] = round(time.perf_counter() - derived_started, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream synthetic documents into MongoDB")
+    parser.add_argument("--mongo-url", default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument("--db-name", default=os.environ.get('DB_NAME', 'paseoslugo_synthetic'))
+    parser.add_argument("--owners", type=int, default=10000)
+    parser.add_argument("--walkers", type=int, default=200)
+    parser.add_argument("--dogs-per-owner", type=float, default=1.3, help="Poisson mean, at least one dog")
+    parser.add_argument("--bookings-per-owner", type=float, default=8, help="Poisson mean")
+    parser.add_argument("--messages-per-owner", type=float, default=20, help="Poisson mean")
+    parser.add_argument("--route-points", type=int, default=400, help="mean GPS fixes per completed walk")
+    parser.add_argument("--review-rate", type=float, default=0.4, help="share of completed walks reviewed")
+    parser.add_argument("--history-days", type=int, default=365)
+    parser.add_argument("--epoch", type=lambda s: datetime.fromisoformat(s).replace(tzinfo=timezone.utc),
+                        default="2025-06-01", help="the dataset's 'now'; fixed so runs are reproducible")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=64, help="independent seeded partitions of the owners")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop", action="store_true", help="drop the database first")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="print the commands that build message_search, walker_stats and ratings instead")
+    main(parser.parse_args())
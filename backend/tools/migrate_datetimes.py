@@ -0,0 +1,81 @@
+"""One-off migration: convert ISO-string dates to native BSON dates.
+
+Run from the backend directory:
+
+    python -m tools.migrate_datetimes [--batch-size 1000] [--dry-run]
+
+Documents are walked in _id order and rewritten with bulk updates, so the
+script can be interrupted and re-run safely; already converted documents are
+skipped by the string type filter.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from persistence import DATETIME_FIELDS, as_utc, booking_start_at
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def migrate_collection(db, name, fields, batch_size, dry_run):
+    collection = db[name]
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    if name == "bookings":
+        query["$or"].append({"start_at": {"$exists": False}})
+
+    projection = {field: 1 for field in fields}
+    if name == "bookings":
+        projection.update({"date": 1, "time": 1, "start_at": 1})
+
+    converted = 0
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        docs = await collection.find(batch_query, projection).sort("_id", 1).to_list(batch_size)
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            update = {}
+            for field in fields:
+                if isinstance(doc.get(field), str):
+                    update[field] = as_utc(doc[field])
+            if name == "bookings" and "start_at" not in doc:
+                update["start_at"] = booking_start_at(doc.get("date"), doc.get("time"))
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+
+        if ops and not dry_run:
+            await collection.bulk_write(ops, ordered=False)
+        converted += len(ops)
+        last_id = docs[-1]["_id"]
+
+    return converted
+
+
+async def main(batch_size, dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name, fields in DATETIME_FIELDS.items():
+            converted = await migrate_collection(db, name, fields, batch_size, dry_run)
+            print(f"{name}: {converted} documents {'to convert' if dry_run else 'converted'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ISO-string dates to native BSON dates")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
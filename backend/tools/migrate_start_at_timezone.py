@@ -0,0 +1,98 @@
+"""One-off migration: recompute bookings' start_at in Lugo local time.
+
+start_at used to be derived from the booking's date and time as if they were
+UTC, so every stored value is one or two hours late. Run from the backend
+directory after deploying the fix:
+
+    python -m tools.migrate_start_at_timezone [--batch-size 1000] [--dry-run]
+
+Live and archived bookings are walked in _id order and only documents whose
+start_at differs from the recomputed value are rewritten, so the script can
+be interrupted and re-run safely. Rebuild the rollups afterwards, since their
+day buckets came from the old values:
+
+    python -m tools.rebuild_walker_stats
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from persistence import as_utc, booking_start_at
+from repositories import BookingsArchiveRepository, pack, unpack
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def _bookings_update(doc):
+    start_at = booking_start_at(doc.get("date"), doc.get("time"))
+    if start_at is None or as_utc(doc.get("start_at")) == start_at:
+        return None
+    return {"$set": {"start_at": start_at}}
+
+
+def _archive_update(record):
+    booking = unpack(record)
+    start_at = booking_start_at(booking.get("date"), booking.get("time"))
+    if start_at is None or as_utc(booking.get("start_at")) == start_at:
+        return None
+    booking["_id"] = record["_id"]
+    booking["start_at"] = start_at
+    repacked = pack(booking, BookingsArchiveRepository.keys)
+    return {"$set": {"data": repacked["data"], "start_at": start_at}}
+
+
+COLLECTIONS = {
+    "bookings": ({"_id": 1, "date": 1, "time": 1, "start_at": 1}, _bookings_update),
+    "bookings_archive": ({"_id": 1, "data": 1}, _archive_update),
+}
+
+
+async def migrate_collection(db, name, batch_size, dry_run):
+    collection = db[name]
+    fields, build_update = COLLECTIONS[name]
+
+    migrated = 0
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        docs = await collection.find(query, fields).sort("_id", 1).to_list(batch_size)
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            update = build_update(doc)
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, update))
+
+        if ops and not dry_run:
+            await collection.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+        last_id = docs[-1]["_id"]
+
+    return migrated
+
+
+async def main(batch_size, dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name in COLLECTIONS:
+            migrated = await migrate_collection(db, name, batch_size, dry_run)
+            print(f"{name}: {migrated} documents {'to migrate' if dry_run else 'migrated'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute bookings' start_at in Lugo local time")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
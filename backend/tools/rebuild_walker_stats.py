@@ -0,0 +1,98 @@
+"""Rebuild the walker_stats rollups from the live and archived bookings.
+
+Run from the backend directory, once after deploying the rollups and again
+whenever they are suspected to have drifted:
+
+    python -m tools.rebuild_walker_stats [--dry-run]
+
+Each walker's bookings are read with a small projection, together with their
+records in bookings_archive (unpacked; a booking caught mid-archive counts
+once), and counted with booking_stats, the rule the incremental updates use,
+into local days, weeks and months and the totals. Each walker's document is
+replaced in one write, but bookings changing while the rebuild runs can be
+missed, so run it when traffic is low.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from repositories import STAT_FIELDS, booking_stats, period_keys, unpack
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+# What booking_stats and the buckets need from a booking
+FIELDS = {"_id": 0, "id": 1, "walker_id": 1, "status": 1, "amount": 1, "start_at": 1, "cancelled_from": 1,
+          "cancel_reason": 1}
+# Archived records checked against the live collection at a time
+ARCHIVE_BATCH = 1000
+
+
+def _add(bucket, stats):
+    for field in STAT_FIELDS:
+        bucket[field] = bucket.get(field, 0) + stats[field]
+
+
+async def fold(walker_id, bookings):
+    doc = {"walker_id": walker_id, "total": {}, "days": {}, "weeks": {}, "months": {}}
+    async for booking in bookings:
+        stats = booking_stats(booking)
+        _add(doc["total"], stats)
+        if booking.get("start_at") is None:
+            continue
+        for kind, key in period_keys(booking["start_at"]).items():
+            _add(doc[kind].setdefault(key, {}), stats)
+    return doc
+
+
+async def _not_live(db, records):
+    # Archived then not yet deleted: the live copy is the current one, and it was counted already
+    live = set(await db.bookings.distinct("id", {"id": {"$in": [record["id"] for record in records]}}))
+    return [unpack(record) for record in records if record["id"] not in live]
+
+
+async def walker_bookings(db, walker_id):
+    """The walker's live bookings, then its archived ones, streamed"""
+    async for booking in db.bookings.find({"walker_id": walker_id}, FIELDS):
+        yield booking
+    records = []
+    async for record in db.bookings_archive.find({"walker_id": walker_id}, {"_id": 0, "id": 1, "data": 1}):
+        records.append(record)
+        if len(records) >= ARCHIVE_BATCH:
+            for booking in await _not_live(db, records):
+                yield booking
+            records = []
+    if records:
+        for booking in await _not_live(db, records):
+            yield booking
+
+
+async def rebuild(db, dry_run):
+    walker_ids = set(await db.bookings.distinct("walker_id")) | set(await db.bookings_archive.distinct("walker_id"))
+    walker_ids.discard(None)
+    for walker_id in sorted(walker_ids):
+        if not dry_run:
+            doc = await fold(walker_id, walker_bookings(db, walker_id))
+            await db.walker_stats.replace_one({"walker_id": walker_id}, doc, upsert=True)
+    return len(walker_ids)
+
+
+async def main(dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        walkers = await rebuild(db, dry_run)
+        print(f"walker_stats: {walkers} walkers {'to rebuild' if dry_run else 'rebuilt'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild walker_stats rollups from bookings")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run))
@@ -0,0 +1,80 @@
+"""Recompute walker rating aggregates from the reviews collection.
+
+Run from the backend directory:
+
+    python -m tools.recompute_ratings [--batch-size 500] [--dry-run]
+
+Reviews are summed per walker by an aggregation pipeline and the walkers'
+rating_sum, reviews_count and rating are rewritten with bulk updates of
+--batch-size. Walkers that have a count but no reviews left are reset to the
+defaults. Safe to re-run; reviews written while it runs are picked up by the
+next run.
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+DEFAULT_RATING = 4.9
+
+PIPELINE = [
+    {"$group": {"_id": "$walker_id", "rating_sum": {"$sum": "$rating"}, "reviews_count": {"$sum": 1}}},
+]
+
+
+async def recompute(db, batch_size, dry_run):
+    updated = 0
+    reviewed = []
+    ops = []
+
+    async def flush():
+        nonlocal updated
+        if ops and not dry_run:
+            await db.walkers.bulk_write(ops, ordered=False)
+        updated += len(ops)
+        ops.clear()
+
+    async for row in db.reviews.aggregate(PIPELINE, allowDiskUse=True):
+        reviewed.append(row["_id"])
+        ops.append(UpdateOne({"id": row["_id"]}, {"$set": {
+            "rating_sum": row["rating_sum"],
+            "reviews_count": row["reviews_count"],
+            "rating": round(row["rating_sum"] / row["reviews_count"], 2),
+        }}))
+        if len(ops) >= batch_size:
+            await flush()
+    await flush()
+
+    # Walkers whose reviews are all gone
+    stale = {"reviews_count": {"$gt": 0}, "id": {"$nin": reviewed}}
+    reset = {"$set": {"rating_sum": 0, "reviews_count": 0, "rating": DEFAULT_RATING}}
+    if dry_run:
+        updated += await db.walkers.count_documents(stale)
+    else:
+        updated += (await db.walkers.update_many(stale, reset)).modified_count
+    return updated
+
+
+async def main(batch_size, dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        updated = await recompute(db, batch_size, dry_run)
+        print(f"walkers: {updated} {'to update' if dry_run else 'updated'}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute walker ratings from reviews")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
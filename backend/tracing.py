@@ -0,0 +1,129 @@
+"""Per-route latency metrics and sampled request traces.
+
+LatencyMiddleware records a latency histogram per route template, an
+in-flight gauge and status counters. A fraction of requests (TRACE_SAMPLE_RATE)
+also carry a Trace; code marks interesting sections with `with span("auth"):`
+and unsampled requests get a shared no-op span, so the hot path allocates
+nothing extra. Sampled requests slower than SLOW_REQUEST_MS are logged with
+their span breakdown, MongoDB time included.
+"""
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+
+from instrumentation import current_queries, route_template
+from metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+RESPONSES = Counter("http_responses_total", "HTTP responses by status code", ["method", "route", "status"])
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ["method", "route"])
+
+
+class Span:
+    __slots__ = ("trace", "name", "start", "duration")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        self.trace.spans.append(self)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    __slots__ = ("start", "spans")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.spans: List[Span] = []
+
+    def summary(self, total: float) -> str:
+        parts = [f"{s.name}={s.duration * 1000:.1f}ms@{(s.start - self.start) * 1000:.1f}" for s in self.spans]
+        queries = current_queries()
+        if queries is not None and queries.count:
+            parts.append(f"db={queries.total_ms:.1f}ms/{queries.count}q")
+        return f"total={total * 1000:.1f}ms " + " ".join(parts)
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def span(name: str):
+    trace = _trace.get()
+    if trace is None:
+        return _NOOP_SPAN
+    return Span(trace, name)
+
+
+class LatencyMiddleware:
+    def __init__(self, app, sample_rate: float = TRACE_SAMPLE_RATE, slow_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        trace = None
+        token = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            trace = Trace(start)
+            token = _trace.set(trace)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - start
+            route = route_template(scope)
+            method = scope["method"]
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            RESPONSES.inc(method, route, status)
+            if elapsed > self.slow_seconds:
+                SLOW_REQUESTS.inc(method, route)
+                if trace is not None:
+                    logger.warning("Slow request %s %s -> %s: %s", method, scope["path"], status, trace.summary(elapsed))
+            if token is not None:
+                _trace.reset(token)
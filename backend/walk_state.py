@@ -0,0 +1,304 @@
+"""In-memory state for walks in progress, persisted write-behind.
+
+While a walk is in progress its document lives in the worker's memory:
+GPS fixes are appended there and owner polls are answered from it. Fixes
+are flushed to MongoDB in one $push $each per walk every
+WALK_FLUSH_INTERVAL seconds, and immediately when the walk completes, so a
+walk costs a few writes per minute instead of one per fix.
+
+Fixes for one walk can reach several workers, each with its own buffer, so
+flushes arrive out of order; the push sorts route_data by timestamp, and
+each flush returns the stored route, which also brings in fixes other
+workers flushed. Every worker's copy is thus at most one interval behind
+MongoDB. Changes that bypass the buffer (report, photos) and completion
+are announced on the WALK_EVENTS channel of the SharedState: on
+completion every worker flushes its buffer for the walk and drops it,
+otherwise it reloads the document. Walks that get no fixes for
+WALK_IDLE_EVICT seconds are dropped and read from MongoDB again.
+
+With a SharedState, each worker also keeps a write-ahead log of the fixes
+it has not flushed yet, one small entry per walk that is rewritten with
+every fix and cleared by the flush, and renews a heartbeat lease while it
+runs. Every flush (and finishing a walk) looks at the logs other workers
+left for the walk; one whose writer's heartbeat ran out belongs to a worker
+that died, so its fixes are pushed to the walk (minus any that were stored
+before the crash) and the log is dropped. A crash thus delays the fixes by
+up to WALK_WORKER_TTL seconds instead of losing them, unless the walk is
+completed within that time. The log costs one small SharedState write per
+fix. With InMemorySharedState, or none, the log dies with the process, so a
+crash loses the buffered fixes; a clean shutdown flushes everything. Set
+WALK_FLUSH_INTERVAL to 0 to write every fix through instead.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from repositories import Repositories
+from shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+WALK_FLUSH_INTERVAL = float(os.environ.get('WALK_FLUSH_INTERVAL', '10'))
+WALK_IDLE_EVICT = float(os.environ.get('WALK_IDLE_EVICT', '120'))
+# A worker whose heartbeat is older than this is taken for dead and its logs are replayed
+WALK_WORKER_TTL = float(os.environ.get('WALK_WORKER_TTL', '60'))
+# Logs of walks that nobody finished or recovered
+WALK_LOG_TTL = float(os.environ.get('WALK_LOG_TTL', str(24 * 3600)))
+WALK_EVENTS = "walks"
+
+# Route points are kept in fix order
+ROUTE_ORDER = {"timestamp": 1}
+
+
+def _timestamp(point: Dict[str, float]) -> float:
+    return point.get("timestamp") or 0.0
+
+
+def _last_timestamp(route: List[Dict[str, float]]) -> Optional[float]:
+    return max(map(_timestamp, route)) if route else None
+
+
+def _same_fix(point: Dict[str, float]):
+    return point.get("timestamp"), point.get("lat"), point.get("lng")
+
+
+def _log_key(booking_id: str, worker_id: str) -> str:
+    return f"walk_log:{booking_id}:{worker_id}"
+
+
+def _writers_key(booking_id: str) -> str:
+    return f"walk_writers:{booking_id}"
+
+
+def _heartbeat_key(worker_id: str) -> str:
+    return f"walk_worker:{worker_id}"
+
+
+class ActiveWalk:
+    __slots__ = ("doc", "pending", "flushing", "synced_until", "last_write")
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.doc = doc
+        self.pending: List[Dict[str, float]] = []
+        self.flushing: List[Dict[str, float]] = []  # being pushed; still in the log
+        self.synced_until = _last_timestamp(doc.get("route_data") or [])
+        self.last_write = time.monotonic()
+
+
+class ActiveWalkStore:
+    def __init__(self, repos: Repositories, shared_state: Optional[SharedState] = None,
+                 flush_interval: float = WALK_FLUSH_INTERVAL, idle_evict: float = WALK_IDLE_EVICT):
+        """Without a `shared_state` (a single worker) nothing is announced"""
+        self.repos = repos
+        self.shared_state = shared_state
+        self.flush_interval = flush_interval
+        self.idle_evict = idle_evict
+        self.walks: Dict[str, ActiveWalk] = {}
+        self.worker_id = uuid.uuid4().hex
+        self.worker_ttl = max(WALK_WORKER_TTL, 3 * flush_interval)
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def get(self, booking_id: str) -> Optional[Dict[str, Any]]:
+        """The live walk document, unflushed fixes included"""
+        walk = self.walks.get(booking_id)
+        return walk.doc if walk else None
+
+    async def track(self, booking_id: str) -> Optional[ActiveWalk]:
+        """Load a walk into memory if it is in progress"""
+        walk = self.walks.get(booking_id)
+        if walk is not None or self.flush_interval <= 0:
+            return walk
+        doc = await self.repos.walks.get(booking_id)
+        if not doc or doc.get("status") != "in_progress":
+            return None
+        doc.setdefault("route_data", [])
+        walk = self.walks[booking_id] = ActiveWalk(doc)
+        if self.shared_state is not None:
+            await self.shared_state.add_member(_writers_key(booking_id), self.worker_id, ttl=WALK_LOG_TTL)
+        return walk
+
+    async def add_point(self, booking_id: str, point: Dict[str, float]) -> Optional[ActiveWalk]:
+        """Buffer a fix; None if the walk is not in progress (the caller writes it directly)"""
+        walk = await self.track(booking_id)
+        if walk is None:
+            return None
+        route = walk.doc["route_data"]
+        route.append(point)
+        if len(route) > 1 and _timestamp(route[-2]) > _timestamp(point):
+            route.sort(key=_timestamp)
+        walk.pending.append(point)
+        walk.last_write = time.monotonic()
+        await self._log(booking_id, walk)
+        return walk
+
+    async def apply(self, booking_id: str, fields: Dict[str, Any] = None, push: Dict[str, Any] = None):
+        """Mirror a write that went straight to MongoDB, and have other workers reload the walk"""
+        walk = self.walks.get(booking_id)
+        if walk is not None:
+            walk.doc.update(fields or {})
+            for field, value in (push or {}).items():
+                walk.doc.setdefault(field, []).append(value)
+        await self._announce(booking_id, "changed")
+
+    async def _log(self, booking_id: str, walk: ActiveWalk):
+        """Mirror the walk's unflushed fixes into the write-ahead log"""
+        if self.shared_state is None:
+            return
+        unflushed = walk.flushing + walk.pending
+        try:
+            if unflushed:
+                await self.shared_state.set(_log_key(booking_id, self.worker_id), unflushed, ttl=WALK_LOG_TTL)
+            else:
+                await self.shared_state.delete(_log_key(booking_id, self.worker_id))
+        except Exception:
+            # The fixes are still buffered; only a crash before the next flush would lose them
+            logger.exception("Logging walk %s failed", booking_id)
+
+    def _merge(self, walk: ActiveWalk, stored: Optional[Dict[str, Any]]):
+        """Take the route a push returned, with the fixes still pending on top"""
+        if stored is None:
+            return
+        route = stored.get("route_data") or []
+        walk.doc["route_data"] = sorted(route + walk.pending, key=_timestamp) if walk.pending else route
+        if route:
+            walk.synced_until = _last_timestamp(route)
+
+    async def _flush(self, booking_id: str, walk: ActiveWalk):
+        points, walk.pending = walk.pending, []
+        walk.flushing = points
+        try:
+            stored = await self.repos.walks.push_many(booking_id, "route_data", points, sort=ROUTE_ORDER)
+        except Exception:
+            # Keep them for the next group commit
+            walk.pending[:0] = points
+            raise
+        finally:
+            walk.flushing = []
+        self._merge(walk, stored)
+        await self._log(booking_id, walk)
+
+    async def _recover(self, booking_id: str, walk: Optional[ActiveWalk] = None):
+        """Push the fixes that workers which died left in their logs for this walk"""
+        if self.shared_state is None:
+            return
+        writers = await self.shared_state.get(_writers_key(booking_id)) or []
+        for writer in writers:
+            if writer == self.worker_id or not await self.shared_state.get(_log_key(booking_id, writer)):
+                continue
+            # Taking the heartbeat lease succeeds only once the writer has stopped renewing it,
+            # and keeps other workers off its logs while this one replays them
+            if not await self.shared_state.acquire_lease(_heartbeat_key(writer), self.worker_id, self.worker_ttl):
+                continue
+            try:
+                points = await self.shared_state.get(_log_key(booking_id, writer)) or []
+                if walk is not None:
+                    route = walk.doc["route_data"]
+                else:
+                    route = (await self.repos.walks.get(booking_id) or {}).get("route_data") or []
+                # The writer may have died between its push and clearing the log
+                stored = {_same_fix(point) for point in route}
+                points = [point for point in points if _same_fix(point) not in stored]
+                if points:
+                    result = await self.repos.walks.push_many(booking_id, "route_data", points, sort=ROUTE_ORDER)
+                    if walk is not None:
+                        self._merge(walk, result)
+                    logger.warning("Recovered %d fixes of walk %s logged by worker %s", len(points), booking_id, writer)
+                await self.shared_state.delete(_log_key(booking_id, writer))
+            finally:
+                await self.shared_state.release_lease(_heartbeat_key(writer), self.worker_id)
+
+    async def flush(self):
+        now = time.monotonic()
+        for booking_id, walk in list(self.walks.items()):
+            try:
+                await self._recover(booking_id, walk)
+            except Exception:
+                logger.exception("Recovering walk %s failed", booking_id)
+            if walk.pending:
+                try:
+                    await self._flush(booking_id, walk)
+                except Exception:
+                    logger.exception("Flushing walk %s failed", booking_id)
+            elif now - walk.last_write > self.idle_evict:
+                del self.walks[booking_id]
+
+    async def finish(self, booking_id: str):
+        """Flush a walk's fixes and stop tracking it, on every worker (on completion)"""
+        await self._drop(booking_id)
+        await self._recover(booking_id)
+        await self._announce(booking_id, "finished")
+
+    async def _drop(self, booking_id: str):
+        walk = self.walks.pop(booking_id, None)
+        if walk is not None and walk.pending:
+            await self._flush(booking_id, walk)
+
+    async def _reload(self, booking_id: str):
+        walk = self.walks.get(booking_id)
+        doc = await self.repos.walks.get(booking_id) if walk is not None else None
+        if walk is None or self.walks.get(booking_id) is not walk:
+            return
+        if not doc or doc.get("status") != "in_progress":
+            await self._drop(booking_id)
+            return
+        doc["route_data"] = sorted((doc.get("route_data") or []) + walk.pending, key=_timestamp)
+        walk.doc = doc
+
+    async def _announce(self, booking_id: str, event: str):
+        if self.shared_state is None:
+            return
+        try:
+            await self.shared_state.publish(WALK_EVENTS, {"booking_id": booking_id, "event": event,
+                                                          "worker": self.worker_id})
+        except Exception:
+            # Other workers catch up on their next flush or eviction
+            logger.exception("Announcing walk %s %s failed", booking_id, event)
+
+    async def _listen(self):
+        async for message in self.shared_state.subscribe(WALK_EVENTS):
+            if message.get("worker") == self.worker_id or message.get("booking_id") not in self.walks:
+                continue
+            try:
+                if message.get("event") == "finished":
+                    await self._drop(message["booking_id"])
+                else:
+                    await self._reload(message["booking_id"])
+            except Exception:
+                logger.exception("Handling walk event %s failed", message)
+
+    async def _heartbeat(self):
+        try:
+            await self.shared_state.acquire_lease(_heartbeat_key(self.worker_id), self.worker_id, self.worker_ttl)
+        except Exception:
+            logger.exception("Renewing the walk worker heartbeat failed")
+
+    async def _run(self):
+        while True:
+            if self.shared_state is not None:
+                await self._heartbeat()
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None and self.flush_interval > 0:
+            self._task = loop.create_task(self._run())
+        if self._listener is None and self.shared_state is not None:
+            self._listener = loop.create_task(self._listen())
+
+    async def close(self):
+        for task in (self._task, self._listener):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._listener = None
+        await self.flush()
+        if self.shared_state is not None:
+            await self.shared_state.release_lease(_heartbeat_key(self.worker_id), self.worker_id)
@@ -43,7 +43,9 @@ export default function Seguimiento() {
         axios.get(`${API}/bookings/${bookingId}`, {
           headers: { Authorization: `Bearer ${token}` }
         }),
-        axios.get(`${API}/walks/${bookingId}`),
+        axios.get(`${API}/walks/${bookingId}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        }),
       ]);
       setBooking(bookingRes.data);
       setWalk(walkRes.data);
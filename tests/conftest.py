@@ -0,0 +1,47 @@
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "paseoslugo_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient(tz_aware=True)["paseoslugo_test"]
+
+
+async def add_user(db, role: str = "owner") -> dict:
+    """A user with a live session; returns its id and bearer token"""
+    import server
+    user = server.User(email=f"{role}-{uuid.uuid4().hex[:8]}@example.com", name=role.title(), role=role)
+    token = f"test-{user.id}"
+    await db.users.insert_one(server.to_document(user))
+    await db.user_sessions.insert_one(server.to_document(server.UserSession(
+        session_token=token, user_id=user.id, expires_at=datetime.now(timezone.utc) + timedelta(days=1))))
+    return {"id": user.id, "token": token, "headers": {"Authorization": f"Bearer {token}"}}
+
+
+@pytest.fixture
+async def api(db):
+    """An httpx client on the app, run against the mongomock database"""
+    import httpx
+    import server
+    app = server.create_app(db)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            yield client
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from archive import POLICIES, archive_collection
+from repositories import unpack
+from tests.conftest import add_user
+from tools import rebuild_walker_stats
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2026, 7, 1, tzinfo=timezone.utc)
+
+
+async def add_bookings(db, owner_id, count, days_ago, status="completed"):
+    docs = []
+    for i in range(count):
+        start_at = NOW - timedelta(days=days_ago, hours=i)
+        docs.append(server.to_document(server.Booking(
+            owner_id=owner_id, walker_id="walker", walker_user_id="walker-user", dog_id="dog",
+            service_type="estandar", date="2025-01-01", time="10:00", duration=45, amount=22.0,
+            status=status, start_at=start_at,
+        )))
+    await db.bookings.insert_many(docs)
+    return [doc["id"] for doc in docs]
+
+
+async def test_old_closed_bookings_move_to_the_archive(db):
+    old = await add_bookings(db, "owner", 3, days_ago=400)
+    recent = await add_bookings(db, "owner", 2, days_ago=10)
+    open_old = await add_bookings(db, "owner", 1, days_ago=400, status="confirmed")
+    original = await db.bookings.find_one({"id": old[0]}, {"_id": 0})
+
+    assert await archive_collection(db, POLICIES["bookings"], now=NOW) == 3
+    assert sorted(await db.bookings.distinct("id")) == sorted(recent + open_old)
+    records = await db.bookings_archive.find().to_list(None)
+    assert sorted(record["id"] for record in records) == sorted(old)
+    assert unpack(next(record for record in records if record["id"] == old[0])) == original
+
+
+async def test_an_interrupted_run_resumes_from_its_checkpoint(db):
+    old = await add_bookings(db, "owner", 5, days_ago=400)
+    assert await archive_collection(db, POLICIES["bookings"], batch_size=2, max_batches=1, now=NOW) == 2
+    checkpoint = await db.archive_checkpoints.find_one({"_id": "bookings"})
+    assert checkpoint["moved"] == 2
+
+    # The resumed run keeps the first run's cutoff, whatever the time now
+    later = NOW + timedelta(days=30)
+    await add_bookings(db, "owner", 1, days_ago=340)  # past the cutoff from `later`, not the checkpoint's
+    assert await archive_collection(db, POLICIES["bookings"], batch_size=2, resume=True, now=later) == 3
+    assert sorted(await db.bookings_archive.distinct("id")) == sorted(old)
+    assert await db.bookings.count_documents({}) == 1
+
+
+async def test_archived_bookings_are_still_readable(api, db):
+    owner = await add_user(db)
+    [booking_id] = await add_bookings(db, owner["id"], 1, days_ago=400)
+    await add_bookings(db, owner["id"], 1, days_ago=10)
+    await archive_collection(db, POLICIES["bookings"], now=NOW)
+    assert await db.bookings.count_documents({"id": booking_id}) == 0
+
+    response = await api.get(f"/api/bookings/{booking_id}", headers=owner["headers"])
+    assert response.status_code == 200
+    assert response.json()["id"] == booking_id
+    response = await api.get("/api/bookings", headers=owner["headers"])
+    assert booking_id in [booking["id"] for booking in response.json()]
+
+
+async def test_rebuilt_stats_include_archived_bookings(db):
+    await add_bookings(db, "owner", 3, days_ago=400)
+    await add_bookings(db, "owner", 2, days_ago=10, status="cancelled")
+    await rebuild_walker_stats.rebuild(db, dry_run=False)
+    before = await db.walker_stats.find_one({"walker_id": "walker"}, {"_id": 0})
+
+    await archive_collection(db, POLICIES["bookings"], now=NOW)
+    # A booking archived but not yet deleted from bookings is counted once
+    record = await db.bookings_archive.find_one({})
+    await db.bookings.insert_one({"_id": record["_id"], **unpack(record)})
+    await rebuild_walker_stats.rebuild(db, dry_run=False)
+    assert await db.walker_stats.find_one({"walker_id": "walker"}, {"_id": 0}) == before
+    assert before["total"] == {"booked": 5, "completed": 3, "cancelled": 2, "earnings": 66.0}
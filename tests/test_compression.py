@@ -0,0 +1,84 @@
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from compression import CompressionMiddleware, PrecompressedCache, compress
+
+pytestmark = pytest.mark.anyio
+
+BIG = b'{"route": "' + b"x" * 5000 + b'"}'
+cache = PrecompressedCache(min_size=100)
+
+
+async def big(request):
+    return Response(BIG, media_type="application/json", headers={"Vary": "Origin"})
+
+
+async def small(request):
+    return Response(b'{"ok": true}', media_type="application/json")
+
+
+async def image(request):
+    return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+
+async def final(request: Request):
+    return await cache.response(request, BIG)
+
+
+def client(**options):
+    app = Starlette(routes=[Route("/big", big), Route("/small", small), Route("/image", image),
+                            Route("/final", final)])
+    app.add_middleware(CompressionMiddleware, min_size=100, **options)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_compressed_responses_keep_the_apps_vary():
+    async with client() as api:
+        response = await api.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Origin, Accept-Encoding"
+    assert response.content == BIG
+
+
+async def test_uncompressed_variants_still_vary_on_accept_encoding():
+    async with client() as api:
+        small_response = await api.get("/small", headers={"Accept-Encoding": "gzip"})
+        identity = await api.get("/big", headers={"Accept-Encoding": "identity"})
+        png = await api.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small_response.headers
+    assert small_response.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in identity.headers
+    assert identity.headers["vary"] == "Origin, Accept-Encoding"
+    # Never compressed, so it does not vary
+    assert "vary" not in png.headers
+
+
+async def test_large_bodies_are_compressed_off_the_event_loop():
+    calls = []
+
+    async def run_blocking(fn, *args):
+        calls.append(len(args[0]))
+        return fn(*args)
+
+    async with client(run_blocking=run_blocking, blocking_size=4096) as api:
+        await api.get("/big", headers={"Accept-Encoding": "gzip"})
+        await api.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert calls == [len(BIG)]
+
+
+async def test_if_none_match_is_parsed_as_a_list():
+    etag = cache.etag(BIG)
+    async with client() as api:
+        listed = await api.get("/final", headers={"If-None-Match": f'"other", W/{etag}'})
+        other = await api.get("/final", headers={"If-None-Match": '"other", "another"', "Accept-Encoding": "gzip"})
+        anything = await api.get("/final", headers={"If-None-Match": "*"})
+    assert listed.status_code == 304
+    assert anything.status_code == 304
+    assert other.status_code == 200
+    assert other.headers["content-encoding"] == "gzip"
+    assert other.content == BIG
+    assert cache.get(etag, "gzip") == compress(BIG, "gzip", True)
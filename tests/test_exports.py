@@ -0,0 +1,27 @@
+import csv
+import io
+
+import pytest
+
+from exports import csv_chunks
+
+pytestmark = pytest.mark.anyio
+
+
+async def rows(docs, columns):
+    async def cursor():
+        for doc in docs:
+            yield doc
+    body = b"".join([chunk async for chunk in csv_chunks(cursor(), columns)]).decode()
+    return list(csv.reader(io.StringIO(body)))
+
+
+async def test_formula_like_cells_are_escaped():
+    docs = [{"notes": value, "amount": -12.5} for value in
+            ("=HYPERLINK(\"http://x\")", "+1", "-1", "@SUM(A1)", "\tcmd", "\rcmd", "Llamar al llegar")]
+    result = await rows(docs, ("notes", "amount"))
+    assert [row[0] for row in result[1:]] == [
+        "'=HYPERLINK(\"http://x\")", "'+1", "'-1", "'@SUM(A1)", "'\tcmd", "'\rcmd", "Llamar al llegar",
+    ]
+    # Numbers are not text and stay as they are
+    assert {row[1] for row in result[1:]} == {"-12.5"}
@@ -0,0 +1,45 @@
+import pytest
+
+from tests.conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+DOG = {"name": "Rex", "size": "grande"}
+
+
+async def test_retry_with_the_same_key_replays_the_response(api, db):
+    user = await add_user(db)
+    headers = {**user["headers"], "Idempotency-Key": "create-rex"}
+    first = await api.post("/api/dogs", json=DOG, headers=headers)
+    retry = await api.post("/api/dogs", json=DOG, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert retry.json() == first.json()
+    assert await db.dogs.count_documents({"owner_id": user["id"]}) == 1
+
+
+async def test_key_reused_for_another_body_is_rejected(api, db):
+    user = await add_user(db)
+    headers = {**user["headers"], "Idempotency-Key": "create-rex"}
+    await api.post("/api/dogs", json=DOG, headers=headers)
+    response = await api.post("/api/dogs", json={**DOG, "name": "Toby"}, headers=headers)
+    assert response.status_code == 422
+    assert await db.dogs.count_documents({"owner_id": user["id"]}) == 1
+
+
+async def test_keys_are_scoped_to_the_client(api, db):
+    first, second = await add_user(db), await add_user(db)
+    for user in (first, second):
+        response = await api.post("/api/dogs", json=DOG, headers={**user["headers"], "Idempotency-Key": "same"})
+        assert "idempotent-replayed" not in response.headers
+    assert await db.dogs.count_documents({}) == 2
+
+
+async def test_unstored_statuses_release_the_key(api, db):
+    headers = {"Idempotency-Key": "k", "Authorization": "Bearer expired"}
+    for _ in range(2):
+        response = await api.post("/api/dogs", json=DOG, headers=headers)
+        assert response.status_code == 401
+        assert "idempotent-replayed" not in response.headers
+    assert await db.idempotency_keys.count_documents({}) == 0
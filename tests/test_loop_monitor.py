@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from loop_monitor import LoopMonitor
+
+pytestmark = pytest.mark.anyio
+
+
+def block_the_loop():
+    time.sleep(0.2)
+
+
+async def run_monitor(monitor, work):
+    monitor.start()
+    await asyncio.sleep(0.05)
+    await work()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+
+async def test_assertion_reports_blocking_calls_with_their_stack():
+    monitor = LoopMonitor(interval=0.01, stall_ms=1000, assert_ms=50)
+
+    async def blocking_handler():
+        block_the_loop()
+
+    await run_monitor(monitor, blocking_handler)
+    with pytest.raises(AssertionError) as failure:
+        monitor.assert_no_blocking()
+    assert "blocked longer than 50 ms 1 time(s)" in str(failure.value)
+    # The stack was taken while the call was still running
+    assert "block_the_loop" in str(failure.value)
+    # Reported once
+    monitor.assert_no_blocking()
+
+
+async def test_assertion_passes_when_the_loop_is_not_blocked():
+    monitor = LoopMonitor(interval=0.01, stall_ms=1000, assert_ms=50)
+
+    async def awaiting_handler():
+        await asyncio.sleep(0.2)
+
+    await run_monitor(monitor, awaiting_handler)
+    monitor.assert_no_blocking()
+    assert len(monitor.samples) > 10
+
+
+async def test_without_assert_ms_stalls_are_only_logged(caplog):
+    monitor = LoopMonitor(interval=0.01, stall_ms=50, assert_ms=0)
+
+    async def blocking_handler():
+        block_the_loop()
+
+    await run_monitor(monitor, blocking_handler)
+    monitor.assert_no_blocking()
+    assert "Event loop blocked for" in caplog.text
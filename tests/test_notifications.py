@@ -0,0 +1,55 @@
+import pytest
+
+from notifications import Adapter, LocalSink, NotificationDispatcher, outbox_events
+from repositories import Repositories
+
+pytestmark = pytest.mark.anyio
+
+
+class Failing(Adapter):
+    channel = "push"
+
+    async def send(self, event, recipient):
+        raise RuntimeError("gateway down")
+
+
+async def setup(db, adapters):
+    await db.users.insert_one({"id": "u1", "name": "Ana", "email": "ana@example.com"})
+    repos = Repositories(db)
+    return repos, NotificationDispatcher(repos, {adapter.channel: adapter for adapter in adapters}, retry_base=0)
+
+
+async def test_local_sink_receives_rendered_notifications(db):
+    sink = LocalSink()
+    repos, dispatcher = await setup(db, [sink])
+    await repos.outbox.add(outbox_events("booking_confirmed", ["u1", None], dispatcher.channels,
+                                         booking_id="b1", date="2025-06-01", time="10:00"))
+    assert await dispatcher.dispatch_once() == 1
+    assert list(sink.delivered) == [{
+        "kind": "booking_confirmed", "recipient_id": "u1", "title": "Reserva confirmada",
+        "body": "Tu paseo del 2025-06-01 a las 10:00 está confirmado.",
+    }]
+    # Delivered once
+    assert await dispatcher.dispatch_once() == 0
+    assert len(sink.delivered) == 1
+
+
+async def test_failures_are_retried_then_dead(db):
+    sink = LocalSink()
+    repos, dispatcher = await setup(db, [sink, Failing()])
+    dispatcher.max_attempts = 2
+    await repos.outbox.add(outbox_events("walk_started", ["u1"], dispatcher.channels, booking_id="b1"))
+    await dispatcher.dispatch_once()
+    await dispatcher.dispatch_once()
+    assert len(sink.delivered) == 1
+    push = await db.outbox.find_one({"channel": "push"})
+    assert push["attempts"] == 2 and push["state"] == "dead"
+
+
+async def test_unknown_recipient_is_dead_at_once(db):
+    sink = LocalSink()
+    repos, dispatcher = await setup(db, [sink])
+    await repos.outbox.add(outbox_events("walk_started", ["ghost"], dispatcher.channels, booking_id="b1"))
+    await dispatcher.dispatch_once()
+    assert not sink.delivered
+    assert (await db.outbox.find_one({}))["state"] == "dead"
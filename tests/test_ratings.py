@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import server
+from repositories import Repositories
+from tools.recompute_ratings import DEFAULT_RATING, recompute
+
+pytestmark = pytest.mark.anyio
+
+RATING_FIELDS = {"_id": 0, "id": 1, "rating": 1, "rating_sum": 1, "reviews_count": 1}
+
+
+async def add_walker(db):
+    walker = server.Walker(user_id="walker-user", bio="Paseos por el Miño", specialties=[])
+    await db.walkers.insert_one(server.to_document(walker))
+    return walker.id
+
+
+async def review(db, repos, walker_id, rating):
+    await db.reviews.insert_one(server.to_document(server.Review(
+        booking_id=f"booking-{rating}", walker_id=walker_id, owner_id="owner", rating=rating)))
+    await repos.walkers.add_rating(walker_id, rating)
+
+
+async def test_the_first_review_replaces_the_default_rating(db):
+    repos = Repositories(db)
+    walker_id = await add_walker(db)
+    assert (await db.walkers.find_one({"id": walker_id}))["rating"] == DEFAULT_RATING
+    await repos.walkers.add_rating(walker_id, 3)
+    walker = await db.walkers.find_one({"id": walker_id}, RATING_FIELDS)
+    assert walker == {"id": walker_id, "rating": 3.0, "rating_sum": 3, "reviews_count": 1}
+    await repos.walkers.add_rating(walker_id, 4)
+    assert (await db.walkers.find_one({"id": walker_id}))["rating"] == 3.5
+
+
+async def test_concurrent_reviews_leave_the_latest_average(db, monkeypatch):
+    repos = Repositories(db)
+    walker_id = await add_walker(db)
+    increment = repos.walkers._find_one_and_update
+
+    async def interleaved(*args, **kwargs):
+        doc = await increment(*args, **kwargs)
+        # Every $inc lands before any average is written, and the stale ones are written last
+        await asyncio.sleep(0.01 * (3 - doc["reviews_count"]))
+        return doc
+
+    monkeypatch.setattr(repos.walkers, "_find_one_and_update", interleaved)
+    await asyncio.gather(*(repos.walkers.add_rating(walker_id, rating) for rating in (5, 4, 2)))
+    walker = await db.walkers.find_one({"id": walker_id}, RATING_FIELDS)
+    assert walker == {"id": walker_id, "rating": 3.67, "rating_sum": 11, "reviews_count": 3}
+
+
+async def test_recompute_matches_the_running_values(db):
+    repos = Repositories(db)
+    reviewed, other, unreviewed = await add_walker(db), await add_walker(db), await add_walker(db)
+    for rating in (5, 4, 4, 1):
+        await review(db, repos, reviewed, rating)
+    await review(db, repos, other, 5)
+    running = await db.walkers.find({}, RATING_FIELDS).sort("id", 1).to_list(None)
+
+    await db.walkers.update_many({}, {"$set": {"rating": 0.0, "rating_sum": 99, "reviews_count": 99}})
+    await db.walkers.update_one({"id": unreviewed}, {"$set": {"rating": DEFAULT_RATING, "rating_sum": 0,
+                                                              "reviews_count": 0}})
+    assert await recompute(db, batch_size=1, dry_run=False) == 2
+    assert await db.walkers.find({}, RATING_FIELDS).sort("id", 1).to_list(None) == running
+
+
+async def test_recompute_resets_walkers_without_reviews(db):
+    repos = Repositories(db)
+    walker_id = await add_walker(db)
+    await repos.walkers.add_rating(walker_id, 2)  # its review has since been deleted
+    assert await recompute(db, batch_size=10, dry_run=False) == 1
+    walker = await db.walkers.find_one({"id": walker_id}, RATING_FIELDS)
+    assert walker == {"id": walker_id, "rating": DEFAULT_RATING, "rating_sum": 0, "reviews_count": 0}
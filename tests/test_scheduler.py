@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import scheduler
+from persistence import booking_start_at
+from repositories import Repositories
+from scheduler import BookingScheduler, TimingWheel
+from shared_state import InMemorySharedState
+
+START = 1_700_000_000.0
+
+
+def test_timers_fire_on_their_tick():
+    wheel = TimingWheel(tick=1, slots=8, levels=2, now=START)
+    wheel.add("a", START + 3, "A")
+    wheel.add("b", START + 3.5, "B")
+    wheel.add("c", START + 5, "C")
+    assert wheel.advance(START + 2) == []
+    assert sorted(wheel.advance(START + 3)) == [("a", "A"), ("b", "B")]
+    assert wheel.advance(START + 10) == [("c", "C")]
+    assert len(wheel) == 0
+
+
+def test_timers_on_upper_levels_cascade_down():
+    wheel = TimingWheel(tick=1, slots=8, levels=2, now=START)
+    wheel.add("soon", START + 9, 1)
+    wheel.add("later", START + 40, 2)
+    # Past the range of both levels (8 * 8 ticks): parked, then placed again
+    wheel.add("far", START + 200, 3)
+    assert wheel.advance(START + 8) == []
+    assert wheel.advance(START + 9) == [("soon", 1)]
+    assert wheel.advance(START + 39) == []
+    assert wheel.advance(START + 40) == [("later", 2)]
+    assert wheel.advance(START + 199) == []
+    assert wheel.advance(START + 200) == [("far", 3)]
+
+
+def test_add_replaces_and_cancel_removes():
+    wheel = TimingWheel(tick=1, slots=8, levels=2, now=START)
+    wheel.add("a", START + 3, "first")
+    wheel.add("a", START + 20, "moved")
+    wheel.add("b", START + 4, "B")
+    wheel.cancel("b")
+    assert len(wheel) == 1
+    assert wheel.advance(START + 19) == []
+    assert wheel.advance(START + 20) == [("a", "moved")]
+
+
+def test_overdue_timers_fire_at_the_next_advance():
+    wheel = TimingWheel(tick=1, slots=8, levels=2, now=START)
+    wheel.add("late", START - 100, "L")
+    assert wheel.advance(START) == [("late", "L")]
+
+
+@pytest.mark.anyio
+async def test_refill_pages_and_ignores_unpaid_bookings_older_than_the_lookback(db, monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_PAGE_SIZE", 3)
+    now = datetime.now(timezone.utc)
+    await db.bookings.insert_many(
+        [{"id": f"old{i}", "status": "pending_payment", "created_at": now - timedelta(days=30)} for i in range(3)]
+        + [{"id": f"new{i}", "status": "pending_payment", "created_at": now - timedelta(minutes=10 + i % 3)}
+           for i in range(10)]
+    )
+    booking_scheduler = BookingScheduler(Repositories(db), InMemorySharedState(), {"payment_expiry": None})
+    await booking_scheduler.refill(now)
+    assert sorted(booking_id for _, booking_id in booking_scheduler.wheel.where) == sorted(f"new{i}" for i in range(10))
+
+
+@pytest.mark.anyio
+async def test_summer_booking_timers_follow_lugo_local_time(db):
+    # 10:00 in Lugo is 08:00 UTC in summer (CEST) and 09:00 UTC in winter (CET)
+    start_at = booking_start_at("2026-07-15", "10:00")
+    assert start_at == datetime(2026, 7, 15, 8, 0, tzinfo=timezone.utc)
+    assert booking_start_at("2026-01-15", "10:00") == datetime(2026, 1, 15, 9, 0, tzinfo=timezone.utc)
+
+    await db.bookings.insert_one({"id": "summer", "status": "confirmed", "date": "2026-07-15", "time": "10:00",
+                                  "start_at": start_at})
+    now = datetime(2026, 7, 15, 7, 0, tzinfo=timezone.utc)
+    booking_scheduler = BookingScheduler(Repositories(db), InMemorySharedState(),
+                                         {"reminder": None, "no_show": None})
+    booking_scheduler.wheel = TimingWheel(now=now.timestamp())
+    await booking_scheduler.refill(now)
+
+    def due(key):
+        level, slot = booking_scheduler.wheel.where[key]
+        return booking_scheduler.wheel.wheels[level][slot][key][0]
+
+    assert due(("reminder", "summer")) == (start_at - timedelta(seconds=scheduler.REMINDER_BEFORE)).timestamp()
+    assert due(("no_show", "summer")) == (start_at + timedelta(seconds=scheduler.NO_SHOW_AFTER)).timestamp()
@@ -0,0 +1,26 @@
+import pytest
+
+from search import analyze, stem
+
+PAIRS = [
+    ("perro", "perros"), ("perra", "perras"), ("animal", "animales"), ("animal", "animais"), ("can", "cans"),
+    ("paseador", "paseadores"), ("acción", "acciones"), ("acción", "accións"), ("papel", "papeis"),
+    ("luz", "luces"), ("vez", "veces"), ("lápiz", "lápices"), ("dulce", "dulces"),
+    ("mes", "meses"), ("clase", "clases"), ("base", "bases"),
+    ("inglés", "ingleses"), ("interés", "intereses"), ("francés", "franceses"), ("japonés", "japoneses"),
+]
+
+
+@pytest.mark.parametrize("singular, plural", PAIRS)
+def test_singular_and_plural_share_a_stem(singular, plural):
+    assert stem(singular) == stem(plural)
+
+
+@pytest.mark.parametrize("word", ["inglés", "lápices", "accións", "Días"])
+def test_stem_folds_accents_first(word):
+    assert stem(word.lower()) == analyze(word)[0]
+
+
+def test_different_words_keep_different_stems():
+    words = ("mes", "mesa", "paseo", "pase", "luz", "lugo")
+    assert len({stem(word) for word in words}) == len(words)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import shared_state
+from shared_state import InMemorySharedState, MongoSharedState
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["memory", "mongo"])
+async def state(request, db):
+    if request.param == "memory":
+        return InMemorySharedState()
+    state = MongoSharedState(db, poll_interval=0.01)
+    await state.setup()
+    return state
+
+
+async def test_bucket_allows_the_burst_then_limits(state):
+    results = [await state.take_token("login:a", rate=1, burst=3) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert 0 < results[-1][1] <= 1
+    # Buckets are independent
+    assert (await state.take_token("login:b", rate=1, burst=3))[0]
+
+
+async def test_bucket_refills_at_the_rate(state):
+    for _ in range(2):
+        await state.take_token("poll", rate=20, burst=2)
+    assert not (await state.take_token("poll", rate=20, burst=2))[0]
+    await asyncio.sleep(0.06)
+    assert (await state.take_token("poll", rate=20, burst=2))[0]
+
+
+async def test_mongo_buckets_expire_once_idle(db):
+    state = MongoSharedState(db)
+    await state.take_token("login:a", rate=1, burst=3)
+    doc = await db.shared_state.find_one({"_id": "bucket:login:a"})
+    # Idle for twice the time to refill; the TTL index removes it after that
+    assert (doc["expires_at"] - doc["updated"]).total_seconds() == pytest.approx(6)
+
+
+async def test_memory_buckets_are_evicted(monkeypatch):
+    monkeypatch.setattr(shared_state, "MAX_BUCKETS", 10)
+    state = InMemorySharedState()
+    for i in range(50):
+        await state.take_token(f"k{i}", rate=1, burst=5)
+    assert len(state._buckets) == 10
+    assert "k49" in state._buckets and "k0" not in state._buckets
+
+
+async def test_lease_is_exclusive_until_released(state):
+    assert await state.acquire_lease("scheduler", "a", ttl=30)
+    assert not await state.acquire_lease("scheduler", "b", ttl=30)
+    # The holder renews
+    assert await state.acquire_lease("scheduler", "a", ttl=30)
+    await state.release_lease("scheduler", "b")  # not the holder: no effect
+    assert not await state.acquire_lease("scheduler", "b", ttl=30)
+    await state.release_lease("scheduler", "a")
+    assert await state.acquire_lease("scheduler", "b", ttl=30)
+
+
+async def test_lease_expires(state):
+    assert await state.acquire_lease("scheduler", "a", ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await state.acquire_lease("scheduler", "b", ttl=30)
+
+
+async def test_values_and_counters(state):
+    await state.set("k", {"v": 1})
+    assert await state.get("k") == {"v": 1}
+    await state.delete("k")
+    assert await state.get("k") is None
+    assert await state.incr("n") == 1
+    assert await state.incr("n", 2) == 3
+    await state.set("short", 1, ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await state.get("short") is None
+
+
+async def test_sets_keep_members_once(state):
+    for member in ("a", "b", "a"):
+        await state.add_member("writers", member, ttl=30)
+    assert sorted(await state.get("writers")) == ["a", "b"]
+    await state.add_member("short", "a", ttl=0.05)
+    await asyncio.sleep(0.1)
+    await state.add_member("short", "b", ttl=30)
+    assert await state.get("short") == ["b"]
+
+
+async def test_mongo_pubsub_reaches_other_workers(db):
+    publisher, subscriber = MongoSharedState(db, poll_interval=0.01), MongoSharedState(db, poll_interval=0.01)
+    received = []
+
+    async def listen():
+        async for message in subscriber.subscribe("walks"):
+            received.append(message)
+            if len(received) == 2:
+                return
+
+    listener = asyncio.create_task(listen())
+    await asyncio.sleep(0.03)
+    await publisher.publish("walks", {"n": 1})
+    await publisher.publish("other", {"n": 0})
+    await publisher.publish("walks", {"n": 2})
+    await asyncio.wait_for(listener, 1)
+    assert received == [{"n": 1}, {"n": 2}]
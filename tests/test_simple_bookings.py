@@ -0,0 +1,62 @@
+import pytest
+
+import server
+from tests.conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+
+async def add_requests(db, *slots):
+    docs = [server.to_document(server.SimpleBooking(service_type="estandar", date=date, time=time,
+                                                    contact={"name": "Ana"}))
+            for date, time in slots]
+    await db.simple_bookings.insert_many(docs)
+    return docs
+
+
+async def walk_queue(api, headers, **params):
+    pages, cursor = [], None
+    while True:
+        response = await api.get("/api/admin/simple-bookings", headers=headers,
+                                 params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        body = response.json()
+        pages.append([item["id"] for item in body["items"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+async def test_pages_split_ties_on_the_slot_by_id(api, db):
+    admin = await add_user(db, "admin")
+    # Five requests for the same slot, so paging only moves on through the id
+    tied = await add_requests(db, *[("2026-08-01", "10:00")] * 5)
+    earlier = await add_requests(db, ("2026-07-31", "18:00"))
+    later = await add_requests(db, ("2026-08-01", "10:30"))
+
+    pages = await walk_queue(api, admin["headers"], limit=2)
+    expected = [doc["id"] for doc in earlier] + sorted(doc["id"] for doc in tied) + [doc["id"] for doc in later]
+    assert [booking_id for page in pages for booking_id in page] == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+
+async def test_a_full_last_page_has_no_next_cursor(api, db):
+    admin = await add_user(db, "admin")
+    docs = await add_requests(db, *[("2026-08-02", f"{hour}:00") for hour in range(10, 14)])
+    pages = await walk_queue(api, admin["headers"], limit=2)
+    assert pages == [[doc["id"] for doc in docs[:2]], [doc["id"] for doc in docs[2:]]]
+
+    response = await api.get("/api/admin/simple-bookings", headers=admin["headers"], params={"limit": 10})
+    assert response.json()["next_cursor"] is None
+    assert len(response.json()["items"]) == 4
+
+
+async def test_the_recent_list_is_admin_only(api, db):
+    owner = await add_user(db)
+    admin = await add_user(db, "admin")
+    await add_requests(db, ("2026-08-03", "09:00"))
+    assert (await api.get("/api/simple-bookings")).status_code == 401
+    assert (await api.get("/api/simple-bookings", headers=owner["headers"])).status_code == 403
+    response = await api.get("/api/simple-bookings", headers=admin["headers"])
+    assert response.status_code == 200
+    assert len(response.json()) == 1
@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from repositories import Repositories
+from shared_state import InMemorySharedState
+from walk_state import ActiveWalkStore
+
+pytestmark = pytest.mark.anyio
+
+BOOKING = "booking-1"
+
+
+def fix(timestamp):
+    return {"lat": 43.01, "lng": -7.55, "timestamp": float(timestamp)}
+
+
+async def workers(db, count=2):
+    """Stores of `count` workers sharing one database and one SharedState"""
+    state = InMemorySharedState()
+    await db.walks.insert_one({"booking_id": BOOKING, "status": "in_progress", "route_data": []})
+    stores = [ActiveWalkStore(Repositories(db), state, flush_interval=60) for _ in range(count)]
+    for store in stores:
+        store.start()
+    await asyncio.sleep(0)  # let the listeners subscribe
+    return stores
+
+
+async def stored_route(db):
+    return [point["timestamp"] for point in (await db.walks.find_one({"booking_id": BOOKING}))["route_data"]]
+
+
+async def test_flushes_from_several_workers_are_stored_in_fix_order(db):
+    first, second = await workers(db)
+    try:
+        for timestamp in (1, 3, 5):
+            await first.add_point(BOOKING, fix(timestamp))
+        for timestamp in (2, 4):
+            await second.add_point(BOOKING, fix(timestamp))
+        await second.flush()
+        await first.flush()
+        assert await stored_route(db) == [1, 2, 3, 4, 5]
+        # The flush brings in what the other worker stored
+        assert [point["timestamp"] for point in first.get(BOOKING)["route_data"]] == [1, 2, 3, 4, 5]
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def test_out_of_order_fixes_are_served_in_order(db):
+    (store,) = await workers(db, 1)
+    try:
+        for timestamp in (1, 3, 2):
+            await store.add_point(BOOKING, fix(timestamp))
+        assert [point["timestamp"] for point in store.get(BOOKING)["route_data"]] == [1, 2, 3]
+    finally:
+        await store.close()
+
+
+async def test_finish_flushes_and_drops_the_walk_on_every_worker(db):
+    first, second = await workers(db)
+    try:
+        await first.add_point(BOOKING, fix(1))
+        await second.add_point(BOOKING, fix(2))
+        await db.walks.update_one({"booking_id": BOOKING}, {"$set": {"status": "completed"}})
+        await first.finish(BOOKING)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert await stored_route(db) == [1, 2]
+        assert first.get(BOOKING) is None and second.get(BOOKING) is None
+        # Later fixes for the completed walk are not buffered again
+        assert await second.add_point(BOOKING, fix(3)) is None
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def test_other_workers_reload_changes_made_elsewhere(db):
+    first, second = await workers(db)
+    try:
+        await first.add_point(BOOKING, fix(1))
+        await second.add_point(BOOKING, fix(2))
+        await db.walks.update_one({"booking_id": BOOKING}, {"$set": {"report_text": "Todo bien"}})
+        await first.apply(BOOKING, {"report_text": "Todo bien"})
+        for _ in range(10):
+            await asyncio.sleep(0)
+        walk = second.get(BOOKING)
+        assert walk["report_text"] == "Todo bien"
+        # Its own unflushed fix is kept
+        assert [point["timestamp"] for point in walk["route_data"]] == [2]
+    finally:
+        await first.close()
+        await second.close()
+
+
+def crash(store):
+    """Stop a worker the way a kill does: no flush, no goodbye"""
+    store._task.cancel()
+    store._listener.cancel()
+
+
+async def test_fixes_buffered_by_a_dead_worker_are_replayed_from_its_log(db):
+    first, second = await workers(db)
+    first.worker_ttl = 0.05
+    await first._heartbeat()
+    try:
+        await first.add_point(BOOKING, fix(1))
+        await first.flush()
+        await first.add_point(BOOKING, fix(2))
+        await first.add_point(BOOKING, fix(3))
+        await second.add_point(BOOKING, fix(4))
+        crash(first)
+        # Still within the heartbeat: the log may belong to a worker that is only slow
+        await second.flush()
+        assert await stored_route(db) == [1, 4]
+        await asyncio.sleep(0.1)
+        await second.flush()
+        assert await stored_route(db) == [1, 2, 3, 4]
+        assert [point["timestamp"] for point in second.get(BOOKING)["route_data"]] == [1, 2, 3, 4]
+        # Replayed once
+        await second.flush()
+        assert await stored_route(db) == [1, 2, 3, 4]
+    finally:
+        await second.close()
+
+
+async def test_a_dead_workers_log_skips_fixes_it_had_already_stored(db):
+    first, second = await workers(db)
+    first.worker_ttl = 0.05
+    await first._heartbeat()
+    try:
+        await first.add_point(BOOKING, fix(1))
+        await first.add_point(BOOKING, fix(2))
+        # Died after its push went through but before the log was cleared
+        await db.walks.update_one({"booking_id": BOOKING}, {"$push": {"route_data": fix(1)}})
+        crash(first)
+        await asyncio.sleep(0.1)
+        await db.walks.update_one({"booking_id": BOOKING}, {"$set": {"status": "completed"}})
+        await second.finish(BOOKING)
+        assert await stored_route(db) == [1, 2]
+    finally:
+        await second.close()
+
+
+async def test_no_flush_interval_writes_through(db):
+    state = InMemorySharedState()
+    await db.walks.insert_one({"booking_id": BOOKING, "status": "in_progress", "route_data": []})
+    store = ActiveWalkStore(Repositories(db), state, flush_interval=0)
+    assert await store.add_point(BOOKING, fix(1)) is None
+    assert store.get(BOOKING) is None
@@ -0,0 +1,67 @@
+import pytest
+
+import server
+from tests.conftest import add_user
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def booking(db):
+    owner, walker = await add_user(db), await add_user(db, "walker")
+    booking = server.Booking(owner_id=owner["id"], walker_id="walker-profile", walker_user_id=walker["id"],
+                             dog_id="dog", service_type="estandar", date="2025-06-01", time="10:00",
+                             duration=45, amount=22.0, status="confirmed")
+    await db.bookings.insert_one(server.to_document(booking))
+    return {"id": booking.id, "headers": walker["headers"]}
+
+
+def update(op_id, timestamp):
+    return {"op_id": op_id, "type": "update", "route_point": {"lat": 43.0, "lng": -7.5, "timestamp": float(timestamp)}}
+
+
+async def sync(api, booking, operations):
+    response = await api.post(f"/api/walks/{booking['id']}/sync", json={"operations": operations},
+                              headers=booking["headers"])
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_resent_operations_are_applied_once(api, db, booking):
+    operations = [{"op_id": "start", "type": "start", "at": 1748772000}, update("p1", 1), update("p2", 2)]
+    first = await sync(api, booking, operations)
+    assert first["applied"] == ["start", "p1", "p2"] and first["skipped"] == []
+    assert first["walk"]["status"] == "in_progress"
+
+    # The app lost the response and sends the queue again, with one more fix
+    again = await sync(api, booking, operations + [update("p3", 3)])
+    assert again["applied"] == ["p3"]
+    assert again["skipped"] == ["start", "p1", "p2"]
+    assert [point["timestamp"] for point in again["walk"]["route_data"]] == [1, 2, 3]
+    assert (await db.bookings.find_one({"id": booking["id"]}))["status"] == "in_progress"
+
+
+async def test_repeated_ids_in_one_batch_count_once(api, booking):
+    result = await sync(api, booking, [update("p1", 1), update("p1", 1), update("p2", 2)])
+    assert result["applied"] == ["p1", "p2"]
+    assert len(result["walk"]["route_data"]) == 2
+
+
+async def test_late_start_does_not_reopen_a_completed_walk(api, db, booking):
+    await sync(api, booking, [{"op_id": "start", "type": "start"}, {"op_id": "done", "type": "complete"}])
+    result = await sync(api, booking, [{"op_id": "start-retry", "type": "start"}])
+    assert result["applied"] == ["start-retry"]
+    assert result["walk"]["status"] == "completed"
+    assert (await db.bookings.find_one({"id": booking["id"]}))["status"] == "completed"
+
+
+async def test_failed_apply_leaves_the_operations_to_retry(api, db, booking, monkeypatch):
+    async def failing_apply(booking_id, update):
+        raise RuntimeError("write failed")
+
+    monkeypatch.setattr(server.repos.walks, "apply", failing_apply)
+    with pytest.raises(RuntimeError):
+        await sync(api, booking, [update("p1", 1)])
+    monkeypatch.undo()
+    assert await db.walk_sync_ops.count_documents({}) == 0
+    assert (await sync(api, booking, [update("p1", 1)]))["applied"] == ["p1"]
@@ -0,0 +1,86 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import server
+from repositories import STAT_FIELDS, booking_stats, period_keys
+from tools import rebuild_walker_stats
+
+pytestmark = pytest.mark.anyio
+
+START_AT = datetime(2026, 7, 14, 22, 30, tzinfo=timezone.utc)  # 00:30 on the 15th in Lugo
+
+
+async def add_booking(db, status, amount=20.0, **fields):
+    booking = server.Booking(owner_id="owner", walker_id="walker", walker_user_id="walker-user", dog_id="dog",
+                             service_type="estandar", date="2026-07-15", time="00:30", duration=45,
+                             amount=amount, status=status, start_at=START_AT)
+    await db.bookings.insert_one(server.to_document(booking) | fields)
+    # What create_booking records, plus whatever the starting status counts for
+    await server.repos.walker_stats.record("walker", START_AT, **booking_stats({"status": status, **fields}))
+    return booking.id
+
+
+async def stats(db):
+    return await db.walker_stats.find_one({"walker_id": "walker"}, {"_id": 0})
+
+
+def filled(bucket):
+    # $inc leaves counters that never moved out of the document
+    return {field: bucket.get(field, 0) for field in STAT_FIELDS}
+
+
+def test_cancellations_count_only_after_the_walker_committed():
+    assert booking_stats({"status": "cancelled", "cancelled_from": "confirmed"})["cancelled"] == 1
+    assert booking_stats({"status": "cancelled", "cancelled_from": "in_progress"})["cancelled"] == 1
+    assert booking_stats({"status": "cancelled", "cancelled_from": "pending_payment"})["cancelled"] == 0
+    # Cancelled before cancelled_from was recorded
+    assert booking_stats({"status": "cancelled"})["cancelled"] == 1
+    assert booking_stats({"status": "cancelled", "cancel_reason": "payment_expired"})["cancelled"] == 0
+    assert booking_stats({"status": "completed", "amount": 22})["earnings"] == 22.0
+
+
+def test_buckets_use_the_local_day():
+    assert period_keys(START_AT) == {"days": "2026-07-15", "weeks": "2026-W29", "months": "2026-07"}
+
+
+async def test_unpaid_bookings_dropping_out_are_not_cancellations(api, db):
+    expired = await add_booking(db, "pending_payment")
+    withdrawn = await add_booking(db, "pending_payment")
+    assert await server.set_booking_status(expired, "cancelled", expected="pending_payment",
+                                           cancel_reason="payment_expired")
+    assert await server.set_booking_status(withdrawn, "cancelled")
+    doc = await stats(db)
+    assert doc["total"] == {"booked": 2}
+    assert doc["days"]["2026-07-15"] == {"booked": 2}
+
+
+async def test_transitions_add_and_remove_their_counts(api, db):
+    completed = await add_booking(db, "confirmed", amount=22.0)
+    cancelled = await add_booking(db, "confirmed")
+    assert await server.set_booking_status(completed, "in_progress")
+    assert await server.set_booking_status(completed, "completed")
+    assert await server.set_booking_status(cancelled, "cancelled")
+    assert (await stats(db))["total"] == {"booked": 2, "completed": 1, "cancelled": 1, "earnings": 22.0}
+    # A late payment confirmation undoes the counted cancellation
+    assert await server.set_booking_status(cancelled, "confirmed")
+    assert (await stats(db))["total"] == {"booked": 2, "completed": 1, "cancelled": 0, "earnings": 22.0}
+
+
+async def test_rebuild_matches_the_incremental_counters(api, db):
+    for status in ("pending_payment", "confirmed", "confirmed", "confirmed"):
+        await add_booking(db, status, amount=15.0)
+    await add_booking(db, "cancelled", cancel_reason="payment_expired")
+    ids = [booking["id"] async for booking in db.bookings.find({}, {"id": 1}).sort("_id", 1)]
+    await server.set_booking_status(ids[0], "cancelled", expected="pending_payment", cancel_reason="payment_expired")
+    await server.set_booking_status(ids[1], "cancelled")
+    await server.set_booking_status(ids[2], "completed")
+    incremental = await stats(db)
+
+    await db.walker_stats.delete_many({})
+    assert await rebuild_walker_stats.rebuild(db, dry_run=False) == 1
+    rebuilt = await stats(db)
+    assert rebuilt["total"] == {"booked": 5, "completed": 1, "cancelled": 1, "earnings": 15.0}
+    for kind in ("days", "weeks", "months"):
+        assert {key: filled(bucket) for key, bucket in incremental[kind].items()} == rebuilt[kind]
+    assert filled(incremental["total"]) == rebuilt["total"]